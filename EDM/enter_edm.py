@@ -3,10 +3,17 @@ sys.path.append('/home/pi/gits/sixfab-power-python-api/')
 
 from power_api import SixfabPower, Definition, Event
 
+# systemd stops the unit after TimeoutStopSec=10, keep the sequence well inside it
+DEADLINE = 8.0
+
 print("Powering down")
-while True:
-	try:
-		api = SixfabPower()
-		print("success" if api.set_edm_status(1, 500) == 1 else "failed")
-	except:
-		print("exception")
+api = SixfabPower()
+api.enable_bus_lock()
+report = api.shutdown_sequence(deadline=DEADLINE)
+
+for step in report["steps"]:
+	state = "skipped" if step["skipped"] else ("success" if step["ok"] else "failed")
+	print("%s: %s (%d attempts, %.2f s)" % (step["step"], state, step["attempts"], step["elapsed"]))
+print("done in %.2f s" % report["elapsed"])
+
+sys.exit(0 if report["ok"] else 1)
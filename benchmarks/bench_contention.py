@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+"""
+Contention benchmark for the cross-process bus lock.
+
+    python3 benchmarks/bench_contention.py [--processes 4] [--duration 5]
+
+Several processes poll different registers of one emulated HAT, which is
+served by a multiprocessing manager so every bus call is a separate IPC
+round trip, like byte-wise reads on the real bus. Each run is done without
+and with SixfabPower.enable_bus_lock() and reports correct, wrong (answer of
+another process' request) and failed reads, retries and throughput. A
+single unlocked process is run as the reference.
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import multiprocessing
+from multiprocessing.managers import BaseManager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from power_api.power_api import SixfabPower
+from power_api.emulator import EmulatedBus
+
+# getter of each process, all registers hold different values
+GETTERS = (
+    "get_battery_level",
+    "get_input_voltage",
+    "get_battery_voltage",
+    "get_input_temp",
+    "get_system_voltage",
+    "get_battery_temp",
+    "get_input_current",
+    "get_system_current",
+)
+
+_bus = None
+
+
+def _shared_bus():
+    global _bus
+    if _bus is None:
+        _bus = EmulatedBus(realtime=True, latency=0.002)
+    return _bus
+
+
+class BusManager(BaseManager):
+    pass
+
+
+BusManager.register("bus", callable=_shared_bus)
+
+
+def expected_values():
+    api = SixfabPower(bus=EmulatedBus())
+    return {name: getattr(api, name)(timeout=0) for name in GETTERS}
+
+
+def worker(address, getter_name, expected, duration, lock_path, results):
+    manager = BusManager(address=address, authkey=b"sixfab")
+    manager.connect()
+    api = SixfabPower(bus=manager.bus())
+    api.enable_stats()
+    if lock_path:
+        api.enable_bus_lock(lock_path)
+
+    getter = getattr(api, getter_name)
+    correct = wrong = failed = 0
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        value = getter()
+        if value is None:
+            failed += 1
+        elif value == expected:
+            correct += 1
+        else:
+            wrong += 1
+
+    totals = api.stats()["totals"]
+    results.put(
+        {
+            "correct": correct,
+            "wrong": wrong,
+            "failed": failed,
+            "retries": totals["retries"],
+            "crc_failures": totals["crc_failures"],
+        }
+    )
+
+
+def run(processes, duration, locked):
+    manager = BusManager(address=("127.0.0.1", 0), authkey=b"sixfab")
+    manager.start()
+    expected = expected_values()
+    results = multiprocessing.Queue()
+    lock_path = None
+    if locked:
+        lock_path = os.path.join(tempfile.mkdtemp(), "bench-i2c.lock")
+
+    workers = []
+    for i in range(processes):
+        name = GETTERS[i % len(GETTERS)]
+        p = multiprocessing.Process(
+            target=worker,
+            args=(manager.address, name, expected[name], duration, lock_path, results),
+        )
+        p.start()
+        workers.append(p)
+
+    reports = [results.get() for _ in workers]
+    for p in workers:
+        p.join()
+    manager.shutdown()
+
+    summary = {key: sum(r[key] for r in reports) for key in reports[0]}
+    summary["correct_per_second"] = summary["correct"] / duration
+    summary["per_process_correct"] = [r["correct"] for r in reports]
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per run (default is 5)")
+    args = parser.parse_args()
+
+    report = {
+        "processes": args.processes,
+        "single": run(1, args.duration, False),
+        "unlocked": run(args.processes, args.duration, False),
+        "flock": run(args.processes, args.duration, True),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
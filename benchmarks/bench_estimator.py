@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+"""
+Replay benchmark for BatteryRuntimeEstimator.
+
+    python3 benchmarks/bench_estimator.py [trace.csv ...] [--capacity 3000]
+
+Replays recorded traces (see record_trace.py) or, without arguments, a
+synthetic discharge trace. Reports per-sample update cost and the error of
+the runtime-to-empty estimate against the time the trace actually ran out.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from power_api.estimator import BatteryRuntimeEstimator
+from traces import load_trace, synthetic_discharge
+
+
+def replay(samples, capacity):
+    estimator = BatteryRuntimeEstimator(capacity)
+    update = estimator.update
+    end = samples[-1]["timestamp"]
+
+    start = time.perf_counter()
+    for s in samples:
+        update(s["battery_current"], s["battery_level"], s["timestamp"])
+    elapsed = time.perf_counter() - start
+
+    # accuracy pass, estimates are compared with the real time left
+    estimator.reset()
+    errors = []
+    inside = 0
+    for s in samples:
+        update(s["battery_current"], s["battery_level"], s["timestamp"])
+        runtime = estimator.runtime_to_empty()
+        if runtime is None or estimator.samples < 60:
+            continue
+        actual = (end - s["timestamp"]) / 60.0
+        errors.append(abs(runtime[0] - actual))
+        if runtime[1] <= actual <= runtime[2]:
+            inside += 1
+
+    errors.sort()
+    return {
+        "samples": len(samples),
+        "update_ns": elapsed / len(samples) * 1e9,
+        "mean_abs_error_min": sum(errors) / len(errors) if errors else None,
+        "p95_abs_error_min": errors[int(len(errors) * 0.95)] if errors else None,
+        "band_coverage": inside / len(errors) if errors else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("traces", nargs="*")
+    parser.add_argument("--capacity", type=float, default=3000)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    if args.traces:
+        runs = {path: load_trace(path) for path in args.traces}
+    else:
+        runs = {"synthetic": synthetic_discharge(capacity=args.capacity)}
+
+    results = {name: replay(samples, args.capacity) for name, samples in runs.items()}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, r in results.items():
+            print(name)
+            for key, value in r.items():
+                print("  {:<20} {}".format(key, value))
+
+
+if __name__ == "__main__":
+    main()
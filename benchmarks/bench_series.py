@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+"""
+Compression benchmark for power_api.series.
+
+    python3 benchmarks/bench_series.py [trace.csv ...] [--block-size 4096]
+
+Encodes recorded traces (see record_trace.py, e.g. --period 0.1 --fields all)
+or, without arguments, a synthetic 10 Hz discharge trace. Reports the file
+size per sample against 8 byte floats, encode and decode throughput, and the
+cost of decoding one block for a time range lookup.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from power_api.series import SeriesWriter, SeriesReader
+from traces import load_trace, synthetic_discharge
+
+
+def replay(samples, block_size):
+    fields = [name for name in samples[0] if name != "timestamp"]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "trace.series")
+
+        start = time.perf_counter()
+        with SeriesWriter(path, fields, block_size) as writer:
+            write = writer.write
+            for s in samples:
+                write(s)
+        encode = time.perf_counter() - start
+        size = os.path.getsize(path)
+
+        with SeriesReader(path) as reader:
+            start = time.perf_counter()
+            decoded = reader.read()
+            decode = time.perf_counter() - start
+
+            middle = reader.index[len(reader.index) // 2]
+            start = time.perf_counter()
+            reader.read(start=middle[1], end=middle[2])
+            lookup = time.perf_counter() - start
+
+    for name in ["timestamp"] + fields:
+        expected = [s[name] for s in samples]
+        if name == "timestamp":
+            expected = [round(value, 3) for value in expected]
+        if decoded[name] != expected:
+            raise AssertionError(name + " does not round trip")
+
+    return {
+        "samples": len(samples),
+        "fields": len(fields),
+        "bytes_per_sample": size / len(samples),
+        "compression_ratio": len(samples) * 8 * (len(fields) + 1) / size,
+        "encode_samples_per_s": len(samples) / encode,
+        "decode_samples_per_s": len(samples) / decode,
+        "block_lookup_ms": lookup * 1e3,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("traces", nargs="*")
+    parser.add_argument("--block-size", type=int, default=4096)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    if args.traces:
+        runs = {path: load_trace(path) for path in args.traces}
+    else:
+        runs = {"synthetic": synthetic_discharge(period=0.1, jitter=0.002)}
+
+    results = {name: replay(samples, args.block_size) for name, samples in runs.items()}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, r in results.items():
+            print(name)
+            for key, value in r.items():
+                print("  {:<22} {}".format(key, value))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+"""
+Record a battery telemetry trace from a real UPS HAT.
+
+    python3 benchmarks/record_trace.py discharge.csv --period 1
+    python3 benchmarks/record_trace.py telemetry.csv --period 0.1 --fields all
+
+Run it on battery power and stop it with Ctrl+C when the HAT shuts down or
+enough data has been collected; every sample is flushed immediately.
+"""
+
+import os
+import sys
+import csv
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from power_api import SixfabPower
+from power_api.power_api import SNAPSHOT_FIELDS
+
+FIELDS = ["battery_current", "battery_level", "battery_voltage"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output")
+    parser.add_argument("--period", type=float, default=1.0)
+    parser.add_argument(
+        "--fields",
+        default=",".join(FIELDS),
+        help="comma separated getter names, or all for the snapshot fields (default is the battery values)",
+    )
+    args = parser.parse_args()
+    fields = list(SNAPSHOT_FIELDS) if args.fields == "all" else args.fields.split(",")
+
+    api = SixfabPower()
+    start = time.monotonic()
+
+    with open(args.output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["timestamp"] + fields)
+        writer.writeheader()
+        try:
+            while True:
+                sample = api.get_snapshot(fields)
+                sample["timestamp"] = round(time.monotonic() - start, 3)
+                writer.writerow(sample)
+                f.flush()
+                time.sleep(args.period)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
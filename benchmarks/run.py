@@ -0,0 +1,587 @@
+#!/usr/bin/python3
+"""
+Benchmark suite for the command pipeline and the high-level API.
+
+    python3 benchmarks/run.py                       # run all, compare with baseline.json
+    python3 benchmarks/run.py -k getter             # only benchmarks whose name contains "getter"
+    python3 benchmarks/run.py --save-baseline       # store the results as the new baseline
+    python3 benchmarks/run.py --output results.json --fail-on-regression
+
+Everything runs against power_api.emulator.EmulatedBus, no HAT is needed.
+Results are written as JSON; every entry is a number where lower is better
+unless its unit ends in "/s".
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import threading
+import tracemalloc
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from power_api.power_api import SixfabPower
+from power_api.command import Command, crc16_xmodem
+from power_api.emulator import EmulatedBus, BYTE_TIME_100KHZ
+from power_api.scheduler import PRIORITY_TELEMETRY
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# MCU model used for the "realistic" runs
+REALISTIC = dict(realtime=True, latency=0.002, byte_time=BYTE_TIME_100KHZ)
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+def measure(func, min_time=0.1, repeat=5):
+    """Function for getting the best mean duration of func() in seconds."""
+    best = None
+    for _ in range(repeat):
+        count = 0
+        start = time.perf_counter()
+        end = start + min_time
+        while True:
+            func()
+            count += 1
+            now = time.perf_counter()
+            if now >= end:
+                break
+        mean = (now - start) / count
+        if best is None or mean < best:
+            best = mean
+    return best
+
+
+def getter_names():
+    names = []
+    for name in dir(SixfabPower):
+        if name.startswith("get_") and name not in ("get_system_temp", "get_snapshot"):
+            names.append(name)
+    return names
+
+
+#############################################################
+### Frame Building and Parsing ##############################
+#############################################################
+
+
+@benchmark
+def frame_build(results, quick):
+    cmd = Command(EmulatedBus())
+    cases = {
+        "request": lambda: cmd.create_command(Command.PROTOCOL_COMMAND_GET_BATTERY_LEVEL),
+        "set_uint8": lambda: cmd.create_set_command(Command.PROTOCOL_COMMAND_SET_FAN_MODE, 3, 1),
+        "set_int32": lambda: cmd.create_set_command(Command.PROTOCOL_COMMAND_SET_RTC_TIME, 1600000000, 4),
+        "set_event": lambda: cmd.create_set_command(
+            Command.PROTOCOL_COMMAND_CREATE_SCHEDULED_EVENT, bytearray(range(1, 11)), 10
+        ),
+        "firmware_packet": lambda: cmd.create_firmware_update_command(100, 1, bytes(20)),
+    }
+    for name, func in cases.items():
+        results["frame_build." + name] = (measure(func) * 1e6, "us")
+
+    frame = list(range(5))
+    results["crc.header"] = (measure(lambda: cmd.calculate_crc16(frame)) * 1e6, "us")
+    results["crc.table_24_bytes"] = (measure(lambda: crc16_xmodem(bytes(24))) * 1e6, "us")
+
+
+@benchmark
+def frame_parse(results, quick):
+    emulator = EmulatedBus()
+    cmd = Command(emulator)
+    cmd.create_command(Command.PROTOCOL_COMMAND_GET_BATTERY_VOLTAGE)
+    cmd.send_command()
+    frame = list(emulator._response)
+
+    def parse():
+        cmd.buffer_receive.clear()
+        cmd.buffer_receive_index = 0
+        for byte in frame:
+            cmd.check_command(byte)
+
+    seconds = measure(parse)
+    results["parse.int32_frame"] = (seconds * 1e6, "us")
+    results["parse.throughput"] = (1.0 / seconds, "frames/s")
+
+
+@benchmark
+def bulk_decode(results, quick):
+    try:
+        import numpy
+    except ImportError:
+        return
+    from power_api import bulk
+
+    emulator = EmulatedBus()
+    cmd = Command(emulator)
+    cmd.create_command(Command.PROTOCOL_COMMAND_GET_BATTERY_VOLTAGE)
+    cmd.send_command()
+    count = 100000 if quick else 1000000
+    buffer = bytes(emulator._response) * count
+
+    seconds = measure(lambda: bulk.decode_frames(buffer), repeat=3)
+    results["parse.bulk_throughput"] = (count / seconds, "frames/s")
+
+
+@benchmark
+def shm_read(results, quick):
+    import tempfile
+    from power_api.shm import TelemetryPublisher, TelemetryReader
+
+    api = SixfabPower(bus=EmulatedBus())
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        path = os.path.join(tmp, "telemetry")
+        publisher = TelemetryPublisher(api, path)
+        publisher.poll()
+        reader = TelemetryReader(path)
+        results["shm.read"] = (measure(reader.read) * 1e6, "us")
+        reader.close()
+        publisher.close()
+
+
+@benchmark
+def mqtt_sample(results, quick):
+    from power_api.mqtt import MqttPublisher, MemoryTransport
+
+    snapshot = SixfabPower(bus=EmulatedBus()).get_snapshot()
+    transport = MemoryTransport()
+    publisher = MqttPublisher(lambda: snapshot, transport)
+    state = {"i": 0}
+
+    def changing():
+        # every sample is kept and every 50th one is encoded and published
+        state["i"] += 1
+        snapshot["input_voltage"] = 5.0 + (state["i"] % 2)
+        publisher.poll()
+        del transport.messages[:]
+
+    results["mqtt.sample"] = (measure(changing) * 1e6, "us")
+
+
+# Bus time of one button read in the button simulation: RESPONSE_DELAY
+# plus the frame transfer at 100 kHz
+BUTTON_READ_TIME = 0.011
+
+
+def _button_presses(count, seed=7):
+    import random
+
+    rng = random.Random(seed)
+    presses = []
+    t = 1.0
+    for _ in range(count):
+        duration = rng.uniform(0.08, 0.4)
+        presses.append((t, t + duration))
+        t += duration + rng.uniform(0.3, 1.5)
+    return presses, t
+
+
+def _pressed_at(presses, t):
+    import bisect
+
+    index = bisect.bisect_right(presses, (t, float("inf"))) - 1
+    return index if index >= 0 and presses[index][0] <= t < presses[index][1] else None
+
+
+@benchmark
+def buttons(results, quick):
+    from power_api.buttons import ButtonWatcher
+    from power_api.definitions import Definition
+
+    presses, end = _button_presses(200 if quick else 1000)
+    emulator = EmulatedBus()
+    api = SixfabPower(bus=emulator)
+
+    def level(t):
+        pressed = _pressed_at(presses, t) is not None
+        emulator.set_value("button1_status", Definition.BUTTON_SHORT_PRESS if pressed else Definition.BUTTON_RELEASED)
+
+    # ButtonWatcher in virtual time, bus time modelled with BUTTON_READ_TIME
+    seen = set()
+    watcher = ButtonWatcher(api, timeout=0)
+    watcher.add_callback(
+        lambda event: seen.add(_pressed_at(presses, event.timestamp)), Definition.EVENT_BUTTON_PRESSED
+    )
+    now = 0.0
+    while now < end:
+        level(now)
+        interval = watcher.poll(now)
+        now += len(watcher.buttons) * BUTTON_READ_TIME + interval
+    watcher.stop()
+    seen.discard(None)
+    results["buttons.missed_presses"] = (100.0 * (1 - len(seen) / len(presses)), "%")
+    results["buttons.bus_load"] = (watcher.reads / end, "Hz")
+
+    reads = watcher.reads
+    idle = 60.0
+    stop = now + idle
+    level(end)
+    while now < stop:
+        now += len(watcher.buttons) * BUTTON_READ_TIME + watcher.poll(now)
+    results["buttons.idle_bus_load"] = ((watcher.reads - reads) / idle, "Hz")
+
+    # naive user code: both buttons every 10 ms, a press is a released -> pressed change
+    seen = set()
+    reads = 0
+    previous = False
+    now = 0.0
+    while now < end:
+        level(now)
+        status = api.get_button1_status(0)
+        api.get_button2_status(0)
+        reads += 2
+        pressed = status != Definition.BUTTON_RELEASED
+        if pressed and not previous:
+            seen.add(_pressed_at(presses, now))
+        previous = pressed
+        now += 2 * BUTTON_READ_TIME + 0.01
+    seen.discard(None)
+    results["buttons.naive_missed_presses"] = (100.0 * (1 - len(seen) / len(presses)), "%")
+    # the same with and without presses
+    results["buttons.naive_bus_load"] = (reads / end, "Hz")
+
+
+@benchmark
+def energy_update(results, quick):
+    from power_api.energy import EnergyCounter
+
+    counter = EnergyCounter()
+    clock = [1.0e9]
+
+    def update():
+        clock[0] += 1.0
+        counter.update(5.1, 4.2, -1.3, clock[0])
+
+    results["energy.update"] = (measure(update) * 1e6, "us")
+
+
+@benchmark
+def anomaly_update(results, quick):
+    from power_api.anomaly import AnomalyDetector
+
+    detector = AnomalyDetector()
+    sample = SixfabPower(bus=EmulatedBus()).get_snapshot()
+    sample["crc_error_rate"] = 0.0
+    clock = [0.0]
+
+    def update():
+        clock[0] += 1.0
+        detector.update(sample, clock[0])
+
+    results["anomaly.update"] = (measure(update) * 1e6, "us")
+
+
+@benchmark
+def series(results, quick):
+    # bench_series.py runs the same on recorded traces
+    import tempfile
+    from power_api.series import SeriesWriter, SeriesReader
+    from traces import synthetic_discharge
+
+    samples = synthetic_discharge(period=0.1, jitter=0.002)[: 20000 if quick else 100000]
+    fields = [name for name in samples[0] if name != "timestamp"]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "trace.series")
+        start = time.perf_counter()
+        with SeriesWriter(path, fields) as writer:
+            for s in samples:
+                writer.write(s)
+        encode = time.perf_counter() - start
+        size = os.path.getsize(path)
+
+        with SeriesReader(path) as reader:
+            start = time.perf_counter()
+            reader.read()
+            decode = time.perf_counter() - start
+
+    results["series.bytes_per_sample"] = (size / len(samples), "bytes")
+    results["series.encode"] = (len(samples) / encode, "samples/s")
+    results["series.decode"] = (len(samples) / decode, "samples/s")
+
+
+#############################################################
+### End to End ##############################################
+#############################################################
+
+
+@benchmark
+def getters_zero_latency(results, quick):
+    api = SixfabPower(bus=EmulatedBus())
+    for name in getter_names():
+        getter = getattr(api, name)
+        results["getter.zero." + name] = (measure(lambda: getter(timeout=0), 0.05) * 1e6, "us")
+
+    # cost of the instrumentation on the same path
+    api.enable_stats()
+    results["getter.zero_stats.get_battery_level"] = (
+        measure(lambda: api.get_battery_level(timeout=0)) * 1e6,
+        "us",
+    )
+    api.disable_stats()
+
+    api.enable_capture()
+    results["getter.zero_capture.get_battery_level"] = (
+        measure(lambda: api.get_battery_level(timeout=0)) * 1e6,
+        "us",
+    )
+
+
+@benchmark
+def getters_realistic(results, quick):
+    api = SixfabPower(bus=EmulatedBus(**REALISTIC))
+    names = getter_names()
+    if quick:
+        names = ["get_battery_level", "get_input_power", "get_working_mode"]
+    for name in names:
+        getter = getattr(api, name)
+        results["getter.realistic." + name] = (measure(getter, 0.0, 3) * 1e3, "ms")
+
+
+@benchmark
+def snapshot(results, quick):
+    api = SixfabPower(bus=EmulatedBus())
+    results["snapshot.zero"] = (measure(lambda: api.get_snapshot(timeout=0)) * 1e6, "us")
+
+    api = SixfabPower(bus=EmulatedBus(**REALISTIC))
+    results["snapshot.realistic"] = (measure(api.get_snapshot, 0.0, 1 if quick else 3) * 1e3, "ms")
+
+
+@benchmark
+def retry_under_faults(results, quick):
+    # 10% corrupted responses, every failure pays the 100 ms retry delay
+    emulator = EmulatedBus(crc_error_rate=0.1, seed=1)
+    api = SixfabPower(bus=emulator)
+    count = 20 if quick else 100
+    start = time.perf_counter()
+    for _ in range(count):
+        api.get_battery_level(timeout=0)
+    results["retry.crc10.get_battery_level"] = ((time.perf_counter() - start) / count * 1e3, "ms")
+
+
+@benchmark
+def firmware_update(results, quick):
+    emulator = EmulatedBus()
+    api = SixfabPower(bus=emulator)
+    image = bytes(range(256)) * (64 if quick else 256)
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".firmware.bin")
+    with open(path, "wb") as f:
+        f.write(image)
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        updater = api.update_firmware(path, timeout=0)
+        # the first progress step comes after the boot reset delay
+        next(updater)
+        start = time.perf_counter()
+        for _ in updater:
+            pass
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        os.remove(path)
+
+    if emulator.flashed_firmware != image:
+        raise RuntimeError("emulator received a corrupted firmware image")
+
+    results["firmware.throughput"] = (len(image) / elapsed / 1024, "KiB/s")
+
+
+@benchmark
+def scheduler_latency(results, quick):
+    # watchdog_signal latency while three threads poll telemetry, once with
+    # the watchdog in its own safety class and once queued FIFO with telemetry
+    for mode in ("priority", "fifo"):
+        api = SixfabPower(bus=EmulatedBus(**REALISTIC))
+        scheduler = api.enable_scheduler()
+        stop = threading.Event()
+
+        def poll():
+            while not stop.is_set():
+                api.get_battery_level()
+
+        threads = [threading.Thread(target=poll) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+
+        latencies = []
+        try:
+            for _ in range(10 if quick else 40):
+                time.sleep(0.01)
+                start = time.perf_counter()
+                if mode == "fifo":
+                    with scheduler.priority(PRIORITY_TELEMETRY):
+                        api.watchdog_signal()
+                else:
+                    api.watchdog_signal()
+                latencies.append(time.perf_counter() - start)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        latencies.sort()
+        results["scheduler.{}.watchdog_mean".format(mode)] = (
+            sum(latencies) / len(latencies) * 1e3,
+            "ms",
+        )
+        results["scheduler.{}.watchdog_max".format(mode)] = (latencies[-1] * 1e3, "ms")
+
+
+@benchmark
+def shutdown(results, quick):
+    # total time of the default EDM shutdown on a healthy and on a dead bus
+    for name, emulator in (("healthy", EmulatedBus()), ("dead_bus", EmulatedBus(nack_rate=1.0))):
+        api = SixfabPower(bus=emulator)
+        report = api.shutdown_sequence(deadline=2.0)
+        results["shutdown." + name] = (report["elapsed"] * 1e3, "ms")
+
+
+#############################################################
+### Process Level ###########################################
+#############################################################
+
+
+@benchmark
+def import_time(results, quick):
+    code = "import time; t = time.perf_counter(); import power_api; print(time.perf_counter() - t)"
+    best = None
+    for _ in range(3 if quick else 7):
+        out = subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        value = float(out.stdout.strip().splitlines()[-1])
+        best = value if best is None else min(best, value)
+    results["import.power_api"] = (best * 1e3, "ms")
+
+
+@benchmark
+def cli_cold_start(results, quick):
+    # wall time from process start to the first printed value, the README
+    # documents the budget for a Pi Zero
+    commands = {
+        "cli.cold_start.interpreter": [sys.executable, "-c", "pass"],
+        "cli.cold_start.get": [
+            sys.executable, "-m", "power_api.cli", "--emulator", "get", "battery_level",
+        ],
+        "cli.cold_start.get_json": [
+            sys.executable, "-m", "power_api.cli", "--emulator", "get", "battery_level",
+            "input_power", "--json",
+        ],
+    }
+    for name, argv in commands.items():
+        best = None
+        for _ in range(3 if quick else 7):
+            start = time.perf_counter()
+            subprocess.run(argv, cwd=ROOT, capture_output=True, check=True)
+            value = time.perf_counter() - start
+            best = value if best is None else min(best, value)
+        results[name] = (best * 1e3, "ms")
+
+
+@benchmark
+def instance_memory(results, quick):
+    emulator = EmulatedBus()
+    count = 1000
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    instances = [SixfabPower(bus=emulator) for _ in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    results["memory.sixfab_power"] = (size / len(instances), "bytes")
+
+
+#############################################################
+### Runner ##################################################
+#############################################################
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, entry in results.items():
+        old = baseline.get("results", {}).get(name)
+        if old is None or not old["value"]:
+            continue
+        ratio = entry["value"] / old["value"]
+        higher_is_better = entry["unit"].endswith("/s")
+        change = (1 / ratio if higher_is_better else ratio) - 1
+        entry["baseline"] = old["value"]
+        entry["change"] = round(change, 4)
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-k", dest="keyword", help="only run benchmarks containing this text")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations for the slow cases")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown (default 0.25)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    raw = {}
+    for func in BENCHMARKS:
+        if args.keyword and args.keyword not in func.__name__:
+            continue
+        print("running " + func.__name__, file=sys.stderr)
+        func(raw, args.quick)
+
+    results = {name: {"value": value, "unit": unit} for name, (value, unit) in raw.items()}
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+    regressions = []
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        report["regressions"] = regressions
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            f.write(text + "\n")
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    for name in regressions:
+        entry = results[name]
+        print(
+            "REGRESSION {}: {:.4g} {} (baseline {:.4g}, {:+.0%})".format(
+                name, entry["value"], entry["unit"], entry["baseline"], entry["change"]
+            ),
+            file=sys.stderr,
+        )
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
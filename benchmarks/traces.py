@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+"""
+Telemetry trace helpers shared by the benchmarks.
+
+A trace is a CSV file with a header row and one sample per line. Columns
+are named after the SixfabPower getters that produced them
+(battery_current, battery_level, ...) plus a "timestamp" column in seconds.
+"""
+
+import csv
+import random
+
+
+def load_trace(path):
+    """Function for reading a CSV trace into a list of sample dictionaries."""
+    samples = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            sample = {}
+            for key, value in row.items():
+                sample[key] = float(value) if value not in ("", "None") else None
+            samples.append(sample)
+    return samples
+
+
+def save_trace(path, samples):
+    """Function for writing a list of sample dictionaries to a CSV trace."""
+    fields = list(samples[0].keys())
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(samples)
+
+
+def synthetic_discharge(
+    capacity=3000, start_level=100, period=1.0, seed=1, mean_load=0.8, jitter=0.0
+):
+    """
+    Function for generating a discharge trace shaped like a UPS HAT running
+    a Raspberry Pi from battery: piecewise constant load with step changes,
+    sample noise, and an integer battery level. Current is negative while
+    discharging, as reported by get_battery_current(). jitter is the standard
+    deviation of the sample times in seconds, timestamps are then rounded to
+    milliseconds like record_trace.py writes them.
+    """
+    rnd = random.Random(seed)
+    charge = capacity * start_level / 100.0
+    t = 0.0
+    load = mean_load
+    samples = []
+
+    while charge > 0:
+        if rnd.random() < 0.002:
+            load = max(0.2, rnd.gauss(mean_load, 0.3))
+        current = load + rnd.gauss(0, 0.05)
+        charge -= current * 1000.0 * period / 3600.0
+        level = max(0, int(charge * 100 / capacity))
+        voltage = 3.0 + 1.2 * max(charge, 0) / capacity + rnd.gauss(0, 0.01)
+        timestamp = round(t + rnd.gauss(0, jitter), 3) if jitter else t
+        samples.append(
+            {
+                "timestamp": timestamp,
+                "battery_current": round(-current, 3),
+                "battery_level": level,
+                "battery_voltage": round(voltage, 3),
+            }
+        )
+        t += period
+
+    return samples
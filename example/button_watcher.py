@@ -0,0 +1,20 @@
+from power_api import SixfabPower, Definition, ButtonWatcher
+
+api = SixfabPower()
+watcher = ButtonWatcher(api)
+
+
+def on_double_press(event):
+    print("Button " + str(event.button) + " double pressed")
+
+
+def on_long_press(event):
+    print("Button " + str(event.button) + " held for " + str(round(event.duration, 2)) + " s")
+
+
+watcher.add_callback(on_double_press, Definition.EVENT_BUTTON_DOUBLE_PRESS)
+watcher.add_callback(on_long_press, Definition.EVENT_BUTTON_LONG_PRESS, button=1)
+
+# Blocks and polls the buttons until the process is stopped, the callbacks
+# run on a separate thread
+watcher.run()
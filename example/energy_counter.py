@@ -0,0 +1,19 @@
+import time
+
+from power_api import SixfabPower
+from power_api.energy import EnergyCounter
+
+api = SixfabPower()
+
+# Reloads the totals written before the last reboot, checkpoints every 5 minutes
+counter = EnergyCounter("/var/lib/sixfab-power/energy.json")
+
+try:
+    while True:
+        counter.update_sample(api.get_snapshot(("input_power", "system_power", "battery_power")))
+        today = counter.day()
+        print("Today  input: {:.2f} Wh, system: {:.2f} Wh, battery charge: {:.2f} Wh, discharge: {:.2f} Wh".format(
+            today["input"], today["system"], today["battery_charge"], today["battery_discharge"]))
+        time.sleep(5)
+finally:
+    counter.save()
@@ -0,0 +1,18 @@
+from power_api import SixfabPower
+from power_api.parquet import record_telemetry, read_telemetry
+import time
+
+api = SixfabPower()
+
+# One sample per second for ten minutes, written in row groups of 60 samples
+start = time.time()
+rows = record_telemetry(api, "ups_telemetry.parquet", interval=1.0, duration=600, row_group_size=60)
+print("Samples written: " + str(rows))
+
+# Only the battery columns of the last five minutes are read back
+table = read_telemetry(
+    "ups_telemetry.parquet",
+    columns=["battery_level", "battery_voltage", "working_mode"],
+    start=start + 300,
+)
+print(table.to_pydict())
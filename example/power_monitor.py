@@ -0,0 +1,22 @@
+from power_api import SixfabPower, Definition, PowerStateMonitor
+import os
+
+api = SixfabPower()
+monitor = PowerStateMonitor(api)
+
+
+def on_adapter_lost(event):
+    print("Adapter lost, input power: " + str(event.input_power))
+    print("Result removing all Scheduled Event: " + str(api.remove_all_scheduled_events(200)))
+    os.system("sudo shutdown -h now")
+
+
+def on_adapter_restored(event):
+    print("Adapter restored, working mode: " + str(event.mode))
+
+
+monitor.add_callback(on_adapter_lost, Definition.EVENT_ADAPTER_LOST)
+monitor.add_callback(on_adapter_restored, Definition.EVENT_ADAPTER_RESTORED)
+
+# Blocks and polls the HAT until the process is stopped
+monitor.run()
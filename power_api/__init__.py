@@ -1 +1,22 @@
 from .power_api import *
+
+# Helpers are imported on first use to keep the import of the API (and the
+# start of the sixfab-power command) cheap.
+_LAZY = {
+    "PowerStateMonitor": ".monitor",
+    "PowerStateEvent": ".monitor",
+    "BatteryRuntimeEstimator": ".estimator",
+    "ButtonWatcher": ".buttons",
+    "ButtonEvent": ".buttons",
+}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    import importlib
+
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,5 @@
+import sys
+
+from power_api.cli import main
+
+sys.exit(main())
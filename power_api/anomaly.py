@@ -0,0 +1,406 @@
+#!/usr/bin/python3
+
+import math
+import time
+import threading
+import traceback
+
+from power_api.definitions import Definition
+from power_api.exceptions import invalid_argument
+
+# Rule severities
+SEVERITY_WARNING = "warning"
+SEVERITY_CRITICAL = "critical"
+
+# Values a rule can test, see MetricStats
+SOURCES = ("value", "ewma", "rate", "zscore")
+
+
+class MetricStats:
+    """
+    Running statistics of one metric in constant memory.
+
+    Attributes
+    ----------
+    count : int
+        samples seen
+    mean : float
+        mean of all samples (Welford)
+    variance : float
+        variance of all samples (Welford)
+    ewma : float
+        exponentially weighted mean with time constant tau [seconds]
+    rate : float
+        change per second, smoothed with time constant rate_tau [seconds]
+    value : float
+        last sample
+    """
+
+    __slots__ = ("tau", "rate_tau", "count", "mean", "m2", "ewma", "rate", "value", "time")
+
+    def __init__(self, tau=60.0, rate_tau=10.0):
+        self.tau = tau
+        self.rate_tau = rate_tau
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma = None
+        self.rate = 0.0
+        self.value = None
+        self.time = None
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def zscore(self, value):
+        """Function for getting the distance of value from the mean in standard deviations, 0 without spread."""
+        std = math.sqrt(self.variance)
+        return (value - self.mean) / std if std > 0 else 0.0
+
+    def update(self, value, timestamp):
+        """Function for adding one sample taken at timestamp [seconds]."""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        if self.ewma is None:
+            self.ewma = value
+        else:
+            dt = timestamp - self.time
+            if dt > 0:
+                self.ewma += (value - self.ewma) * (1.0 - math.exp(-dt / self.tau))
+                slope = (value - self.value) / dt
+                self.rate += (slope - self.rate) * (1.0 - math.exp(-dt / self.rate_tau))
+        self.value = value
+        self.time = timestamp
+
+
+class Rule:
+    """
+    Threshold rule with hysteresis.
+
+    The rule is raised after samples consecutive samples beyond its
+    threshold and cleared once the tested value is back past clear, so a
+    value hovering around the threshold does not flap.
+
+    Parameters
+    -----------
+    name : str
+    metric : str
+        snapshot field, e.g. "input_voltage"
+    above : float (optional)
+        raise when the tested value is above (give above or below)
+    below : float (optional)
+        raise when the tested value is below
+    clear : float (optional)
+        clear when the tested value is back below (above rules) or above
+        (below rules) this (default is the threshold)
+    source : str (optional)
+        tested value, one of SOURCES: the sample, its ewma, its rate of
+        change per second or its z-score against the running mean (default is "value")
+    samples : int (optional)
+        consecutive samples beyond the threshold needed to raise (default is 1)
+    severity : str (optional)
+        SEVERITY_WARNING or SEVERITY_CRITICAL (default is SEVERITY_WARNING)
+    when : callable (optional)
+        called with the sample dict, the rule is only evaluated while it
+        returns True (default is None, always)
+    """
+
+    def __init__(
+        self,
+        name,
+        metric,
+        above=None,
+        below=None,
+        clear=None,
+        source="value",
+        samples=1,
+        severity=SEVERITY_WARNING,
+        when=None,
+    ):
+        if (above is None) == (below is None):
+            raise invalid_argument("Rule {} needs exactly one of above and below".format(name))
+        if source not in SOURCES:
+            raise invalid_argument("Rule {} source must be one of {}".format(name, SOURCES))
+        self.name = name
+        self.metric = metric
+        self.above = above
+        self.below = below
+        self.threshold = above if above is not None else below
+        self.clear = self.threshold if clear is None else clear
+        self.source = source
+        self.samples = max(1, int(samples))
+        self.severity = severity
+        self.when = when
+
+    def beyond(self, value):
+        """Function for checking value against the raise threshold."""
+        return value > self.above if self.above is not None else value < self.below
+
+    def cleared(self, value):
+        """Function for checking value against the clear threshold."""
+        return value <= self.clear if self.above is not None else value >= self.clear
+
+
+def _adapter_powered(sample):
+    return sample.get("working_mode") != Definition.BATTERY_POWERED
+
+
+DEFAULT_RULES = (
+    # 4.75 V is the lower limit of USB power, not evaluated on battery
+    Rule("input_voltage_sag", "input_voltage", below=4.75, clear=4.85, samples=2, when=_adapter_powered),
+    Rule("system_current_spike", "system_current", above=4.0, clear=2.0, source="zscore"),
+    Rule("battery_current_spike", "battery_current", above=4.0, clear=2.0, source="zscore"),
+    Rule("battery_temp_high", "battery_temp", above=55.0, clear=50.0, samples=2, severity=SEVERITY_CRITICAL),
+    # 3 C per minute
+    Rule("battery_temp_runaway", "battery_temp", above=0.05, clear=0.01, source="rate", samples=3, severity=SEVERITY_CRITICAL),
+    Rule("fan_stall", "fan_health", above=Definition.FAN_HEALTY, samples=2),
+    # share of failed attempts, see SixfabPower.enable_stats()
+    Rule("crc_error_rate", "crc_error_rate", above=0.05, clear=0.01, source="ewma"),
+)
+
+
+class AnomalyEvent:
+    """
+    Rule state change reported by AnomalyDetector.
+
+    Attributes
+    ----------
+    type : Definition Object Property
+        --> Definition.EVENT_ANOMALY_RAISED
+        --> Definition.EVENT_ANOMALY_CLEARED
+    rule : str
+        rule name
+    metric : str
+    severity : str
+    value : float
+        tested value (sample, ewma, rate or z-score, see Rule.source)
+    threshold : float
+        raise threshold, or the clear threshold for CLEARED events
+    timestamp : float
+        time of the sample
+    """
+
+    __slots__ = ("type", "rule", "metric", "severity", "value", "threshold", "timestamp")
+
+    def __init__(self, type, rule, metric, severity, value, threshold, timestamp):
+        self.type = type
+        self.rule = rule
+        self.metric = metric
+        self.severity = severity
+        self.value = value
+        self.threshold = threshold
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return "AnomalyEvent(type={}, rule={}, value={:.4g}, threshold={:.4g})".format(
+            self.type, self.rule, self.value, self.threshold
+        )
+
+
+class AnomalyDetector:
+    """
+    Streaming rule evaluation on telemetry samples.
+
+    Only the metrics used by the rules are tracked, so each update costs
+    O(number of rules) time and memory, independent of how many samples
+    were seen. z-score rules are evaluated against the statistics before
+    the sample is added, and only after warmup samples of their metric.
+
+    Parameters
+    -----------
+    rules : iterable (optional)
+        Rule instances (default is DEFAULT_RULES)
+    tau : float (optional)
+        time constant of the ewma in seconds (default is 60)
+    rate_tau : float (optional)
+        time constant of the rate of change smoothing in seconds (default is 10)
+    warmup : int (optional)
+        samples of a metric before its z-score rules are evaluated (default is 30)
+    """
+
+    def __init__(self, rules=DEFAULT_RULES, tau=60.0, rate_tau=10.0, warmup=30):
+        self.rules = tuple(rules)
+        self.warmup = warmup
+        self.metrics = {rule.metric: MetricStats(tau, rate_tau) for rule in self.rules}
+        self.active = {}  # rule name: AnomalyEvent that raised it
+        self.samples = 0
+
+        self._counts = [0] * len(self.rules)
+        self._stats_totals = None
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+
+    def add_callback(self, callback, event_type=None):
+        """
+        Function for registering an event callback
+
+        Parameters
+        -----------
+        callback : callable
+            called with an AnomalyEvent from the thread calling update()
+        event_type : int (optional)
+            only deliver events of this type (default is None, all events)
+        """
+        with self._callbacks_lock:
+            self._callbacks.append((callback, event_type))
+
+    def remove_callback(self, callback):
+        """Function for removing a callback registered with add_callback."""
+        with self._callbacks_lock:
+            self._callbacks = [c for c in self._callbacks if c[0] is not callback]
+
+    def _dispatch(self, event):
+        with self._callbacks_lock:
+            callbacks = list(self._callbacks)
+
+        for callback, event_type in callbacks:
+            if event_type is not None and event_type != event.type:
+                continue
+            try:
+                callback(event)
+            except Exception:
+                traceback.print_exc()
+
+    def update(self, sample, timestamp=None):
+        """
+        Function for feeding one telemetry sample
+
+        Parameters
+        -----------
+        sample : dict
+            {<metric>: value or None, ...}, e.g. from get_snapshot()
+        timestamp : float (optional)
+            sample time in seconds (default is sample["timestamp"] or time.time())
+
+        Returns
+        -------
+        events : list
+            AnomalyEvent instances raised or cleared by the sample
+        """
+        if timestamp is None:
+            timestamp = sample.get("timestamp")
+            if timestamp is None:
+                timestamp = time.time()
+        self.samples += 1
+
+        # z-scores against the statistics before this sample
+        zscores = {}
+        for rule in self.rules:
+            if rule.source == "zscore" and rule.metric not in zscores:
+                value = sample.get(rule.metric)
+                stats = self.metrics[rule.metric]
+                if value is not None and stats.count >= self.warmup:
+                    zscores[rule.metric] = stats.zscore(value)
+
+        for metric, stats in self.metrics.items():
+            value = sample.get(metric)
+            if value is not None:
+                stats.update(value, timestamp)
+
+        events = []
+        for index, rule in enumerate(self.rules):
+            value = sample.get(rule.metric)
+            if value is None or (rule.when is not None and not rule.when(sample)):
+                continue
+            stats = self.metrics[rule.metric]
+            if rule.source == "zscore":
+                tested = zscores.get(rule.metric)
+                if tested is None:
+                    continue
+            elif rule.source == "ewma":
+                tested = stats.ewma
+            elif rule.source == "rate":
+                tested = stats.rate
+            else:
+                tested = value
+
+            if rule.name in self.active:
+                if rule.cleared(tested):
+                    del self.active[rule.name]
+                    events.append(
+                        AnomalyEvent(
+                            Definition.EVENT_ANOMALY_CLEARED,
+                            rule.name, rule.metric, rule.severity, tested, rule.clear, timestamp,
+                        )
+                    )
+            elif rule.beyond(tested):
+                self._counts[index] += 1
+                if self._counts[index] >= rule.samples:
+                    self._counts[index] = 0
+                    event = AnomalyEvent(
+                        Definition.EVENT_ANOMALY_RAISED,
+                        rule.name, rule.metric, rule.severity, tested, rule.threshold, timestamp,
+                    )
+                    self.active[rule.name] = event
+                    events.append(event)
+            else:
+                self._counts[index] = 0
+
+        for event in events:
+            self._dispatch(event)
+        return events
+
+    def poll(self, api, fields=None):
+        """
+        Function for reading a snapshot from the HAT and feeding it
+
+        The bus error rate is added as "crc_error_rate" (CRC failures per
+        attempt since the last poll) while api.enable_stats() is active.
+
+        Parameters
+        -----------
+        api : SixfabPower
+        fields : iterable (optional)
+            snapshot fields to read (default is the metrics of the rules that are snapshot fields)
+
+        Returns
+        -------
+        events : list
+            see update()
+        """
+        from power_api.power_api import SNAPSHOT_FIELDS
+
+        if fields is None:
+            fields = [name for name in SNAPSHOT_FIELDS if name in self.metrics or name == "working_mode"]
+        sample = api.get_snapshot(fields)
+
+        stats = api.stats()
+        if stats is not None:
+            totals = stats["totals"]
+            previous = self._stats_totals
+            self._stats_totals = (totals["attempts"], totals["crc_failures"])
+            if previous is not None:
+                attempts = totals["attempts"] - previous[0]
+                if attempts > 0:
+                    sample["crc_error_rate"] = (totals["crc_failures"] - previous[1]) / attempts
+        return self.update(sample)
+
+    def status(self):
+        """
+        Function for getting the metric statistics and raised rules
+
+        Returns
+        -------
+        status : dict
+            {"samples", "active": [rule names], "metrics": {metric: {"count",
+            "mean", "std", "ewma", "rate", "value"}}}
+        """
+        return {
+            "samples": self.samples,
+            "active": sorted(self.active),
+            "metrics": {
+                metric: {
+                    "count": stats.count,
+                    "mean": stats.mean,
+                    "std": math.sqrt(stats.variance),
+                    "ewma": stats.ewma,
+                    "rate": stats.rate,
+                    "value": stats.value,
+                }
+                for metric, stats in self.metrics.items()
+            },
+        }
@@ -0,0 +1,237 @@
+#!/usr/bin/python3
+
+import time
+import threading
+import traceback
+
+from power_api.command import Command, BATTERY_TEMP_ADDRESS
+from power_api.definitions import Definition
+from power_api.power_api import exclusive
+
+# The sensor at BATTERY_TEMP_ADDRESS answers a 12 bit two's complement
+# value, left aligned in two bytes, 0.0625 C per LSB. Index: 12 bit value,
+# entry: temperature in 1/100 C as sent to the MCU.
+SENSOR_TABLE = tuple(
+    int(round((raw - 0x1000 if raw & 0x800 else raw) * 6.25)) for raw in range(0x1000)
+)
+
+# Range of the sensor [1/100 C], readings outside are reported as faults
+SENSOR_MIN = -4000
+SENSOR_MAX = 12500
+
+# get_battery_separation_status() while the battery holder is separated
+SEPARATED = 1
+
+# Fault kinds passed to on_fault
+FAULT_NO_SENSOR = "no_sensor"
+FAULT_OUT_OF_RANGE = "out_of_range"
+FAULT_SEND_FAILED = "send_failed"
+
+
+class BatteryTemperatureRelay:
+    """
+    Forwards the temperature of a separated battery holder to the MCU.
+
+    With battery separation enabled the MCU has no own battery temperature
+    and relies on the end device for charge temperature protection. Each
+    poll() reads the sensor at BATTERY_TEMP_ADDRESS with one block read,
+    converts it through SENSOR_TABLE and sends it with
+    send_battery_temperature() when it moved by deadband or the last sent
+    value is max_age seconds old.
+
+    Both the sensor read and the send run inside api.bus_session(), so the
+    relay uses the bus, scheduler and bus lock of api and nests into a
+    session held by the caller. Call poll() from an existing periodic loop,
+    or start() it next to other work on the same api. The bus lock does not
+    separate threads of one process: when other threads use api without
+    its scheduler, pass an executor that serializes the calls, e.g.
+    PowerDaemon._execute.
+
+    Parameters
+    -----------
+    api : SixfabPower
+        api instance used for bus access
+    interval : float (optional)
+        poll period in seconds (default is 5)
+    deadband : float (optional)
+        change in Celsius that is sent at once (default is 0.5)
+    max_age : float (optional)
+        seconds after which the value is sent again even if unchanged (default is 60)
+    check_separation : float (optional)
+        seconds between reads of the battery separation status, None relays
+        without checking it (default is 600)
+    on_fault : callable (optional)
+        called with (fault kind, detail) when a fault starts, and with
+        (None, None) when the sensor recovers
+    executor : callable (optional)
+        called as executor(func, args, kwargs) to run each poll, e.g. under
+        a lock shared with the other users of api (default is None, polls
+        run directly)
+    """
+
+    def __init__(
+        self,
+        api,
+        interval=5.0,
+        deadband=0.5,
+        max_age=60.0,
+        check_separation=600.0,
+        on_fault=None,
+        executor=None,
+    ):
+        self.api = api
+        self.executor = executor
+        self.interval = interval
+        self.deadband = int(round(deadband * 100))
+        self.max_age = max_age
+        self.check_separation = check_separation
+        self.on_fault = on_fault
+
+        self.temperature = None  # last reading [Celsius]
+        self.sent = None  # last value accepted by the MCU [Celsius]
+        self.fault = None
+
+        self.reads = 0
+        self.sends = 0
+        self.faults = 0
+
+        self._sent_centi = None
+        self._sent_at = None
+        self._separated = None
+        self._separation_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def read_sensor(self):
+        """
+        Function for reading the sensor once
+
+        Returns
+        -------
+        temperature : int
+            temperature in 1/100 Celsius, None when the sensor did not answer
+        """
+        command = self.api.command
+        # a raw read outside transaction(), it still holds the bus like one
+        with exclusive(command, Command.PROTOCOL_COMMAND_SEND_BATTERY_TEMPERATURE):
+            word = command.read_word_data(BATTERY_TEMP_ADDRESS)
+        if word == -1:
+            return None
+        return SENSOR_TABLE[(word[0] << 4) | (word[1] >> 4)]
+
+    def _set_fault(self, kind, detail=None):
+        if kind == self.fault:
+            return
+        self.fault = kind
+        if kind is not None:
+            self.faults += 1
+        if self.on_fault is not None:
+            try:
+                self.on_fault(kind, detail)
+            except Exception:
+                traceback.print_exc()
+
+    def poll(self, now=None):
+        """
+        Function for reading the sensor and forwarding the value when due
+
+        Parameters
+        -----------
+        now : float (optional)
+            time.monotonic() value of the poll (default is the current time)
+
+        Returns
+        -------
+        interval : float
+            seconds to wait before the next poll
+        """
+        if now is None:
+            now = time.monotonic()
+        if self.executor is not None:
+            return self.executor(self._poll, (now,), {})
+        return self._poll(now)
+
+    def _poll(self, now):
+        with self.api.bus_session():
+            if self.check_separation is not None and (
+                self._separation_at is None or now - self._separation_at >= self.check_separation
+            ):
+                status = self.api.get_battery_separation_status()
+                if status is not None:
+                    self._separated = status == SEPARATED
+                    self._separation_at = now
+            if self.check_separation is not None and not self._separated:
+                return self.interval
+
+            centi = self.read_sensor()
+            self.reads += 1
+            if centi is None:
+                self._set_fault(FAULT_NO_SENSOR)
+                return self.interval
+            if not SENSOR_MIN <= centi <= SENSOR_MAX:
+                self._set_fault(FAULT_OUT_OF_RANGE, centi / 100)
+                return self.interval
+            self.temperature = centi / 100
+
+            due = (
+                self._sent_centi is None
+                or abs(centi - self._sent_centi) >= self.deadband
+                or now - self._sent_at >= self.max_age
+            )
+            if due:
+                result = self.api.send_battery_temperature(self.temperature)
+                if result == Definition.SET_OK:
+                    self.sends += 1
+                    self.sent = self.temperature
+                    self._sent_centi = centi
+                    self._sent_at = now
+                else:
+                    self._set_fault(FAULT_SEND_FAILED, result)
+                    return self.interval
+
+        self._set_fault(None)
+        return self.interval
+
+    def status(self):
+        """
+        Function for getting the relay state
+
+        Returns
+        -------
+        status : dict
+            {"temperature", "sent", "fault", "separated", "reads", "sends", "faults"}
+        """
+        return {
+            "temperature": self.temperature,
+            "sent": self.sent,
+            "fault": self.fault,
+            "separated": self._separated,
+            "reads": self.reads,
+            "sends": self.sends,
+            "faults": self.faults,
+        }
+
+    def run(self):
+        """Function for polling until stop() is called. Blocks the caller."""
+        while not self._stop.is_set():
+            try:
+                interval = self.poll()
+            except Exception:
+                traceback.print_exc()
+                interval = self.interval
+            self._stop.wait(interval)
+
+    def start(self):
+        """Function for running the relay on a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="BatteryTemperatureRelay", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Function for stopping the relay thread started with start()."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
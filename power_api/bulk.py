@@ -0,0 +1,235 @@
+#!/usr/bin/python3
+"""
+Vectorized decoding of response frames with NumPy (optional dependency).
+
+    from power_api import bulk
+
+    values = bulk.decode_frames(buffer, frame_size=11)    # contiguous frames
+    values = bulk.decode_capture("capture.bin")           # FrameCapture.dump() file
+
+Results are structured arrays with the fields of frame_dtype(). Values are
+scaled with the factors of power_api.registers, so they equal what the
+getters return; composite values (scale None) are NaN, see raw.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from power_api.command import (
+    Command,
+    CRC16_TABLE,
+    START_BYTE_RECIEVED,
+    PROTOCOL_HEADER_SIZE,
+    PROTOCOL_FRAME_SIZE,
+    COMMAND_TYPE_RESPONSE,
+)
+from power_api.capture import RECORD_SIZE, MAX_FRAME, RECEIVED, FILE_HEADER, FILE_MAGIC
+from power_api.registers import REGISTERS
+
+# Integer values decoded besides the REGISTERS entries
+EXTRA_VALUES = {
+    Command.PROTOCOL_COMMAND_GET_RTC_TIME: ("rtc_time", 4, 1, False),
+    Command.PROTOCOL_COMMAND_GET_SCHEDULED_EVENT_IDS: ("scheduled_event_ids", 2, 1, False),
+}
+
+_tables = None
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("power_api.bulk needs NumPy: pip install numpy")
+
+
+def frame_dtype():
+    """Function for getting the structured dtype of decoded frames."""
+    _require_numpy()
+    return np.dtype(
+        [
+            ("timestamp", "f8"),  # seconds, NaN when unknown
+            ("command", "u1"),
+            ("raw", "i8"),  # integer value before scaling
+            ("value", "f8"),  # scaled like the getters, NaN for composite values
+            ("crc_ok", "?"),
+        ]
+    )
+
+
+def _get_tables():
+    global _tables
+    if _tables is None:
+        _require_numpy()
+        scale = np.full(256, np.nan)
+        signed = np.zeros(256, dtype=bool)
+        for table in (REGISTERS, EXTRA_VALUES):
+            for command_num, (name, length, factor, is_signed) in table.items():
+                if factor is not None:
+                    scale[command_num] = factor
+                signed[command_num] = is_signed
+        _tables = (np.array(CRC16_TABLE, dtype=np.uint16), scale, signed)
+    return _tables
+
+
+def crc16_rows(frames, length):
+    """
+    Function for calculating CRC-16/XMODEM of the first length bytes of every row
+
+    Parameters
+    -----------
+    frames : numpy.ndarray
+        uint8 array of shape (count, frame size)
+    length : int
+        bytes per row covered by the CRC
+
+    Returns
+    -------
+    crc : numpy.ndarray
+        uint16 array of shape (count,)
+    """
+    table = _get_tables()[0]
+    crc = np.zeros(len(frames), dtype=np.uint16)
+    for column in range(length):
+        index = (crc >> 8) ^ frames[:, column]
+        crc = (crc << 8) ^ table[index]
+    return crc
+
+
+def _decode_rows(frames, timestamps=None):
+    """Decode a (count, frame size) uint8 array of equally sized frames."""
+    _, scale, signed = _get_tables()
+    count, size = frames.shape
+    datalen = size - PROTOCOL_FRAME_SIZE
+    out = np.zeros(count, dtype=frame_dtype())
+    out["timestamp"] = np.nan if timestamps is None else timestamps
+    if count == 0:
+        return out
+
+    command = frames[:, 1]
+    out["command"] = command
+
+    crc = crc16_rows(frames, PROTOCOL_HEADER_SIZE + datalen)
+    received = (frames[:, size - 2].astype(np.uint16) << 8) | frames[:, size - 1]
+    out["crc_ok"] = (
+        (crc == received)
+        & (frames[:, 0] == START_BYTE_RECIEVED)
+        & (frames[:, 2] == COMMAND_TYPE_RESPONSE)
+        & (((frames[:, 3].astype(np.uint16) << 8) | frames[:, 4]) == datalen)
+    )
+
+    # big endian integer of the data bytes
+    raw = np.zeros(count, dtype=np.int64)
+    for column in range(PROTOCOL_HEADER_SIZE, PROTOCOL_HEADER_SIZE + min(datalen, 8)):
+        raw = (raw << 8) | frames[:, column]
+    if 0 < datalen <= 4:
+        bits = 8 * datalen
+        negative = signed[command] & (raw >= (1 << (bits - 1)))
+        raw = np.where(negative, raw - (1 << bits), raw)
+    out["raw"] = raw
+    out["value"] = raw / scale[command]
+    return out
+
+
+def decode_frames(buffer, frame_size=PROTOCOL_FRAME_SIZE + 4, timestamps=None, valid_only=False):
+    """
+    Function for decoding a contiguous buffer of equally sized response frames
+
+    Parameters
+    -----------
+    buffer : bytes/bytearray/memoryview/numpy.ndarray
+        frames back to back, e.g. 11 byte INT32 responses
+    frame_size : int (optional)
+        bytes per frame (default is 11)
+    timestamps : array like (optional)
+        one timestamp per frame in seconds
+    valid_only : bool (optional)
+        drop frames failing the CRC or header check (default is False)
+
+    Returns
+    -------
+    frames : numpy.ndarray
+        structured array with the fields of frame_dtype()
+    """
+    _require_numpy()
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    count = len(data) // frame_size
+    frames = data[: count * frame_size].reshape(count, frame_size)
+    if timestamps is not None:
+        timestamps = np.asarray(timestamps, dtype=np.float64)[:count]
+    out = _decode_rows(frames, timestamps)
+    if valid_only:
+        out = out[out["crc_ok"]]
+    return out
+
+
+def decode_file(path, frame_size=PROTOCOL_FRAME_SIZE + 4, valid_only=False):
+    """Function for decoding a file of back to back frames, see decode_frames()."""
+    _require_numpy()
+    return decode_frames(np.fromfile(path, dtype=np.uint8), frame_size, None, valid_only)
+
+
+def capture_dtype():
+    """Function for getting the dtype of power_api.capture records."""
+    _require_numpy()
+    return np.dtype(
+        [
+            ("timestamp", "<u8"),
+            ("direction", "u1"),
+            ("outcome", "u1"),
+            ("command", "u1"),
+            ("length", "u1"),
+            ("frame", "u1", (MAX_FRAME,)),
+        ]
+    )
+
+
+def decode_capture(capture, valid_only=False):
+    """
+    Function for decoding the received frames of a frame capture
+
+    Parameters
+    -----------
+    capture : str/bytes/FrameCapture
+        file written by FrameCapture.dump(), its records (FrameCapture.raw()) or the capture
+    valid_only : bool (optional)
+        drop frames failing the CRC or header check (default is False)
+
+    Returns
+    -------
+    frames : numpy.ndarray
+        structured array with the fields of frame_dtype(), in capture order,
+        timestamps are time.monotonic() seconds of the capturing host
+    """
+    _require_numpy()
+    if isinstance(capture, str):
+        with open(capture, "rb") as f:
+            magic, record_size, count = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+            if magic != FILE_MAGIC or record_size != RECORD_SIZE:
+                raise ValueError("Not a frame capture file: " + capture)
+            data = f.read(count * RECORD_SIZE)
+    elif hasattr(capture, "raw"):
+        data = capture.raw()
+    else:
+        data = capture
+
+    records = np.frombuffer(data, dtype=capture_dtype(), count=len(data) // RECORD_SIZE)
+    records = records[records["direction"] == RECEIVED]
+
+    parts = []
+    order = []
+    positions = np.arange(len(records))
+    for length in np.unique(records["length"]):
+        if length <= PROTOCOL_FRAME_SIZE:
+            continue
+        selected = records["length"] == length
+        group = records[selected]
+        parts.append(_decode_rows(group["frame"][:, :length], group["timestamp"] / 1e9))
+        order.append(positions[selected])
+
+    if not parts:
+        return np.zeros(0, dtype=frame_dtype())
+
+    out = np.concatenate(parts)[np.argsort(np.concatenate(order), kind="stable")]
+    if valid_only:
+        out = out[out["crc_ok"]]
+    return out
@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+
+import os
+import time
+import fcntl
+import threading
+
+from power_api.exceptions import bus_lock_timeout, bus_lock_unavailable
+
+# /run/lock is a tmpfs writable by the i2c group on Raspberry Pi OS
+LOCK_DIR = "/run/lock"
+
+
+def default_lock_path(bus_number=1):
+    """Function for getting the lock file of /dev/i2c-<bus_number>."""
+    if os.access(LOCK_DIR, os.W_OK):
+        directory = LOCK_DIR
+    else:
+        # tempfile pulls in shutil, random and the compression modules,
+        # which the start of the sixfab-power command can do without
+        import tempfile
+
+        directory = tempfile.gettempdir()
+    return os.path.join(directory, "sixfab-power-i2c-{}.lock".format(bus_number))
+
+
+def _open_lock_file(path):
+    # The files are shared by the processes of every user: the creator
+    # makes them world writable against its umask, the others open them
+    # without O_CREAT (refused for files of another user in a sticky
+    # directory with fs.protected_regular) and read-only if they must,
+    # flock() does not need write access.
+    cloexec = getattr(os, "O_CLOEXEC", 0)
+    error = None
+    for _ in range(3):
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL | cloexec, 0o666)
+        except FileExistsError:
+            pass
+        except OSError as e:
+            error = e
+            break
+        else:
+            try:
+                os.fchmod(fd, 0o666)
+            except OSError:
+                pass
+            return fd
+
+        for flags in (os.O_RDWR, os.O_RDONLY):
+            try:
+                return os.open(path, flags | cloexec)
+            except PermissionError as e:
+                error = e
+            except FileNotFoundError as e:
+                # removed in between, create it again
+                error = e
+                break
+        else:
+            break
+
+    raise bus_lock_unavailable(
+        "Bus lock file {} can not be opened: {}".format(path, error), getattr(error, "errno", None)
+    ) from error
+
+
+class BusLock:
+    """
+    Cross-process lock of the HAT bus based on fcntl.flock.
+
+    transaction() holds it for each request/response exchange so frames of
+    different processes can not interleave, and SixfabPower.bus_session()
+    holds it for a whole batch. The lock is counted per process: threads of
+    one process share it (use the scheduler to order them) and nested
+    acquires only take the file lock once.
+
+    The kernel drops the lock when its holder exits, so a crashed process
+    never blocks the bus. A live holder that does not release it within
+    timeout makes acquire() raise bus_lock_timeout instead of stealing the
+    lock.
+
+    Waiters announce themselves with a shared lock on a second file. A
+    process that releases the bus while someone is waiting stays away from
+    it for handoff seconds, so a tight loop can not starve other processes.
+
+    Parameters
+    -----------
+    path : str (optional)
+        lock file (default is default_lock_path())
+    timeout : float (optional)
+        seconds to wait for the lock, None waits forever (default is 5)
+    handoff : float (optional)
+        pause before re-acquiring after a contended release (default is 0.002)
+    """
+
+    def __init__(self, path=None, timeout=5.0, handoff=0.002):
+        self.path = path or default_lock_path()
+        self.timeout = timeout
+        self.handoff = handoff
+        self._mutex = threading.Lock()
+        self._depth = 0
+        self._fd = None
+        self._wait_fd = None
+        self._yield_until = 0.0
+
+        self.acquired = 0
+        self.contended = 0
+        self.wait_time = 0.0
+
+    def _open(self):
+        fd = _open_lock_file(self.path)
+        try:
+            self._wait_fd = _open_lock_file(self.path + ".wait")
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def close(self):
+        """Function for closing the lock files, releases the lock."""
+        with self._mutex:
+            for fd in (self._fd, self._wait_fd):
+                if fd is not None:
+                    os.close(fd)
+            self._fd = None
+            self._wait_fd = None
+            self._depth = 0
+
+    def _lock(self):
+        if self._fd is None:
+            self._open()
+
+        delay = self._yield_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        self.acquired += 1
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            pass
+
+        self.contended += 1
+        start = time.monotonic()
+        deadline = None if self.timeout is None else start + self.timeout
+        sleep = 0.0001
+        fcntl.flock(self._wait_fd, fcntl.LOCK_SH)
+        try:
+            while True:
+                time.sleep(sleep)
+                try:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return
+                except BlockingIOError:
+                    pass
+                if deadline is not None and time.monotonic() >= deadline:
+                    self.acquired -= 1
+                    raise bus_lock_timeout(
+                        "Bus lock {} not released within {} s".format(self.path, self.timeout)
+                    )
+                sleep = min(sleep * 2, 0.001)
+        finally:
+            fcntl.flock(self._wait_fd, fcntl.LOCK_UN)
+            self.wait_time += time.monotonic() - start
+
+    def _unlock(self):
+        # anybody waiting holds the wait file shared
+        try:
+            fcntl.flock(self._wait_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._yield_until = time.monotonic() + self.handoff
+        else:
+            fcntl.flock(self._wait_fd, fcntl.LOCK_UN)
+            self._yield_until = 0.0
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def acquire(self):
+        """Function for taking the lock, see the class documentation."""
+        with self._mutex:
+            if self._depth == 0:
+                self._lock()
+            self._depth += 1
+
+    def release(self):
+        """Function for releasing the lock taken with acquire()."""
+        with self._mutex:
+            self._depth -= 1
+            if self._depth == 0:
+                self._unlock()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
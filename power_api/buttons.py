@@ -0,0 +1,336 @@
+#!/usr/bin/python3
+
+import time
+import queue
+import threading
+import traceback
+
+from power_api.definitions import Definition
+from power_api.power_api import RESPONSE_DELAY
+
+
+class ButtonEvent:
+    """
+    Button event reported by ButtonWatcher.
+
+    Attributes
+    ----------
+    type : Definition Object Property
+        --> Definition.EVENT_BUTTON_PRESSED
+        --> Definition.EVENT_BUTTON_RELEASED
+        --> Definition.EVENT_BUTTON_LONG_PRESS
+        --> Definition.EVENT_BUTTON_DOUBLE_PRESS
+    button : int
+        1 or 2
+    duration : float
+        seconds the button has been held, 0 for PRESSED and DOUBLE_PRESS
+    timestamp : float
+        time.monotonic() of the first sample that saw the change
+    """
+
+    __slots__ = ("type", "button", "duration", "timestamp")
+
+    def __init__(self, type, button, duration=0.0, timestamp=0.0):
+        self.type = type
+        self.button = button
+        self.duration = duration
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return "ButtonEvent(type={}, button={}, duration={:.3f})".format(self.type, self.button, self.duration)
+
+
+class _Button:
+    __slots__ = (
+        "number",
+        "getter",
+        "pressed",
+        "candidate",
+        "count",
+        "since",
+        "pressed_at",
+        "long_sent",
+        "released_at",
+        "double",
+    )
+
+    def __init__(self, number, getter):
+        self.number = number
+        self.getter = getter
+        self.pressed = False
+        self.candidate = None
+        self.count = 0
+        self.since = 0.0
+        self.pressed_at = None
+        self.long_sent = False
+        self.released_at = None  # end of the last short press, for double presses
+        self.double = False
+
+
+class ButtonWatcher:
+    """
+    Edge detection for the two HAT buttons.
+
+    get_button1_status() and get_button2_status() report levels; both are
+    read in one loop (one bus session per poll) every slow_interval seconds
+    while nothing happens. The first sample that differs switches to
+    fast_interval, so a change is confirmed by debounce consecutive samples
+    within one fast cycle, and the fast rate is kept for fast_period seconds
+    after the last change, where a double press would follow.
+
+    Callbacks run on a worker thread, a slow handler does not delay the
+    polling. A press has to last about slow_interval plus (debounce - 1)
+    fast cycles to be seen; python3 benchmarks/run.py -k buttons measures
+    the missed press rate and bus load against naive polling.
+
+    Parameters
+    -----------
+    api : SixfabPower
+        api instance used for bus access
+    slow_interval : float (optional)
+        poll period in seconds while nothing happens (default is 0.05)
+    fast_interval : float (optional)
+        poll period in seconds while a change is confirmed and fast_period
+        seconds after it (default is 0.01)
+    fast_period : float (optional)
+        seconds to stay on the fast rate after a change (default is 0.5)
+    debounce : int (optional)
+        consecutive identical samples needed to accept a change (default is 2)
+    long_press : float (optional)
+        seconds a button is held for LONG_PRESS (default is 1.0)
+    double_press : float (optional)
+        seconds between a short press ending and the next press starting
+        for DOUBLE_PRESS (default is 0.4)
+    buttons : tuple (optional)
+        buttons to watch, (1,) halves the bus load (default is (1, 2))
+    timeout : int (optional)
+        timeout while receiving each response (default is RESPONSE_DELAY)
+    """
+
+    def __init__(
+        self,
+        api,
+        slow_interval=0.05,
+        fast_interval=0.01,
+        fast_period=0.5,
+        debounce=2,
+        long_press=1.0,
+        double_press=0.4,
+        buttons=(1, 2),
+        timeout=RESPONSE_DELAY,
+    ):
+        self.api = api
+        self.slow_interval = slow_interval
+        self.fast_interval = fast_interval
+        self.fast_period = fast_period
+        self.debounce = max(1, int(debounce))
+        self.long_press = long_press
+        self.double_press = double_press
+        self.timeout = timeout
+
+        getters = {1: api.get_button1_status, 2: api.get_button2_status}
+        self.buttons = [_Button(number, getters[number]) for number in buttons]
+
+        self.polls = 0
+        self.reads = 0
+
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+        self._queue = queue.SimpleQueue()
+        self._worker = None
+        self._fast_until = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    #############################################################
+    ### Callbacks ###############################################
+    #############################################################
+
+    def add_callback(self, callback, event_type=None, button=None):
+        """
+        Function for registering an event callback
+
+        Parameters
+        -----------
+        callback : callable
+            called with a ButtonEvent from the worker thread
+        event_type : int (optional)
+            only deliver events of this type (default is None, all events)
+        button : int (optional)
+            only deliver events of this button (default is None, both)
+        """
+        with self._callbacks_lock:
+            self._callbacks.append((callback, event_type, button))
+
+    def remove_callback(self, callback):
+        """Function for removing a callback registered with add_callback."""
+        with self._callbacks_lock:
+            self._callbacks = [c for c in self._callbacks if c[0] is not callback]
+
+    def _dispatch(self, event):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._deliver, name="ButtonWatcherCallbacks", daemon=True)
+            self._worker.start()
+        self._queue.put(event)
+
+    def _deliver(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                return
+            with self._callbacks_lock:
+                callbacks = list(self._callbacks)
+
+            for callback, event_type, button in callbacks:
+                if event_type is not None and event_type != event.type:
+                    continue
+                if button is not None and button != event.button:
+                    continue
+                try:
+                    callback(event)
+                except Exception:
+                    traceback.print_exc()
+
+    async def events(self, event_type=None, button=None):
+        """
+        Async iterator over button events
+
+        Parameters
+        -----------
+        event_type : int (optional)
+            only yield events of this type (default is None, all events)
+        button : int (optional)
+            only yield events of this button (default is None, both)
+
+        Yields
+        ------
+        event : ButtonEvent
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+
+        def forward(event):
+            loop.call_soon_threadsafe(events.put_nowait, event)
+
+        self.add_callback(forward, event_type, button)
+        try:
+            while True:
+                yield await events.get()
+        finally:
+            self.remove_callback(forward)
+
+    #############################################################
+    ### Polling #################################################
+    #############################################################
+
+    def poll(self, now=None):
+        """
+        Function for sampling the buttons once and updating their state
+
+        Parameters
+        -----------
+        now : float (optional)
+            time.monotonic() value of the sample (default is the current time)
+
+        Returns
+        -------
+        interval : float
+            seconds to wait before the next poll
+        """
+        if now is None:
+            now = time.monotonic()
+        self.polls += 1
+
+        with self.api.bus_session():
+            levels = [button.getter(self.timeout) for button in self.buttons]
+        self.reads += len(levels)
+
+        confirming = False
+        for button, level in zip(self.buttons, levels):
+            if level is not None:
+                self._update(button, level, now)
+            confirming = confirming or button.candidate is not None
+
+        if confirming or now < self._fast_until:
+            return self.fast_interval
+        return self.slow_interval
+
+    def _update(self, button, level, now):
+        pressed = level != Definition.BUTTON_RELEASED
+
+        if pressed == button.pressed:
+            button.candidate = None
+            button.count = 0
+        else:
+            if pressed is not button.candidate:
+                button.candidate = pressed
+                button.count = 0
+                button.since = now
+            button.count += 1
+            if button.count >= self.debounce:
+                button.candidate = None
+                button.count = 0
+                button.pressed = pressed
+                self._fast_until = now + self.fast_period
+                if pressed:
+                    self._press(button, button.since)
+                else:
+                    self._release(button, button.since)
+
+        if (
+            button.pressed
+            and not button.long_sent
+            and (now - button.pressed_at >= self.long_press or level == Definition.BUTTON_LONG_PRESS)
+        ):
+            button.long_sent = True
+            self._dispatch(
+                ButtonEvent(Definition.EVENT_BUTTON_LONG_PRESS, button.number, now - button.pressed_at, now)
+            )
+
+    def _press(self, button, at):
+        button.pressed_at = at
+        button.long_sent = False
+        self._dispatch(ButtonEvent(Definition.EVENT_BUTTON_PRESSED, button.number, 0.0, at))
+
+        button.double = button.released_at is not None and at - button.released_at <= self.double_press
+        if button.double:
+            self._dispatch(ButtonEvent(Definition.EVENT_BUTTON_DOUBLE_PRESS, button.number, 0.0, at))
+
+    def _release(self, button, at):
+        duration = at - button.pressed_at
+        self._dispatch(ButtonEvent(Definition.EVENT_BUTTON_RELEASED, button.number, duration, at))
+        # the second press of a double press does not start another one
+        short = duration < self.long_press and not button.double
+        button.released_at = at if short else None
+
+    def run(self):
+        """Function for polling until stop() is called. Blocks the caller."""
+        while not self._stop.is_set():
+            try:
+                interval = self.poll()
+            except Exception:
+                traceback.print_exc()
+                interval = self.slow_interval
+            if interval > 0:
+                self._stop.wait(interval)
+
+    def start(self):
+        """Function for running the watcher on a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="ButtonWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Function for stopping the watcher thread started with start() and its callback worker."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join(timeout)
+            self._worker = None
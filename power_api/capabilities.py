@@ -0,0 +1,165 @@
+#!/usr/bin/python3
+
+import os
+import json
+import time
+
+from power_api.command import Command, PROTOCOL_FRAME_SIZE
+from power_api.registers import REGISTERS
+from power_api.stats import COMMAND_NAMES
+from power_api.exceptions import response_timeout
+from power_api.power_api import exclusive, delay_ms, RESPONSE_DELAY
+
+# Reads that change the MCU state are never probed and taken as supported:
+# IS_ANY_SOFT_ACTION_EXIST reports a pending soft action once, a probe at
+# daemon start would drop it
+DESTRUCTIVE_READS = frozenset((Command.PROTOCOL_COMMAND_IS_ANY_SOFT_ACTION_EXIST,))
+
+# Read-only commands sent by the probe, with their response size. Commands
+# of other kinds are never sent; a SET_<X> command is taken as supported
+# exactly when GET_<X> is.
+PROBE_COMMANDS = {
+    command_num: PROTOCOL_FRAME_SIZE + length
+    for command_num, (name, length, scale, signed) in REGISTERS.items()
+    if command_num != Command.PROTOCOL_COMMAND_GET_FIRMWARE_VER and command_num not in DESTRUCTIVE_READS
+}
+
+# A command is unsupported when it stays unanswered this many times
+PROBE_ATTEMPTS = 3
+
+
+def default_cache_path():
+    """Function for getting the capability cache file, under $XDG_CACHE_HOME or ~/.cache."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "sixfab-power", "capabilities.json")
+
+
+def load_cache(path):
+    """Function for reading the capability cache, {} when it is missing or broken."""
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def save_cache(path, cache):
+    """Function for writing the capability cache atomically."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def probe_command(command, command_num, size, timeout=RESPONSE_DELAY):
+    """
+    Function for checking whether the firmware answers a read-only command
+
+    Parameters
+    -----------
+    command : Command
+    command_num : int
+        command id from PROBE_COMMANDS
+    size : int
+        response size
+    timeout : int (optional)
+        timeout while receiving each response [ms] (default is RESPONSE_DELAY)
+
+    Returns
+    -------
+    supported : bool
+        True when answered, False when it stayed unanswered for PROBE_ATTEMPTS
+        attempts, None when bus or CRC errors left it undecided
+    """
+    undecided = False
+    for _ in range(PROBE_ATTEMPTS):
+        try:
+            with exclusive(command, command_num):
+                command.create_command(command_num)
+                command.send_command()
+                delay_ms(timeout)
+                raw = command.receive_command(size)
+        except response_timeout:
+            continue
+        except Exception:
+            undecided = True
+            continue
+        # a stale frame of an earlier command does not count as an answer
+        if raw[1] == command_num:
+            return True
+    return None if undecided else False
+
+
+def supported_map(command, timeout=RESPONSE_DELAY):
+    """
+    Function for probing the firmware
+
+    Returns
+    -------
+    result : tuple
+        (unsupported, complete) where unsupported is a set of command ids and
+        complete is False when some command remained undecided
+    """
+    unsupported = set()
+    complete = True
+    for command_num, size in sorted(PROBE_COMMANDS.items()):
+        supported = probe_command(command, command_num, size, timeout)
+        if supported is None:
+            complete = False
+        elif not supported:
+            unsupported.add(command_num)
+    return _with_setters(unsupported), complete
+
+
+def _with_setters(unsupported):
+    ids = {name: command_num for command_num, name in COMMAND_NAMES.items()}
+    result = set(unsupported)
+    for command_num in unsupported:
+        name = COMMAND_NAMES[command_num]
+        if name.startswith("GET_"):
+            setter = ids.get("SET_" + name[len("GET_"):])
+            if setter is not None:
+                result.add(setter)
+    return result
+
+
+def negotiate(api, cache_path=None, refresh=False, timeout=RESPONSE_DELAY):
+    """
+    Function for finding out which commands the firmware of the HAT supports,
+    see SixfabPower.probe_capabilities()
+    """
+    version = api.get_firmware_ver()
+    if version is None:
+        return None
+
+    cache_path = cache_path or default_cache_path()
+    cache = load_cache(cache_path)
+    entry = cache.get(version)
+    cached = not refresh and isinstance(entry, dict) and "unsupported" in entry
+
+    if cached:
+        ids = {name: command_num for command_num, name in COMMAND_NAMES.items()}
+        unsupported = {ids[name] for name in entry["unsupported"] if name in ids}
+    else:
+        unsupported, complete = supported_map(api.command, timeout)
+        # undecided results are probed again next time instead of being kept
+        if complete:
+            cache[version] = {
+                "unsupported": sorted(COMMAND_NAMES[command_num] for command_num in unsupported),
+                "probed": int(time.time()),
+            }
+            try:
+                save_cache(cache_path, cache)
+            except OSError:
+                pass
+
+    api.command.unsupported = frozenset(unsupported)
+    return {
+        "firmware": version,
+        "unsupported": sorted(COMMAND_NAMES[command_num] for command_num in unsupported),
+        "cached": cached,
+    }
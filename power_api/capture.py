@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+
+import os
+import time
+import struct
+
+# Record directions
+SENT = 0
+RECEIVED = 1
+
+# Record outcomes
+OUTCOME_OK = 0
+OUTCOME_CRC = 1
+OUTCOME_BUS = 2
+OUTCOME_INCOMPLETE = 3
+
+# monotonic time [ns], direction, outcome, command id, frame length, frame
+RECORD = struct.Struct("<QBBBB40s")
+RECORD_SIZE = RECORD.size
+MAX_FRAME = 40
+
+FILE_MAGIC = b"SFPCAP1\x00"
+FILE_HEADER = struct.Struct("<8sHI")  # magic, record size, record count
+
+
+class FrameCapture:
+    """
+    Fixed-size ring of sent and received protocol frames.
+
+    Storage is one preallocated bytearray of capacity records, recording a
+    frame is a single struct.pack_into with no allocation besides the frame
+    bytes, so the capture can stay enabled in production. Once the ring is
+    full the oldest records are overwritten.
+
+    Parameters
+    -----------
+    capacity : int (optional)
+        number of records kept (default is 4096, 192 KiB)
+    dump_on_error : str (optional)
+        file written by failed() when a transaction runs out of retries
+    """
+
+    def __init__(self, capacity=4096, dump_on_error=None):
+        self.capacity = capacity
+        self.dump_on_error = dump_on_error
+        self.buffer = bytearray(capacity * RECORD_SIZE)
+        self.count = 0  # records written since creation, index of the next slot
+
+    def record(self, direction, command_id, frame, outcome=OUTCOME_OK):
+        """
+        Function for storing one frame
+
+        Parameters
+        -----------
+        direction : int
+            SENT or RECEIVED
+        command_id : int
+            protocol command id of the frame
+        frame : list/bytes
+            frame bytes, truncated to MAX_FRAME
+        outcome : int (optional)
+            OUTCOME_OK, OUTCOME_CRC, OUTCOME_BUS or OUTCOME_INCOMPLETE
+        """
+        data = bytes(frame[:MAX_FRAME])
+        RECORD.pack_into(
+            self.buffer,
+            (self.count % self.capacity) * RECORD_SIZE,
+            time.monotonic_ns(),
+            direction,
+            outcome,
+            command_id & 0xFF,
+            len(data),
+            data,
+        )
+        self.count += 1
+
+    def clear(self):
+        """Function for dropping all records."""
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def raw(self):
+        """Function for getting the stored records in chronological order as bytes."""
+        if self.count <= self.capacity:
+            return bytes(self.buffer[: self.count * RECORD_SIZE])
+        split = (self.count % self.capacity) * RECORD_SIZE
+        return bytes(self.buffer[split:]) + bytes(self.buffer[:split])
+
+    def records(self):
+        """
+        Function for iterating over the stored records, oldest first
+
+        Yields
+        ------
+        record : tuple
+            (timestamp_ns, direction, outcome, command_id, frame_bytes)
+        """
+        return iter_records(self.raw())
+
+    def dump(self, path):
+        """Function for writing the stored records to a capture file."""
+        data = self.raw()
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(FILE_HEADER.pack(FILE_MAGIC, RECORD_SIZE, len(data) // RECORD_SIZE))
+            f.write(data)
+        os.replace(tmp, path)
+
+    def failed(self):
+        """Function called when a transaction ran out of retries, dumps the ring if configured."""
+        if self.dump_on_error:
+            try:
+                self.dump(self.dump_on_error)
+            except OSError:
+                pass
+
+
+def iter_records(data):
+    """Function for iterating over packed records, see FrameCapture.records()."""
+    for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+        timestamp, direction, outcome, command_id, length, frame = RECORD.unpack_from(data, offset)
+        yield (timestamp, direction, outcome, command_id, frame[:length])
+
+
+def load(path):
+    """
+    Function for reading a capture file written by FrameCapture.dump()
+
+    Returns
+    -------
+    records : list
+        (timestamp_ns, direction, outcome, command_id, frame_bytes) tuples
+    """
+    with open(path, "rb") as f:
+        magic, record_size, count = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if magic != FILE_MAGIC or record_size != RECORD_SIZE:
+            raise ValueError("Not a frame capture file: " + path)
+        data = f.read(count * RECORD_SIZE)
+    return list(iter_records(data))
@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+"""
+Command line interface for the Sixfab Power HAT.
+
+    sixfab-power get battery_level input_power [--json]
+    sixfab-power set fan_mode 3
+    sixfab-power snapshot [--json]
+    sixfab-power watch --hz 5 [battery_level input_power ...]
+
+All queries of one invocation share a single bus session. Modules that are
+not needed for every call (json, the emulator) are imported on demand, so
+the command starts quickly enough to be called from shell scripts and
+systemd units. See the README for the cold-start budget.
+"""
+
+import sys
+import time
+import argparse
+import contextlib
+
+from power_api.power_api import SixfabPower, SNAPSHOT_FIELDS
+from power_api.definitions import Definition
+from power_api.exceptions import daemon_request_failed
+
+
+def _api(args):
+    if args.socket:
+        from power_api.daemon import SixfabPowerClient
+
+        return SixfabPowerClient(args.socket)
+    if args.emulator:
+        from power_api.emulator import EmulatedBus
+
+        return SixfabPower(bus=EmulatedBus())
+    api = SixfabPower()
+    api.enable_bus_lock()
+    return api
+
+
+def _getter(api, name):
+    getter = getattr(api, "get_" + name, None)
+    if getter is None or name == "snapshot":
+        raise SystemExit("sixfab-power: unknown value: " + name)
+    return getter
+
+
+def _query(api, names, timeout):
+    values = {"timestamp": time.time()}
+    # the daemon client has no bus of its own
+    session = api.bus_session() if isinstance(api, SixfabPower) else contextlib.nullcontext()
+    with session:
+        for name in names:
+            getter = _getter(api, name)
+            if timeout is None:
+                values[name] = getter()
+            else:
+                values[name] = getter(timeout=timeout)
+    return values
+
+
+def _parse_value(text):
+    """Function for converting an argument to int, float or a Definition constant."""
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+
+    value = getattr(Definition, text.upper(), None)
+    if value is None:
+        raise SystemExit("sixfab-power: invalid value: " + text)
+    return value
+
+
+def _output(values, as_json, out=sys.stdout):
+    if as_json:
+        import json
+
+        out.write(json.dumps(values, default=str) + "\n")
+        return
+    for name, value in values.items():
+        if name != "timestamp":
+            out.write("{} {}\n".format(name, "" if value is None else value))
+
+
+def _failed(values):
+    return any(value is None for value in values.values())
+
+
+def cmd_get(args):
+    api = _api(args)
+    values = _query(api, args.names, args.timeout)
+    _output(values, args.json)
+    return 1 if _failed(values) else 0
+
+
+def cmd_set(args):
+    api = _api(args)
+    setter = getattr(api, "set_" + args.name, None)
+    if setter is None:
+        raise SystemExit("sixfab-power: unknown setting: " + args.name)
+
+    values = [_parse_value(value) for value in args.values]
+    if args.timeout is None:
+        result = setter(*values)
+    else:
+        result = setter(*values, timeout=args.timeout)
+
+    _output({"timestamp": time.time(), args.name: result}, args.json)
+    return 0 if result == 1 else 1
+
+
+def cmd_snapshot(args):
+    api = _api(args)
+    values = _query(api, SNAPSHOT_FIELDS, args.timeout)
+    _output(values, args.json)
+    return 1 if _failed(values) else 0
+
+
+def cmd_watch(args):
+    api = _api(args)
+    names = args.names or SNAPSHOT_FIELDS
+    for name in names:
+        _getter(api, name)
+
+    interval = 1.0 / args.hz
+    deadline = time.monotonic()
+    count = 0
+    try:
+        while args.count is None or count < args.count:
+            values = _query(api, names, args.timeout)
+            if args.json:
+                _output(values, True)
+            else:
+                line = " ".join("{}={}".format(name, values[name]) for name in names)
+                sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+            count += 1
+
+            # fixed rate, a slow bus skips ticks instead of drifting
+            deadline += interval
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="sixfab-power", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--timeout", type=int, help="response timeout of each query [ms]")
+    parser.add_argument("--emulator", action="store_true", help="talk to power_api.emulator instead of the HAT")
+    parser.add_argument("--socket", help="go through the sixfab-powerd daemon listening on this socket")
+    sub = parser.add_subparsers(dest="command", metavar="command")
+    sub.required = True
+
+    p = sub.add_parser("get", help="read one or more values, e.g. battery_level input_power")
+    p.add_argument("names", nargs="+")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_get)
+
+    p = sub.add_parser("set", help="change a setting, e.g. fan_mode 1 or rgb_animation rgb_heartbeat green rgb_normal")
+    p.add_argument("name")
+    p.add_argument("values", nargs="+")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_set)
+
+    p = sub.add_parser("snapshot", help="read all sensor values")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_snapshot)
+
+    p = sub.add_parser("watch", help="print values periodically until interrupted")
+    p.add_argument("names", nargs="*")
+    p.add_argument("--hz", type=float, default=1.0, help="samples per second (default is 1)")
+    p.add_argument("--count", type=int, help="stop after this many samples")
+    p.add_argument("--json", action="store_true", help="one JSON object per line")
+    p.set_defaults(func=cmd_watch)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except BrokenPipeError:
+        # output piped into head etc.
+        return 0
+    except (daemon_request_failed, OSError) as e:
+        sys.stderr.write("sixfab-power: {}\n".format(e))
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+#!/usr/bin/python3
+
+import os
+import json
+import time
+import datetime
+import collections
+
+from power_api.definitions import Definition
+
+# Written by systemd-timesyncd once the system clock is synchronized
+TIMESYNC_FLAG = "/run/systemd/timesync/synchronized"
+
+STATE_VERSION = 1
+
+
+def system_clock_synchronized():
+    """
+    Function for checking if the system clock is NTP synchronized, without
+    running timedatectl
+
+    Returns
+    -------
+    synchronized : bool
+    """
+    return os.path.exists(TIMESYNC_FLAG)
+
+
+def format_time(timestamp, format=Definition.TIME_FORMAT_DATE_AND_TIME):
+    """
+    Function for formatting an RTC epoch like get_rtc_time() does, so one
+    RTC read can be shown in several formats
+
+    Parameters
+    -----------
+    timestamp : int
+        epoch time
+    format : Definition Object Property
+        --> Definition.TIME_FORMAT_EPOCH
+        --> Definition.TIME_FORMAT_DATE_AND_TIME
+        --> Definition.TIME_FORMAT_DATE
+        --> Definition.TIME_FORMAT_TIME
+
+    Returns
+    -------
+    timestamp : int/str
+        time in chosen format
+    """
+    if format == Definition.TIME_FORMAT_EPOCH:
+        return timestamp
+    value = datetime.datetime.utcfromtimestamp(timestamp)
+    if format == Definition.TIME_FORMAT_DATE:
+        return value.strftime("%Y-%m-%d")
+    if format == Definition.TIME_FORMAT_TIME:
+        return value.strftime("%H:%M:%S")
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+class ClockDiscipline:
+    """
+    Keeps the HAT RTC and the system clock in line with few bus transactions.
+
+    Each measure() is one get_rtc_time() bracketed by time.monotonic()
+    readings. The RTC counts whole seconds, so an offset sample is the
+    midpoint of the interval it can lie in, with half of it as uncertainty.
+    A least-squares fit over the last samples gives the RTC drift, and the
+    RTC is only written when the offset is larger than threshold. The
+    system clock is set with time.clock_settime instead of timedatectl.
+
+    Setting either clock starts a new drift estimate. Without a path the
+    samples only live as long as the object, so a script that runs once
+    per boot or from cron never sees two of them; with a path they are
+    kept in a small state file on the system clock's time base and
+    loaded again by the next run.
+
+    Parameters
+    -----------
+    api : SixfabPower
+    threshold : float (optional)
+        offset in seconds above which a clock is corrected (default is 2)
+    window : int (optional)
+        number of offset samples used for the drift estimate (default is 16)
+    path : str (optional)
+        state file for the offset samples (default is None, no persistence)
+    """
+
+    def __init__(self, api, threshold=2.0, window=16, path=None):
+        self.api = api
+        self.threshold = threshold
+        self.path = path
+        self.samples = collections.deque(maxlen=window)  # (monotonic, offset)
+        self.last = None
+        if path is not None:
+            self.load()
+
+    #############################################################
+    ### State file ##############################################
+    #############################################################
+
+    def save(self, path=None):
+        """Function for writing the offset samples to path (default is self.path) atomically."""
+        path = path or self.path
+        # monotonic time restarts with every boot, the file uses epoch seconds
+        base = time.time() - time.monotonic()
+        state = {
+            "version": STATE_VERSION,
+            "samples": [(t + base, offset) for t, offset in self.samples],
+        }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def load(self, path=None):
+        """
+        Function for reading the offset samples written by save()
+
+        Returns
+        -------
+        loaded : bool
+            False when the file is missing or not a state file
+        """
+        path = path or self.path
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+            return False
+
+        base = time.time() - time.monotonic()
+        self.samples.clear()
+        for epoch, offset in state.get("samples", []):
+            self.samples.append((float(epoch) - base, float(offset)))
+        return True
+
+    def measure(self, timeout=None):
+        """
+        Function for measuring the RTC - system clock offset with one RTC read
+
+        Parameters
+        -----------
+        timeout : int (optional)
+            timeout of get_rtc_time() [ms] (default is the getter's default)
+
+        Returns
+        -------
+        sample : dict
+            {"rtc": epoch, "system": system time of the read, "offset": rtc - system
+            [s], "uncertainty": [s]} or None when the RTC could not be read
+        """
+        before = time.monotonic()
+        if timeout is None:
+            rtc = self.api.get_rtc_time()
+        else:
+            rtc = self.api.get_rtc_time(timeout=timeout)
+        after = time.monotonic()
+        wall = time.time()
+
+        if rtc is None:
+            return None
+
+        middle = (before + after) / 2.0
+        system = wall - (after - middle)
+        # the RTC shows rtc during [rtc, rtc + 1)
+        offset = rtc + 0.5 - system
+        sample = {
+            "rtc": rtc,
+            "system": system,
+            "offset": offset,
+            "uncertainty": 0.5 + (after - before) / 2.0,
+        }
+        self.samples.append((middle, offset))
+        self.last = sample
+        if self.path is not None:
+            self.save()
+        return sample
+
+    @property
+    def drift(self):
+        """RTC drift relative to the system clock [s/s], None before two samples some time apart."""
+        n = len(self.samples)
+        if n < 2:
+            return None
+        mean_t = sum(t for t, _ in self.samples) / n
+        mean_o = sum(o for _, o in self.samples) / n
+        var = sum((t - mean_t) ** 2 for t, _ in self.samples)
+        if var < 1.0:
+            return None
+        cov = sum((t - mean_t) * (o - mean_o) for t, o in self.samples)
+        return cov / var
+
+    def offset(self, at=None):
+        """
+        Function for predicting the offset without reading the RTC
+
+        Parameters
+        -----------
+        at : float (optional)
+            time.monotonic() value (default is now)
+
+        Returns
+        -------
+        offset : float
+            rtc - system [s], None before the first measure()
+        """
+        if not self.samples:
+            return None
+        if at is None:
+            at = time.monotonic()
+        t, offset = self.samples[-1]
+        drift = self.drift
+        if drift is not None:
+            offset += drift * (at - t)
+        return offset
+
+    def sync_rtc(self, reference=None, force=False, align=True):
+        """
+        Function for writing the RTC when it is off by more than threshold
+
+        Parameters
+        -----------
+        reference : float (optional)
+            current time in epoch seconds, e.g. from GPS (default is the system clock)
+        force : bool (optional)
+            write even within threshold (default is False)
+        align : bool (optional)
+            write right after a second boundary so the RTC starts in phase (default is True)
+
+        Returns
+        -------
+        written : bool
+            True when the RTC was set successfully
+        """
+        if reference is None:
+            sample = self.measure()
+            if sample is None:
+                return False
+            error = sample["offset"]
+            shift = 0.0
+        else:
+            shift = reference - time.time()
+            sample = self.measure()
+            error = None if sample is None else sample["offset"] - shift
+
+        if not force and error is not None and abs(error) <= self.threshold:
+            return False
+
+        now = time.time() + shift
+        if align:
+            time.sleep(1.0 - (now % 1.0))
+            now = time.time() + shift
+
+        written = self.api.set_rtc_time(int(round(now))) == Definition.SET_OK
+        if written:
+            self.samples.clear()
+            if self.path is not None:
+                self.save()
+        return written
+
+    def sync_system(self, reference=None, force=False):
+        """
+        Function for setting the system clock when it is off by more than threshold.
+        Needs CAP_SYS_TIME (root); an NTP daemon should not be running meanwhile.
+
+        Parameters
+        -----------
+        reference : float (optional)
+            current time in epoch seconds, e.g. from GPS (default is the RTC)
+        force : bool (optional)
+            set even within threshold (default is False)
+
+        Returns
+        -------
+        correction : float
+            seconds added to the system clock, None when it was not changed
+        """
+        if reference is None:
+            sample = self.measure()
+            if sample is None:
+                return None
+            correction = sample["offset"]
+        else:
+            correction = reference - time.time()
+
+        if not force and abs(correction) <= self.threshold:
+            return None
+
+        time.clock_settime(time.CLOCK_REALTIME, time.time() + correction)
+        self.samples.clear()
+        if self.path is not None:
+            self.save()
+        return correction
@@ -1,20 +1,35 @@
 #!/usr/bin/python3
 
-from power_api.exceptions import crc_check_failed
+from power_api.exceptions import (
+    crc_check_failed,
+    bus_error,
+    device_not_found,
+    response_timeout,
+    invalid_argument,
+)
+from power_api.capture import (
+    SENT,
+    RECEIVED,
+    OUTCOME_CRC,
+    OUTCOME_BUS,
+    OUTCOME_INCOMPLETE,
+)
 
-import smbus2
 import time
 import struct
+import threading
 import crc16
 
-bus = smbus2.SMBus(1)
+# Guards the creation of Command._calls
+_calls_lock = threading.Lock()
+
+# Default bus, opened on first use so that importing the API does not
+# require /dev/i2c-1 (see get_default_bus)
+bus = None
 
 #############################################################
 ### Communication Protocol ##################################
 #############################################################
-buffer_send = list()
-buffer_receive = list()
-buffer_receive_index = 0
 
 
 START_BYTE_RECIEVED = 0xDC  # Start Byte Recieved
@@ -36,6 +51,50 @@ COMMAND_TYPE_RESPONSE = 0x02
 DEVICE_ADDRESS = 0x41  # 7 bit address (will be left shifted to add the read write bit)
 BATTERY_TEMP_ADDRESS = 0x48 # This one uses when the battery holder is seperated from HAT.
 
+
+def get_default_bus():
+    """Function for getting the shared smbus2.SMBus(1) instance, opening it on first use."""
+    global bus
+    if bus is None:
+        import smbus2
+
+        try:
+            bus = smbus2.SMBus(1)
+        except OSError as e:
+            raise device_not_found("I2C bus 1 is not available: {}".format(e), e.errno) from e
+    return bus
+
+
+def _crc16_xmodem_table():
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return table
+
+
+CRC16_TABLE = _crc16_xmodem_table()
+
+
+def crc16_xmodem(data, crc=0):
+    """Function for calculating CRC-16/XMODEM in pure Python."""
+    table = CRC16_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFF00) ^ table[(crc >> 8) ^ byte]
+    return crc
+
+
+# The crc16 C extension fails on Python >= 3.10 (PY_SSIZE_T_CLEAN), fall
+# back to the table implementation there.
+try:
+    crc16.crc16xmodem(b"\x00")
+except SystemError:
+    _crc16 = crc16_xmodem
+else:
+    _crc16 = crc16.crc16xmodem
+
 class Command:
     """ 
     Command class for provide i2c communication requirements 
@@ -140,191 +199,283 @@ class Command:
     PROTOCOL_COMMAND_RESET_MCU_FOR_BOOT_UPDATE = 206
     PROTOCOL_COMMAND_RESTORE_FACTORY_SETTINGS = 207
 
+    # Error handling, see SixfabPower(strict=True) and last_error()
+    strict = False
+    last_error = None
+    absent_until = None  # time.monotonic() until which the HAT is known to be absent
+    unsupported = frozenset()  # command ids the firmware lacks, see SixfabPower.probe_capabilities()
+
+    # Instrumentation, see SixfabPower.enable_stats() and add_hook(). These
+    # are class level defaults replaced per instance when set, so a Command
+    # that never uses them costs no more than the bus and buffers. The hooks
+    # are tuples replaced as a whole, a transaction iterating over them is
+    # not disturbed by a hook added from another thread.
+    stats = None
+    capture = None
+    scheduler = None
+    lock = None
+    _calls = None  # per thread deadline, retry_budget and attempts, created on first use
+    pre_hooks = ()
+    post_hooks = ()
+
     # Initializer function
-    def __init__(self):
+    def __init__(self, bus=None):
         # print("Command Class initialized!")
-        pass
+        self.bus = bus
+        self.buffer_send = list()
+        self.buffer_receive = list()
+        self.buffer_receive_index = 0
+
+    # deadline, retry_budget and attempts belong to the thread that set
+    # them, other threads sharing the command keep their own (or none)
+
+    def _call_state(self):
+        if self._calls is None:
+            with _calls_lock:
+                if self._calls is None:
+                    self._calls = threading.local()
+        return self._calls
+
+    @property
+    def deadline(self):
+        """time.monotonic() limit of the calling thread's transactions, see SixfabPower.shutdown_sequence()"""
+        calls = self._calls
+        return None if calls is None else getattr(calls, "deadline", None)
+
+    @deadline.setter
+    def deadline(self, value):
+        self._call_state().deadline = value
+
+    @property
+    def retry_budget(self):
+        """retries left to the calling thread's transactions, see SixfabPower.execute_batch()"""
+        calls = self._calls
+        return None if calls is None else getattr(calls, "retry_budget", None)
+
+    @retry_budget.setter
+    def retry_budget(self, value):
+        self._call_state().retry_budget = value
+
+    @property
+    def attempts(self):
+        """bus attempts of the calling thread's transactions since it was set to 0, None while not counted"""
+        calls = self._calls
+        return None if calls is None else getattr(calls, "attempts", None)
+
+    @attempts.setter
+    def attempts(self, value):
+        self._call_state().attempts = value
 
     def __del__(self):
         # print("Command Class Destructed")
         pass
 
+    def get_bus(self):
+        """Function for getting the bus of this instance, the shared SMBus(1) by default."""
+        if self.bus is None:
+            self.bus = get_default_bus()
+        return self.bus
+
     #############################################################
     ### I2C Protocol Functions ##################################
     #############################################################
 
     # Function for sending command
     def send_command(self):
-        global buffer_send
         # print("Sent Command:")
-        # print('[{}]'.format(', '.join(hex(x) for x in buffer_send)))
+        # print('[{}]'.format(', '.join(hex(x) for x in self.buffer_send)))
+        i2c = self.get_bus()
         try:
-            bus.write_i2c_block_data(DEVICE_ADDRESS, 0x01, buffer_send)
-        except:
-            raise RuntimeError
+            i2c.write_i2c_block_data(DEVICE_ADDRESS, 0x01, self.buffer_send)
+        except Exception as e:
+            if self.capture is not None:
+                self.capture.record(SENT, self.buffer_send[1], self.buffer_send, OUTCOME_BUS)
+            raise bus_error("Sending the request failed: {}".format(e), getattr(e, "errno", None)) from e
+
+        if self.capture is not None:
+            self.capture.record(SENT, self.buffer_send[1], self.buffer_send)
 
     # Function for checking command according to protocol
     def check_command(self, received_byte):
-        global buffer_receive
-        global buffer_receive_index
         datalen = 0
 
-        if buffer_receive_index == 0 and received_byte != START_BYTE_RECIEVED:
+        if self.buffer_receive_index == 0 and received_byte != START_BYTE_RECIEVED:
             return -1
 
-        buffer_receive.append(received_byte)
-        buffer_receive_index += 1
+        self.buffer_receive.append(received_byte)
+        self.buffer_receive_index += 1
 
-        if buffer_receive_index < PROTOCOL_HEADER_SIZE:
+        if self.buffer_receive_index < PROTOCOL_HEADER_SIZE:
             return -1
 
-        datalen = (buffer_receive[3] << 8) | buffer_receive[4]
+        datalen = (self.buffer_receive[3] << 8) | self.buffer_receive[4]
 
         if datalen > 32:
             # print("="*50)
-            # print('[{}]'.format(', '.join(hex(x) for x in buffer_receive)))
-            buffer_receive_index = 0
-            buffer_receive.clear()
+            # print('[{}]'.format(', '.join(hex(x) for x in self.buffer_receive)))
+            self.buffer_receive_index = 0
+            self.buffer_receive.clear()
 
-        if buffer_receive_index == (PROTOCOL_FRAME_SIZE + datalen):
+        if self.buffer_receive_index == (PROTOCOL_FRAME_SIZE + datalen):
 
             crc_received = (
-                buffer_receive[PROTOCOL_FRAME_SIZE + datalen - 2] << 8
-            ) | buffer_receive[PROTOCOL_FRAME_SIZE + datalen - 1]
+                self.buffer_receive[PROTOCOL_FRAME_SIZE + datalen - 2] << 8
+            ) | self.buffer_receive[PROTOCOL_FRAME_SIZE + datalen - 1]
             # print("CRC Received: " + str(crc_received))
 
             crc_calculated = self.calculate_crc16(
-                buffer_receive[0 : PROTOCOL_HEADER_SIZE + datalen], 1
+                self.buffer_receive[0 : PROTOCOL_HEADER_SIZE + datalen], 1
             )
             # print("CRC Calculated: " + str(crc_calculated))
 
             if crc_calculated == crc_received:
                 # print("CRC Check OK")
-                # print('[{}]'.format(', '.join(hex(x) for x in buffer_receive)))
-                buffer_receive_index = 0
-                return buffer_receive[0 : PROTOCOL_FRAME_SIZE + datalen]
+                # print('[{}]'.format(', '.join(hex(x) for x in self.buffer_receive)))
+                self.buffer_receive_index = 0
+                return self.buffer_receive[0 : PROTOCOL_FRAME_SIZE + datalen]
             else:
-                print("CRC Check FAILED!")
-                buffer_receive_index = 0
+                # print("CRC Check FAILED!")
+                self.buffer_receive_index = 0
                 raise crc_check_failed("CRC check failed!")
 
     # Function for receiving command
     def receive_command(self, len_of_response):
-        global buffer_receive
+        i2c = self.get_bus()
+
+        # drop leftovers of a previous failed or incomplete frame
+        self.buffer_receive.clear()
+        self.buffer_receive_index = 0
 
         for i in range(len_of_response):
 
             try:
-                c = bus.read_byte(DEVICE_ADDRESS)
-            except:
+                c = i2c.read_byte(DEVICE_ADDRESS)
+            except Exception as e:
                 # print("error in " + str(i))
-                raise RuntimeError
+                self.capture_received(OUTCOME_BUS)
+                raise bus_error("Reading the response failed: {}".format(e), getattr(e, "errno", None)) from e
 
             # print("Recieved byte: " + str(hex(c)))
-            msg = self.check_command(c)
+            try:
+                msg = self.check_command(c)
+            except crc_check_failed:
+                self.capture_received(OUTCOME_CRC)
+                raise
 
         if msg != None and msg != -1 and msg != self.CRC_CHECK_FAILED:
-            buffer_receive.clear()
+            if self.capture is not None:
+                self.capture.record(RECEIVED, msg[1], msg)
+            self.buffer_receive.clear()
             return msg
         elif msg == self.CRC_CHECK_FAILED:
             raise crc_check_failed("CRC check failed!")
         else:
-            raise RuntimeError
+            self.capture_received(OUTCOME_INCOMPLETE)
+            raise response_timeout("No complete response within {} bytes".format(len_of_response))
+
+    # Function for storing the receive buffer in the frame capture
+    def capture_received(self, outcome):
+        if self.capture is None:
+            return
+        if len(self.buffer_receive) > 1:
+            command_id = self.buffer_receive[1]
+        elif len(self.buffer_send) > 1:
+            command_id = self.buffer_send[1]
+        else:
+            command_id = 0
+        self.capture.record(RECEIVED, command_id, self.buffer_receive, outcome)
 
     # Function for creating command according to protocol
     def create_command(self, command, command_type=COMMAND_TYPE_REQUEST):
-        global buffer_send
-        buffer_send.clear()
-        buffer_send.append(START_BYTE_SENT)
-        buffer_send.append(command)
-        buffer_send.append(command_type)
-        buffer_send.append(0x00)
-        buffer_send.append(0x00)
-        (crc_high, crc_low) = self.calculate_crc16(buffer_send[0:PROTOCOL_HEADER_SIZE])
-        buffer_send.append(crc_high)
-        buffer_send.append(crc_low)
+        self.buffer_send.clear()
+        self.buffer_send.append(START_BYTE_SENT)
+        self.buffer_send.append(command)
+        self.buffer_send.append(command_type)
+        self.buffer_send.append(0x00)
+        self.buffer_send.append(0x00)
+        (crc_high, crc_low) = self.calculate_crc16(self.buffer_send[0:PROTOCOL_HEADER_SIZE])
+        self.buffer_send.append(crc_high)
+        self.buffer_send.append(crc_low)
 
     # Function for creating set command according to protocol
     def create_set_command(
         self, command, value, len_byte, command_type=COMMAND_TYPE_REQUEST
     ):
-        global buffer_send
-        buffer_send.clear()
-        buffer_send.append(START_BYTE_SENT)
-        buffer_send.append(command)
-        buffer_send.append(command_type)
+        self.buffer_send.clear()
+        self.buffer_send.append(START_BYTE_SENT)
+        self.buffer_send.append(command)
+        self.buffer_send.append(command_type)
 
         len_low = len_byte & 0xFF
         len_high = (len_byte >> 8) & 0xFF
 
-        buffer_send.append(len_high)
-        buffer_send.append(len_low)
+        self.buffer_send.append(len_high)
+        self.buffer_send.append(len_low)
 
         if isinstance(value, int):
             byte_array = value.to_bytes(len_byte, "big")
-        elif isinstance(value, bytearray):
+        elif isinstance(value, (bytes, bytearray)):
             byte_array = value
         else:
-            print("Wrong parameter for CreateSetComamnd!")
+            raise invalid_argument("Set command value must be int or bytearray, not {}".format(type(value).__name__))
 
         for i in range(len_byte):
-            buffer_send.append(int(byte_array[i]))
+            self.buffer_send.append(int(byte_array[i]))
 
-        # print(buffer_send)
+        # print(self.buffer_send)
 
         (crc_high, crc_low) = self.calculate_crc16(
-            buffer_send[0 : PROTOCOL_HEADER_SIZE + len_byte]
+            self.buffer_send[0 : PROTOCOL_HEADER_SIZE + len_byte]
         )
-        buffer_send.append(crc_high)
-        buffer_send.append(crc_low)
-        # print(buffer_send)
+        self.buffer_send.append(crc_high)
+        self.buffer_send.append(crc_low)
+        # print(self.buffer_send)
 
     def create_firmware_update_command(
         self, packet_count, packet_id, packet, packet_len=FIRMWARE_PACKET_LEN
     ):
 
-        global buffer_send
-        buffer_send.clear()
-        buffer_send.append(START_BYTE_SENT)
-        buffer_send.append(self.PROTOCOL_COMMAND_FIRMWARE_UPDATE)
-        buffer_send.append(COMMAND_TYPE_REQUEST)
+        self.buffer_send.clear()
+        self.buffer_send.append(START_BYTE_SENT)
+        self.buffer_send.append(self.PROTOCOL_COMMAND_FIRMWARE_UPDATE)
+        self.buffer_send.append(COMMAND_TYPE_REQUEST)
 
         datalen = packet_len + 4  # packet_len + packet_id_len + packet_count_len
         len_low = datalen & 0xFF
         len_high = (datalen >> 8) & 0xFF
 
-        buffer_send.append(len_high)
-        buffer_send.append(len_low)
+        self.buffer_send.append(len_high)
+        self.buffer_send.append(len_low)
 
         packet_count_high = (packet_count >> 8) & 0xFF
         packet_count_low = packet_count & 0xFF
 
-        buffer_send.append(packet_count_high)
-        buffer_send.append(packet_count_low)
+        self.buffer_send.append(packet_count_high)
+        self.buffer_send.append(packet_count_low)
 
         packet_id_high = (packet_id >> 8) & 0xFF
         packet_id_low = packet_id & 0xFF
 
-        buffer_send.append(packet_id_high)
-        buffer_send.append(packet_id_low)
+        self.buffer_send.append(packet_id_high)
+        self.buffer_send.append(packet_id_low)
 
         for i in range(packet_len):
             try:
-                buffer_send.append(packet[i])
+                self.buffer_send.append(packet[i])
             except:
                 pass
 
-        # print(buffer_send)
+        # print(self.buffer_send)
         (crc_high, crc_low) = self.calculate_crc16(
-            buffer_send[0 : PROTOCOL_HEADER_SIZE + len_low]
+            self.buffer_send[0 : PROTOCOL_HEADER_SIZE + len_low]
         )
-        buffer_send.append(crc_high)
-        buffer_send.append(crc_low)
-        # print(buffer_send)
+        self.buffer_send.append(crc_high)
+        self.buffer_send.append(crc_low)
+        # print(self.buffer_send)
 
     # Function for calculating CRC16
     def calculate_crc16(self, command, return_type=0):
-        cal_crc = crc16.crc16xmodem(bytes(command))
+        cal_crc = _crc16(bytes(command))
         crc_high = (cal_crc >> 8) & 0xFF
         crc_low = cal_crc & 0xFF
         # print("CRC16: " + str(cal_crc) + "\t" + "CRC16 High: " + str(crc_high) + "\t" + "CRC16 Low: " + str(crc_low))
@@ -336,7 +487,7 @@ class Command:
 
     def read_word_data(self, address):
         try:
-            word = bus.read_i2c_block_data(address, 0, 2)
+            word = self.get_bus().read_i2c_block_data(address, 0, 2)
         except:
             return -1
         else:
@@ -0,0 +1,512 @@
+#!/usr/bin/python3
+"""
+Bus-owning daemon for the Sixfab Power HAT.
+
+    sixfab-powerd [--socket /run/sixfab-power.sock] [--mode 0660]
+
+The daemon is the only process talking to the HAT; other processes use
+SixfabPowerClient, which mirrors the SixfabPower methods, over a Unix socket.
+The protocol is one JSON object per line:
+
+    request   {"id": 1, "method": "get_battery_level", "args": [], "kwargs": {}, "max_age": 2.0}
+    response  {"id": 1, "result": 85}   or   {"id": 1, "error": "..."}
+
+Identical get_* requests that arrive while the same read is on the bus wait
+for that transaction instead of starting another one. With max_age (seconds)
+a get_* request may be answered from the last result if it is not older.
+Any other method is executed exclusively and clears the cache.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import threading
+import socketserver
+
+from power_api.exceptions import daemon_request_failed
+
+DEFAULT_SOCKET = os.environ.get("SIXFAB_POWER_SOCKET", "/run/sixfab-power.sock")
+
+# Methods served over the socket. Everything else is refused: the daemon
+# usually runs as root, and methods like execute_batch(), shutdown_sequence(),
+# probe_capabilities(cache_path=...), restore_factory_defaults() or the
+# firmware commands would give any client that can reach the socket more
+# than reading and configuring the HAT. Cutting or cycling the power, moving
+# the clock and scheduling events (which can do both) are POWER_CONTROL_METHODS,
+# served only with sixfab-powerd --allow-power-control
+ALLOWED_METHODS = frozenset(
+    (
+        "get_battery_current",
+        "get_battery_design_capacity",
+        "get_battery_health",
+        "get_battery_level",
+        "get_battery_max_charge_level",
+        "get_battery_power",
+        "get_battery_separation_status",
+        "get_battery_temp",
+        "get_battery_voltage",
+        "get_button1_status",
+        "get_button2_status",
+        "get_debug_config",
+        "get_edm_status",
+        "get_end_device_alive_threshold",
+        "get_fan_automation",
+        "get_fan_health",
+        "get_fan_mode",
+        "get_fan_speed",
+        "get_firmware_ver",
+        "get_input_current",
+        "get_input_power",
+        "get_input_temp",
+        "get_input_voltage",
+        "get_lpm_status",
+        "get_power_outage_event_status",
+        "get_power_outage_params",
+        "get_rgb_animation",
+        "get_rtc_time",
+        "get_safe_shutdown_battery_level",
+        "get_safe_shutdown_status",
+        "get_scheduled_event_ids",
+        "get_snapshot",
+        "get_system_current",
+        "get_system_power",
+        "get_system_temp",
+        "get_system_voltage",
+        "get_watchdog_interval",
+        "get_watchdog_status",
+        "get_working_mode",
+        "set_battery_design_capacity",
+        "set_battery_max_charge_level",
+        "set_battery_separation_status",
+        "set_debug_config",
+        "set_edm_status",
+        "set_end_device_alive_threshold",
+        "set_fan_automation",
+        "set_fan_mode",
+        "set_fan_speed",
+        "set_lpm_status",
+        "set_power_outage_event_status",
+        "set_power_outage_params",
+        "set_rgb_animation",
+        "set_safe_shutdown_battery_level",
+        "set_safe_shutdown_status",
+        "set_watchdog_interval",
+        "set_watchdog_status",
+        "remove_scheduled_event",
+        "remove_all_scheduled_events",
+        "is_any_soft_action_exist",
+        "watchdog_signal",
+        "send_system_temp",
+        "send_battery_temperature",
+        "stats",
+    )
+)
+
+POWER_CONTROL_METHODS = frozenset(
+    (
+        "hard_power_off",
+        "hard_power_on",
+        "hard_reboot",
+        "soft_power_off",
+        "soft_power_on",
+        "soft_reboot",
+        "set_rtc_time",
+        "create_scheduled_event",
+    )
+)
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class PowerDaemon:
+    """
+    Serializes, coalesces and caches SixfabPower calls of several clients.
+
+    Parameters
+    -----------
+    api : SixfabPower
+        API instance owning the bus
+    allow_power_control : bool (optional)
+        also serve POWER_CONTROL_METHODS (default is False)
+    """
+
+    def __init__(self, api, allow_power_control=False):
+        self.api = api
+        self.allowed = ALLOWED_METHODS | POWER_CONTROL_METHODS if allow_power_control else ALLOWED_METHODS
+        self.bus_lock = threading.Lock()
+        self.inflight_lock = threading.Lock()
+        self.inflight = {}
+        self.cache = {}
+
+        self.requests = 0
+        self.transactions = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    def _method(self, name):
+        if name not in self.allowed:
+            if name in POWER_CONTROL_METHODS:
+                raise daemon_request_failed("Power control is disabled, see sixfab-powerd --allow-power-control: " + name)
+            raise daemon_request_failed("Unsupported method: " + str(name))
+        func = getattr(self.api, name, None)
+        if func is None or not callable(func):
+            raise daemon_request_failed("Unknown method: " + str(name))
+        return func
+
+    def _execute(self, func, args, kwargs, cache_key=None, clear_cache=False):
+        # the cache is updated under the bus lock: a result stored after the
+        # release could land after a setter cleared the cache and outlive it
+        with self.bus_lock:
+            self.transactions += 1
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                if clear_cache:
+                    self.cache.clear()
+            if cache_key is not None and result is not None:
+                self.cache[cache_key] = (time.monotonic(), result)
+            return result
+
+    def call(self, name, args=(), kwargs=None, max_age=None):
+        """
+        Function for executing one API call on behalf of a client
+
+        Parameters
+        -----------
+        name : str
+            SixfabPower method name
+        args : list (optional)
+            positional arguments
+        kwargs : dict (optional)
+            keyword arguments
+        max_age : float (optional)
+            accept a cached get_* result up to this many seconds old
+
+        Returns
+        -------
+        result : any
+            return value of the method
+        """
+        if name == "daemon_stats":
+            return self.stats()
+
+        func = self._method(name)
+        kwargs = kwargs or {}
+        self.requests += 1
+
+        if not name.startswith("get_"):
+            return self._execute(func, args, kwargs, clear_cache=True)
+
+        key = (name, json.dumps([args, kwargs], sort_keys=True))
+        if max_age is not None:
+            entry = self.cache.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= max_age:
+                self.cache_hits += 1
+                return entry[1]
+
+        with self.inflight_lock:
+            call = self.inflight.get(key)
+            owner = call is None
+            if owner:
+                call = self.inflight[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if owner:
+            try:
+                call.result = self._execute(func, args, kwargs, cache_key=key)
+            except Exception as e:
+                call.error = e
+            finally:
+                with self.inflight_lock:
+                    del self.inflight[key]
+                call.event.set()
+        else:
+            call.event.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        """Function for getting the request, transaction, coalescing and cache counters."""
+        return {
+            "requests": self.requests,
+            "transactions": self.transactions,
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+        }
+
+    def handle_line(self, line):
+        """Function for answering one JSON request line, returns the response line."""
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            result = self.call(
+                request["method"],
+                request.get("args") or (),
+                request.get("kwargs"),
+                request.get("max_age"),
+            )
+            response = {"id": request_id, "result": result}
+        except Exception as e:
+            response = {"id": request_id, "error": "{}: {}".format(type(e).__name__, e)}
+        return json.dumps(response, default=str) + "\n"
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            self.wfile.write(self.server.power_daemon.handle_line(line).encode())
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(api, path=DEFAULT_SOCKET, mode=0o660, allow_power_control=False):
+    """
+    Function for creating the socket server, call serve_forever() on the result
+
+    Parameters
+    -----------
+    api : SixfabPower
+        API instance owning the bus
+    path : str (optional)
+        Unix socket path (default is DEFAULT_SOCKET)
+    mode : int (optional)
+        permissions of the socket file (default is 0o660)
+    allow_power_control : bool (optional)
+        also serve POWER_CONTROL_METHODS (default is False)
+    """
+    if os.path.exists(path):
+        # a stale socket of a previous run, refuse to steal a live one
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)
+        else:
+            raise daemon_request_failed("Daemon already running on " + path)
+        finally:
+            probe.close()
+
+    server = _Server(path, _Handler)
+    server.power_daemon = PowerDaemon(api, allow_power_control)
+    os.chmod(path, mode)
+    return server
+
+
+class SixfabPowerClient:
+    """
+    SixfabPower-like client of sixfab-powerd.
+
+    Every SixfabPower method in ALLOWED_METHODS can be called on the client
+    with the same arguments, e.g. client.get_battery_level(), and those in
+    POWER_CONTROL_METHODS if the daemon allows them.
+
+    Parameters
+    -----------
+    path : str (optional)
+        Unix socket path (default is DEFAULT_SOCKET)
+    timeout : float (optional)
+        socket timeout in seconds (default is 10)
+    max_age : float (optional)
+        default freshness bound for get_* calls in seconds (default is None, always read the HAT)
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET, timeout=10.0, max_age=None):
+        self.path = path
+        self.timeout = timeout
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._sock = None
+        self._file = None
+        self._next_id = 0
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        self._sock = sock
+        self._file = sock.makefile("rwb")
+
+    def close(self):
+        """Function for closing the connection to the daemon."""
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+            self._sock = None
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def call(self, method, args=(), kwargs=None, max_age=None):
+        """
+        Function for calling a SixfabPower method through the daemon
+
+        Parameters
+        -----------
+        method : str
+            SixfabPower method name
+        args : list (optional)
+            positional arguments
+        kwargs : dict (optional)
+            keyword arguments
+        max_age : float (optional)
+            accept a cached result up to this many seconds old
+
+        Returns
+        -------
+        result : any
+            return value of the method on the daemon side
+        """
+        with self._lock:
+            self._next_id += 1
+            request = {"id": self._next_id, "method": method, "args": list(args)}
+            if kwargs:
+                request["kwargs"] = kwargs
+            if max_age is not None:
+                request["max_age"] = max_age
+            data = (json.dumps(request) + "\n").encode()
+
+            # one reconnect, the daemon may have been restarted
+            for attempt in (0, 1):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    self._file.write(data)
+                    self._file.flush()
+                    line = self._file.readline()
+                    if not line:
+                        raise ConnectionError("Connection closed by sixfab-powerd")
+                    break
+                except (ConnectionError, BrokenPipeError):
+                    self.close()
+                    if attempt:
+                        raise
+
+        response = json.loads(line)
+        if "error" in response:
+            raise daemon_request_failed(response["error"])
+        return response.get("result")
+
+    def daemon_stats(self):
+        """Function for getting the counters of the daemon."""
+        return self.call("daemon_stats")
+
+    def __getattr__(self, name):
+        if name not in ALLOWED_METHODS and name not in POWER_CONTROL_METHODS:
+            raise AttributeError(name)
+
+        def method(*args, **kwargs):
+            return self.call(name, args, kwargs, self.max_age)
+
+        method.__name__ = name
+        return method
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="sixfab-powerd", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket path")
+    parser.add_argument("--mode", default="0660", help="socket file permissions (default is 0660)")
+    parser.add_argument("--emulator", action="store_true", help="serve power_api.emulator instead of the HAT")
+    parser.add_argument(
+        "--allow-power-control",
+        action="store_true",
+        help="let clients power off or reboot, set the RTC and create scheduled events",
+    )
+    parser.add_argument(
+        "--battery-temp-relay",
+        action="store_true",
+        help="forward the separated battery holder temperature to the HAT",
+    )
+    parser.add_argument(
+        "--shm",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="PATH",
+        help="publish the telemetry to a shared memory segment (default path is /dev/shm/sixfab-power-telemetry)",
+    )
+    parser.add_argument("--shm-interval", type=float, default=1.0, help="seconds between published snapshots (default is 1)")
+    args = parser.parse_args(argv)
+
+    from power_api.power_api import SixfabPower
+
+    if args.emulator:
+        from power_api.emulator import EmulatedBus
+
+        api = SixfabPower(bus=EmulatedBus())
+    else:
+        api = SixfabPower()
+        # keeps scripts that still open the bus themselves out of our frames
+        api.enable_bus_lock()
+    # unsupported commands of older firmware then fail without retries
+    api.probe_capabilities()
+
+    server = serve(api, args.socket, int(args.mode, 8), args.allow_power_control)
+    daemon = server.power_daemon
+
+    relay = None
+    if args.battery_temp_relay:
+        from power_api.batterytemp import BatteryTemperatureRelay
+
+        # uses the daemon's instance instead of opening a bus of its own;
+        # each poll runs under the daemon's lock, between client requests
+        relay = BatteryTemperatureRelay(
+            api,
+            on_fault=lambda kind, detail: print("Battery temperature sensor:", kind or "ok", flush=True),
+            executor=daemon._execute,
+        )
+        relay.start()
+
+    publisher = None
+    if args.shm is not None:
+        from power_api.shm import TelemetryPublisher, DEFAULT_PATH
+
+        # local readers map the segment instead of asking the daemon, the
+        # snapshots are read under the daemon's lock like client requests
+        publisher = TelemetryPublisher(api, args.shm or DEFAULT_PATH, args.shm_interval, executor=daemon._execute)
+        publisher.start()
+
+    # systemd stops the daemon with SIGTERM, leave through the finally below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if relay is not None:
+            relay.stop()
+        if publisher is not None:
+            publisher.close()
+        server.server_close()
+        try:
+            os.unlink(args.socket)
+        except OSError:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
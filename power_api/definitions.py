@@ -63,6 +63,26 @@ class Definition:
     ADAPTER_POWERED_AND_FULLY_CHARGED = 2
     BATTERY_POWERED = 3
 
+    # Power State Events
+    EVENT_ADAPTER_LOST = 1
+    EVENT_ADAPTER_RESTORED = 2
+    EVENT_FULLY_CHARGED = 3
+
+    # Button Status
+    BUTTON_SHORT_PRESS = 1
+    BUTTON_LONG_PRESS = 2
+    BUTTON_RELEASED = 3
+
+    # Button Events
+    EVENT_BUTTON_PRESSED = 4
+    EVENT_BUTTON_RELEASED = 5
+    EVENT_BUTTON_LONG_PRESS = 6
+    EVENT_BUTTON_DOUBLE_PRESS = 7
+
+    # Anomaly Events
+    EVENT_ANOMALY_RAISED = 8
+    EVENT_ANOMALY_CLEARED = 9
+
     # Actions
     HARD_POWER_ON =         1
     HARD_POWER_OFF =        2
@@ -90,6 +110,6 @@ class Definition:
     ACTION_SOFT_REBOOT = 14
     NO_SOFT_ACTION = 2
 
-    # Software Action Commands
+    # Software Action Commands (shell strings, power_api.softaction runs systemctl directly)
     C_SOFT_SHUTDOWN = "sleep(5) & sudo shutdown -h now"
     C_SOFT_REBOOT = "sleep(5) & sudo reboot"
@@ -0,0 +1,491 @@
+#!/usr/bin/python3
+
+import time
+import errno
+import random
+
+from power_api.command import (
+    Command,
+    crc16_xmodem,
+    START_BYTE_RECIEVED,
+    START_BYTE_SENT,
+    PROTOCOL_HEADER_SIZE,
+    PROTOCOL_FRAME_SIZE,
+    COMMAND_TYPE_RESPONSE,
+    DEVICE_ADDRESS,
+    BATTERY_TEMP_ADDRESS,
+)
+from power_api.definitions import Definition
+from power_api.registers import REGISTERS
+
+# Byte returned by the MCU while it has nothing to send. Anything but
+# START_BYTE_RECIEVED is skipped by Command.check_command.
+IDLE_BYTE = 0x00
+
+# Time to clock one byte on a 100 kHz bus including start, address and ack bits
+BYTE_TIME_100KHZ = 20 / 100000.0
+
+# SET command id: GET command id of the value it writes
+SETTERS = {
+    Command.PROTOCOL_COMMAND_GET_SYSTEM_TEMP: None,  # send_system_temp(), write only
+    Command.PROTOCOL_COMMAND_SET_WATCHDOG_STATUS: Command.PROTOCOL_COMMAND_GET_WATCHDOG_STATUS,
+    Command.PROTOCOL_COMMAND_SET_RGB_ANIMATION: Command.PROTOCOL_COMMAND_GET_RGB_ANIMATION,
+    Command.PROTOCOL_COMMAND_SET_FAN_SPEED: None,
+    Command.PROTOCOL_COMMAND_SET_FAN_AUTOMATION: Command.PROTOCOL_COMMAND_GET_FAN_AUTOMATION,
+    Command.PROTOCOL_COMMAND_SET_BATTERY_MAX_CHARGE_LEVEL: Command.PROTOCOL_COMMAND_GET_BATTERY_MAX_CHARGE_LEVEL,
+    Command.PROTOCOL_COMMAND_SET_SAFE_SHUTDOWN_BATTERY_LEVEL: Command.PROTOCOL_COMMAND_GET_SAFE_SHUTDOWN_BATTERY_LEVEL,
+    Command.PROTOCOL_COMMAND_SET_SAFE_SHUTDOWN_STATUS: Command.PROTOCOL_COMMAND_GET_SAFE_SHUTDOWN_STATUS,
+    Command.PROTOCOL_COMMAND_WATCHDOG_SIGNAL: None,
+    Command.PROTOCOL_COMMAND_SET_BATTERY_DESIGN_CAPACITY: Command.PROTOCOL_COMMAND_GET_BATTERY_DESIGN_CAPACITY,
+    Command.PROTOCOL_COMMAND_SET_LOW_POWER_MODE: Command.PROTOCOL_COMMAND_GET_LOW_POWER_MODE,
+    Command.PROTOCOL_COMMAND_SET_EASY_DEPLOYMENT_MODE: Command.PROTOCOL_COMMAND_GET_EASY_DEPLOYMENT_MODE,
+    Command.PROTOCOL_COMMAND_SET_FAN_MODE: Command.PROTOCOL_COMMAND_GET_FAN_MODE,
+    Command.PROTOCOL_COMMAND_SET_WATCHDOG_INTERVAL: Command.PROTOCOL_COMMAND_GET_WATCHDOG_INTERVAL,
+    Command.PROTOCOL_COMMAND_SET_BATTERY_SEPARATION_STATUS: Command.PROTOCOL_COMMAND_GET_BATTERY_SEPARATION_STATUS,
+    Command.PROTOCOL_COMMAND_SEND_BATTERY_TEMPERATURE: None,
+    Command.PROTOCOL_COMMAND_SET_POWER_OUTAGE_PARAMS: Command.PROTOCOL_COMMAND_GET_POWER_OUTAGE_PARAMS,
+    Command.PROTOCOL_COMMAND_SET_POWER_OUTAGE_EVENT_STATUS: Command.PROTOCOL_COMMAND_GET_POWER_OUTAGE_EVENT_STATUS,
+    Command.PROTOCOL_COMMAND_SET_END_DEVICE_ALIVE_THRESHOLD: Command.PROTOCOL_COMMAND_GET_END_DEVICE_ALIVE_THRESHOLD,
+    Command.PROTOCOL_COMMAND_SET_DEBUG_CONFIG: Command.PROTOCOL_COMMAND_GET_DEBUG_CONFIG,
+}
+
+# Commands that trigger an action on the MCU and answer SET_OK
+ACTIONS = (
+    Command.PROTOCOL_COMMAND_HARD_POWER_OFF,
+    Command.PROTOCOL_COMMAND_SOFT_POWER_OFF,
+    Command.PROTOCOL_COMMAND_HARD_REBOOT,
+    Command.PROTOCOL_COMMAND_SOFT_REBOOT,
+    Command.PROTOCOL_COMMAND_HARD_POWER_ON,
+    Command.PROTOCOL_COMMAND_SOFT_POWER_ON,
+)
+
+# Soft actions the MCU then asks the end device for
+SOFT_ACTIONS = {
+    Command.PROTOCOL_COMMAND_SOFT_POWER_OFF: Definition.ACTION_SOFT_SHUTDOWN,
+    Command.PROTOCOL_COMMAND_SOFT_REBOOT: Definition.ACTION_SOFT_REBOOT,
+}
+
+DEFAULT_VALUES = {
+    "input_temp": 32.5,
+    "input_voltage": 5.12,
+    "input_current": 0.92,
+    "input_power": 4.71,
+    "system_voltage": 5.05,
+    "system_current": 0.81,
+    "system_power": 4.09,
+    "battery_temp": 28.25,
+    "battery_voltage": 4.05,
+    "battery_current": 0.31,
+    "battery_power": 1.25,
+    "battery_level": 85,
+    "battery_health": 97,
+    "fan_speed": 0,
+    "fan_health": Definition.FAN_HEALTY,
+    "watchdog_status": 2,
+    "rgb_animation": bytes([Definition.RGB_HEARTBEAT, Definition.GREEN, Definition.RGB_NORMAL]),
+    "fan_automation": bytes([40, 60]),
+    "battery_max_charge_level": 95,
+    "safe_shutdown_battery_level": 10,
+    "safe_shutdown_status": 2,
+    "working_mode": Definition.ADAPTER_POWERED_AND_CHARGING,
+    "button1_status": 3,
+    "button2_status": 3,
+    "battery_design_capacity": 3000,
+    "soft_action": Definition.NO_SOFT_ACTION,
+    "lpm_status": 2,
+    "edm_status": 2,
+    "fan_mode": 3,
+    "watchdog_interval": 4,
+    "battery_separation_status": 2,
+    "power_outage_params": bytes([0x05, 0x9F, 0x00, 0x00]),
+    "power_outage_event_status": 2,
+    "end_device_alive_threshold": 100,
+    "debug_config": 0,
+    "firmware_ver": b"v0.03.03",
+}
+
+NAMES = {name: cmd for cmd, (name, _, _, _) in REGISTERS.items()}
+
+
+class EmulatedBus:
+    """
+    Hardware-free stand-in for the UPS HAT MCU.
+
+    Implements the smbus2.SMBus calls used by Command (write_i2c_block_data,
+    read_byte, read_i2c_block_data) and answers every PROTOCOL_COMMAND_*
+    request the way the firmware does, including scheduled events and the
+    firmware bootloader handshake. Pass it to SixfabPower(bus=EmulatedBus()).
+
+    Timing is virtual by default: the bus time every transaction would take
+    is accumulated in self.elapsed without sleeping, which keeps the
+    emulator fast enough for throughput benchmarks. With realtime=True the
+    byte time is spent for real and a response only becomes readable once
+    the command turnaround latency has passed, so reading too early fails
+    the same way it does on hardware.
+
+    Parameters
+    -----------
+    latency : float (optional)
+        default command turnaround latency in seconds (default is 0)
+    command_latency : dict (optional)
+        per command id turnaround latency overriding latency
+    byte_time : float (optional)
+        seconds to transfer one byte (default is 0, BYTE_TIME_100KHZ models a 100 kHz bus)
+    realtime : bool (optional)
+        spend latency and byte time for real (default is False)
+    crc_error_rate : float (optional)
+        probability that a response carries a corrupted CRC (default is 0)
+    nack_rate : float (optional)
+        probability that a bus call raises OSError(EREMOTEIO) (default is 0)
+    unsupported : iterable (optional)
+        command ids the firmware does not answer
+    seed : int (optional)
+        seed of the fault injection random generator
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        command_latency=None,
+        byte_time=0.0,
+        realtime=False,
+        crc_error_rate=0.0,
+        nack_rate=0.0,
+        unsupported=(),
+        seed=None,
+    ):
+        self.latency = latency
+        self.command_latency = dict(command_latency or {})
+        self.byte_time = byte_time
+        self.realtime = realtime
+        self.crc_error_rate = crc_error_rate
+        self.nack_rate = nack_rate
+        self.unsupported = set(unsupported)
+        self.random = random.Random(seed).random
+
+        self.registers = {}
+        self._responses = {}
+        self._requests = {}
+        for name, value in DEFAULT_VALUES.items():
+            self.set_value(name, value)
+
+        self.system_temp = None
+        self.battery_temperature = None  # last value sent with SEND_BATTERY_TEMPERATURE
+        self.battery_sensor_temp = 25.0  # sensor at BATTERY_TEMP_ADDRESS, None when absent
+        self.fan_speed_setting = None
+        self.events = {}
+        self.actions = []
+        self.rtc_offset = 0
+
+        self.boot_mode = False
+        self.firmware = bytearray()
+        self.flashed_firmware = None
+        self._expected_packet = 1
+
+        self._response = b""
+        self._position = 0
+        self._ready_at = 0.0
+
+        # statistics
+        self.elapsed = 0.0
+        self.frames_received = 0
+        self.frames_sent = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.crc_errors_injected = 0
+        self.nacks_injected = 0
+        self.bad_requests = 0
+
+    #############################################################
+    ### Device State ############################################
+    #############################################################
+
+    def set_value(self, name, value):
+        """
+        Function for setting a value reported by a GET command
+
+        Parameters
+        -----------
+        name : str
+            getter name without the "get_" prefix (e.g. "battery_level")
+        value : float/int/bytes
+            physical value as returned by the SixfabPower getter, or raw data bytes
+        """
+        cmd = NAMES[name]
+        _, length, scale, signed = REGISTERS[cmd]
+        if isinstance(value, (bytes, bytearray)):
+            data = bytes(value)
+        else:
+            data = int(round(value * scale)).to_bytes(length, "big", signed=signed)
+        self.registers[cmd] = data
+        self._responses.pop(cmd, None)
+
+    def get_value(self, name):
+        """Function for getting a value in the same scale as set_value()."""
+        cmd = NAMES[name]
+        _, _, scale, signed = REGISTERS[cmd]
+        data = self.registers[cmd]
+        if scale is None:
+            return data
+        value = int.from_bytes(data, "big", signed=signed)
+        return value / scale if scale != 1 else value
+
+    def reset(self):
+        """Function for clearing the statistics counters."""
+        self.elapsed = 0.0
+        self.frames_received = 0
+        self.frames_sent = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.crc_errors_injected = 0
+        self.nacks_injected = 0
+        self.bad_requests = 0
+
+    #############################################################
+    ### smbus2 Interface ########################################
+    #############################################################
+
+    def open(self, bus):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _spend(self, seconds):
+        self.elapsed += seconds
+        if self.realtime and seconds > 0:
+            end = time.perf_counter() + seconds
+            while time.perf_counter() < end:
+                pass
+
+    def _nack(self):
+        self.nacks_injected += 1
+        raise OSError(errno.EREMOTEIO, "Remote I/O error")
+
+    def write_i2c_block_data(self, i2c_addr, register, data, force=None):
+        if i2c_addr != DEVICE_ADDRESS:
+            raise OSError(errno.EREMOTEIO, "Remote I/O error")
+        if self.nack_rate and self.random() < self.nack_rate:
+            self._nack()
+
+        frame = bytes(data)
+        self.bytes_written += len(frame) + 1
+        if self.byte_time:
+            self._spend((len(frame) + 1) * self.byte_time)
+
+        self._response = b""
+        self._position = 0
+
+        request = self._requests.get(frame)
+        if request is None:
+            request = self._parse_request(frame)
+            if request is None:
+                self.bad_requests += 1
+                return
+            if len(self._requests) < 4096:
+                self._requests[frame] = request
+
+        cmd, payload = request
+        self.frames_received += 1
+        if cmd in self.unsupported:
+            return
+
+        response = self._handle(cmd, payload)
+        if response is None:
+            return
+
+        if self.crc_error_rate and self.random() < self.crc_error_rate:
+            self.crc_errors_injected += 1
+            response = response[:-1] + bytes([response[-1] ^ 0x01])
+
+        self._response = response
+        self.frames_sent += 1
+
+        latency = self.command_latency.get(cmd, self.latency)
+        if self.realtime:
+            self._ready_at = time.perf_counter() + latency
+        else:
+            self.elapsed += latency
+
+    def read_byte(self, i2c_addr, force=None):
+        if i2c_addr != DEVICE_ADDRESS:
+            raise OSError(errno.EREMOTEIO, "Remote I/O error")
+        if self.nack_rate and self.random() < self.nack_rate:
+            self._nack()
+
+        self.bytes_read += 1
+        if self.byte_time:
+            self._spend(self.byte_time)
+
+        position = self._position
+        if position >= len(self._response):
+            return IDLE_BYTE
+        if self.realtime and time.perf_counter() < self._ready_at:
+            return IDLE_BYTE
+
+        self._position = position + 1
+        return self._response[position]
+
+    def read_i2c_block_data(self, i2c_addr, register, length, force=None):
+        if i2c_addr != BATTERY_TEMP_ADDRESS or self.battery_sensor_temp is None:
+            raise OSError(errno.EREMOTEIO, "Remote I/O error")
+        if self.nack_rate and self.random() < self.nack_rate:
+            self._nack()
+
+        self.bytes_read += length
+        if self.byte_time:
+            self._spend((length + 2) * self.byte_time)
+
+        # 12 bit two's complement, 0.0625 C per LSB, left aligned
+        raw = int(round(self.battery_sensor_temp / 0.0625)) & 0xFFF
+        word = [(raw >> 4) & 0xFF, (raw << 4) & 0xFF]
+        return (word + [0] * length)[:length]
+
+    #############################################################
+    ### Protocol ################################################
+    #############################################################
+
+    def _parse_request(self, frame):
+        if len(frame) < PROTOCOL_FRAME_SIZE or frame[0] != START_BYTE_SENT:
+            return None
+
+        datalen = (frame[3] << 8) | frame[4]
+        end = PROTOCOL_HEADER_SIZE + datalen
+        if len(frame) < end + 2:
+            return None
+
+        crc = (frame[end] << 8) | frame[end + 1]
+        if crc != crc16_xmodem(frame[:end]):
+            return None
+
+        return (frame[1], frame[PROTOCOL_HEADER_SIZE:end])
+
+    def _frame(self, cmd, data):
+        header = bytes(
+            [START_BYTE_RECIEVED, cmd, COMMAND_TYPE_RESPONSE, (len(data) >> 8) & 0xFF, len(data) & 0xFF]
+        ) + bytes(data)
+        crc = crc16_xmodem(header)
+        return header + bytes([(crc >> 8) & 0xFF, crc & 0xFF])
+
+    def _status(self, cmd, ok=True):
+        return self._frame(cmd, [Definition.SET_OK if ok else Definition.SET_FAILED])
+
+    def _handle(self, cmd, payload):
+        if cmd == Command.PROTOCOL_COMMAND_IS_ANY_SOFT_ACTION_EXIST:
+            # a pending soft action is reported once
+            response = self._frame(cmd, self.registers[cmd])
+            self.registers[cmd] = bytes([Definition.NO_SOFT_ACTION])
+            return response
+
+        if cmd in REGISTERS and not payload:
+            response = self._responses.get(cmd)
+            if response is None:
+                response = self._frame(cmd, self.registers[cmd])
+                self._responses[cmd] = response
+            return response
+
+        if cmd in SETTERS:
+            return self._handle_set(cmd, SETTERS[cmd], payload)
+
+        if cmd == Command.PROTOCOL_COMMAND_GET_RTC_TIME:
+            now = int(time.time()) + self.rtc_offset
+            return self._frame(cmd, now.to_bytes(4, "big"))
+
+        if cmd == Command.PROTOCOL_COMMAND_SET_RTC_TIME:
+            self.rtc_offset = int.from_bytes(payload, "big") - int(time.time())
+            return self._status(cmd)
+
+        if cmd in ACTIONS:
+            self.actions.append((cmd, bytes(payload)))
+            if cmd in SOFT_ACTIONS:
+                self.registers[Command.PROTOCOL_COMMAND_IS_ANY_SOFT_ACTION_EXIST] = bytes([SOFT_ACTIONS[cmd]])
+            return self._status(cmd)
+
+        if cmd == Command.PROTOCOL_COMMAND_CREATE_SCHEDULED_EVENT:
+            if len(payload) != 10 or not 1 <= payload[0] <= 10:
+                return self._status(cmd, False)
+            self.events[payload[0]] = bytes(payload)
+            return self._status(cmd)
+
+        if cmd == Command.PROTOCOL_COMMAND_REMOVE_SCHEDULED_EVENT:
+            ok = len(payload) == 1 and self.events.pop(payload[0], None) is not None
+            return self._status(cmd, ok)
+
+        if cmd == Command.PROTOCOL_COMMAND_REMOVE_ALL_SCHEDULED_EVENTS:
+            self.events.clear()
+            return self._status(cmd)
+
+        if cmd == Command.PROTOCOL_COMMAND_GET_SCHEDULED_EVENT_IDS:
+            ids = 0
+            for event_id in self.events:
+                ids |= 1 << (event_id - 1)
+            return self._frame(cmd, ids.to_bytes(2, "big"))
+
+        return self._handle_firmware(cmd, payload)
+
+    def _handle_set(self, cmd, target, payload):
+        if cmd == Command.PROTOCOL_COMMAND_GET_SYSTEM_TEMP:
+            self.system_temp = int.from_bytes(payload, "big") / 100
+        elif cmd == Command.PROTOCOL_COMMAND_SEND_BATTERY_TEMPERATURE:
+            self.battery_temperature = int.from_bytes(payload, "big", signed=True) / 100
+        elif cmd == Command.PROTOCOL_COMMAND_SET_FAN_SPEED:
+            self.fan_speed_setting = int.from_bytes(payload, "big")
+        elif target is not None:
+            if len(payload) != REGISTERS[target][1]:
+                return self._status(cmd, False)
+            self.registers[target] = bytes(payload)
+            self._responses.pop(target, None)
+        return self._status(cmd)
+
+    def _handle_firmware(self, cmd, payload):
+        if cmd == Command.PROTOCOL_COMMAND_CLEAR_PROGRAM_STORAGE:
+            self.firmware = bytearray()
+            self._expected_packet = 1
+            return self._status(cmd)
+
+        if cmd == Command.PROTOCOL_COMMAND_CLEAR_PROGRAM_AREA:
+            return self._status(cmd)
+
+        if cmd == Command.PROTOCOL_COMMAND_RESET_MCU_FOR_BOOT_UPDATE:
+            self.boot_mode = True
+            self._expected_packet = 1
+            return None
+
+        if cmd == Command.PROTOCOL_COMMAND_FIRMWARE_UPDATE:
+            if len(payload) < 4:
+                return None
+            packet_count = (payload[0] << 8) | payload[1]
+            packet_id = (payload[2] << 8) | payload[3]
+
+            if packet_id == self._expected_packet:
+                self.firmware += payload[4:]
+                self._expected_packet += 1
+
+            requesting = self._expected_packet
+            if requesting > packet_count:
+                requesting = 0xFFFF
+            return self._frame(cmd, requesting.to_bytes(2, "big"))
+
+        if cmd == Command.PROTOCOL_COMMAND_WRITE_FIRMWARE_TO_FLASH:
+            self.flashed_firmware = bytes(self.firmware)
+            return self._status(cmd)
+
+        if cmd == Command.PROTOCOL_COMMAND_RESET_MCU:
+            if self.boot_mode:
+                self.flashed_firmware = bytes(self.firmware)
+            self.boot_mode = False
+            return None
+
+        if cmd == Command.PROTOCOL_COMMAND_RESTORE_FACTORY_SETTINGS:
+            for name, value in DEFAULT_VALUES.items():
+                self.set_value(name, value)
+            self.events.clear()
+            return None
+
+        return None
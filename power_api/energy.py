@@ -0,0 +1,261 @@
+#!/usr/bin/python3
+
+import os
+import json
+import time
+import datetime
+
+# Counters kept in total and per day, in [Wh]
+COUNTERS = ("input", "system", "battery_charge", "battery_discharge")
+
+CHECKPOINT_VERSION = 1
+
+
+def _trapezoid(v0, v1, dt):
+    # (positive, negative) area under the line from v0 to v1, split where
+    # it crosses zero, both as positive numbers
+    if v0 >= 0 and v1 >= 0:
+        return (v0 + v1) * 0.5 * dt, 0.0
+    if v0 <= 0 and v1 <= 0:
+        return 0.0, -(v0 + v1) * 0.5 * dt
+    crossing = v0 / (v0 - v1) * dt
+    first = v0 * 0.5 * crossing
+    second = v1 * 0.5 * (dt - crossing)
+    if v0 > 0:
+        return first, -second
+    return second, -first
+
+
+def _day_bounds(timestamp):
+    date = datetime.date.fromtimestamp(timestamp)
+    start = datetime.datetime.combine(date, datetime.time()).timestamp()
+    end = datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time()).timestamp()
+    return date.isoformat(), start, end
+
+
+class EnergyCounter:
+    """
+    Cumulative energy counters from power samples.
+
+    Input, system and battery power are integrated with the trapezoidal
+    rule into [Wh] totals and local calendar day buckets; battery energy is
+    split into charge and discharge where the power changes sign. Samples
+    further apart than max_gap seconds (or going back in time) are not
+    integrated but counted as gaps. Each update is O(1), no sample history
+    is stored.
+
+    With a path the counters are loaded from it and written back every
+    checkpoint_interval seconds (written aside, synced and renamed), so a
+    reboot loses at most one interval.
+
+    Parameters
+    -----------
+    path : str (optional)
+        checkpoint file (default is None, no persistence)
+    checkpoint_interval : float (optional)
+        seconds between checkpoints (default is 300)
+    max_gap : float (optional)
+        samples further apart than this many seconds are not integrated (default is 60)
+    discharge_negative : bool (optional)
+        True when get_battery_power() is negative while discharging (default is True)
+    days : int (optional)
+        number of day buckets kept (default is 400)
+    """
+
+    def __init__(self, path=None, checkpoint_interval=300.0, max_gap=60.0, discharge_negative=True, days=400):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.max_gap = max_gap
+        self.sign = -1.0 if discharge_negative else 1.0
+        self.max_days = days
+        self.reset()
+        if path is not None:
+            self.load()
+
+    def reset(self):
+        """Function for clearing all counters."""
+        self.total = dict.fromkeys(COUNTERS, 0.0)
+        self.days = {}  # "YYYY-MM-DD": {counter: Wh}
+        self.samples = 0
+        self.gaps = 0
+        self.gap_time = 0.0  # seconds not integrated
+        self._last_time = None
+        self._last = (None, None, None)
+        self._day = None
+        self._day_start = None
+        self._day_end = None
+        self._bucket = None
+        self._checkpoint_at = None
+
+    def _open_day(self, timestamp):
+        self._day, self._day_start, self._day_end = _day_bounds(timestamp)
+        bucket = self.days.get(self._day)
+        if bucket is None:
+            bucket = self.days[self._day] = dict.fromkeys(COUNTERS, 0.0)
+            while len(self.days) > self.max_days:
+                del self.days[min(self.days)]
+        self._bucket = bucket
+
+    def _add(self, previous, values, dt):
+        total = self.total
+        bucket = self._bucket
+        for index, name in ((0, "input"), (1, "system")):
+            v0, v1 = previous[index], values[index]
+            if v0 is not None and v1 is not None:
+                energy = _trapezoid(v0, v1, dt)[0] / 3600.0
+                total[name] += energy
+                bucket[name] += energy
+        v0, v1 = previous[2], values[2]
+        if v0 is not None and v1 is not None:
+            discharge, charge = _trapezoid(v0 * self.sign, v1 * self.sign, dt)
+            total["battery_discharge"] += discharge / 3600.0
+            bucket["battery_discharge"] += discharge / 3600.0
+            total["battery_charge"] += charge / 3600.0
+            bucket["battery_charge"] += charge / 3600.0
+
+    def update(self, input_power, system_power, battery_power, timestamp=None):
+        """
+        Function for feeding one telemetry sample
+
+        Parameters
+        -----------
+        input_power : float
+            [Watt], as returned by get_input_power(), None when not read
+        system_power : float
+            [Watt], as returned by get_system_power(), None when not read
+        battery_power : float
+            [Watt], as returned by get_battery_power(), None when not read
+        timestamp : float (optional)
+            epoch seconds of the sample (default is time.time())
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        values = (input_power, system_power, battery_power)
+
+        if self._day is None or not self._day_start <= timestamp:
+            self._open_day(timestamp)
+
+        last_time = self._last_time
+        if last_time is not None:
+            dt = timestamp - last_time
+            if 0 < dt <= self.max_gap:
+                if timestamp > self._day_end:
+                    # the part before midnight goes to the day before
+                    boundary = self._day_end
+                    fraction = (boundary - last_time) / dt
+                    middle = tuple(
+                        None if v0 is None or v1 is None else v0 + (v1 - v0) * fraction
+                        for v0, v1 in zip(self._last, values)
+                    )
+                    self._add(self._last, middle, boundary - last_time)
+                    self._open_day(timestamp)
+                    self._add(middle, values, timestamp - boundary)
+                else:
+                    self._add(self._last, values, dt)
+            else:
+                self.gaps += 1
+                self.gap_time += max(dt, 0.0)
+                if timestamp > self._day_end:
+                    self._open_day(timestamp)
+
+        self._last_time = timestamp
+        self._last = values
+        self.samples += 1
+
+        if self.path is not None:
+            if self._checkpoint_at is None:
+                self._checkpoint_at = timestamp
+            elif not 0 <= timestamp - self._checkpoint_at < self.checkpoint_interval:
+                self.save()
+                self._checkpoint_at = timestamp
+
+    def update_sample(self, sample):
+        """
+        Function for feeding a telemetry sample dictionary
+
+        Parameters
+        -----------
+        sample : dict
+            as returned by get_snapshot(), uses "input_power", "system_power",
+            "battery_power" and "timestamp" when present
+        """
+        self.update(
+            sample.get("input_power"),
+            sample.get("system_power"),
+            sample.get("battery_power"),
+            sample.get("timestamp"),
+        )
+
+    def day(self, date=None):
+        """
+        Function for getting the counters of one day
+
+        Parameters
+        -----------
+        date : str or datetime.date (optional)
+            local date (default is today)
+
+        Returns
+        -------
+        counters : dict
+            {counter: Wh}, zeros for days without samples
+        """
+        if date is None:
+            date = datetime.date.today()
+        if not isinstance(date, str):
+            date = date.isoformat()
+        return dict(self.days.get(date) or dict.fromkeys(COUNTERS, 0.0))
+
+    #############################################################
+    ### Checkpoints #############################################
+    #############################################################
+
+    def save(self, path=None):
+        """Function for writing the counters to path (default is self.path) atomically."""
+        path = path or self.path
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "saved": time.time(),
+            "total": self.total,
+            "days": self.days,
+            "samples": self.samples,
+            "gaps": self.gaps,
+            "gap_time": self.gap_time,
+        }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def load(self, path=None):
+        """
+        Function for reading the counters written by save()
+
+        Returns
+        -------
+        loaded : bool
+            False when the file is missing or not a checkpoint
+        """
+        path = path or self.path
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not isinstance(state, dict) or state.get("version") != CHECKPOINT_VERSION:
+            return False
+
+        self.reset()
+        self.total.update((name, float(state["total"].get(name, 0.0))) for name in COUNTERS)
+        for date in sorted(state.get("days", {}))[-self.max_days :]:
+            counters = state["days"][date]
+            self.days[date] = {name: float(counters.get(name, 0.0)) for name in COUNTERS}
+        self.samples = state.get("samples", 0)
+        self.gaps = state.get("gaps", 0)
+        self.gap_time = state.get("gap_time", 0.0)
+        return True
@@ -0,0 +1,194 @@
+#!/usr/bin/python3
+
+import math
+import time
+
+
+class BatteryRuntimeEstimator:
+    """
+    Online battery runtime estimator.
+
+    Integrates battery current (coulomb counting) into a remaining-charge
+    estimate, pulls that estimate slowly towards the charge implied by the
+    reported battery level to cancel integration drift, and keeps an
+    exponentially weighted mean and variance of the discharge current. Each
+    update is O(1) and no sample history is stored.
+
+    Parameters
+    -----------
+    design_capacity : int
+        battery design capacity in [mAh], as returned by get_battery_design_capacity()
+    safe_shutdown_level : int (optional)
+        battery level [%] at which the host should be shut down (default is 10)
+    tau : float (optional)
+        time constant of the load EWMA in seconds, independent of the
+        sampling rate; the runtime follows the load of the last half hour
+        rather than of the last few minutes (default is 1800)
+    level_tau : float (optional)
+        time constant in seconds with which the coulomb count is pulled
+        towards the reported level, independent of the sampling rate
+        (default is 500)
+    discharge_negative : bool (optional)
+        True when get_battery_current() is negative while discharging (default is True)
+    max_gap : float (optional)
+        samples further apart than this many seconds are not integrated (default is 60)
+    """
+
+    def __init__(
+        self,
+        design_capacity,
+        safe_shutdown_level=10,
+        tau=1800.0,
+        level_tau=500.0,
+        discharge_negative=True,
+        max_gap=60.0,
+    ):
+        self.design_capacity = float(design_capacity)
+        self.safe_shutdown_level = safe_shutdown_level
+        self.tau = tau
+        self.level_tau = level_tau
+        self.sign = -1.0 if discharge_negative else 1.0
+        self.max_gap = max_gap
+        self.reset()
+
+    def reset(self):
+        """Function for dropping all accumulated state."""
+        self.charge = None  # remaining charge [mAh]
+        self.load = None  # smoothed discharge current [mA]
+        self.load_var = 0.0
+        self._load_time = 0.0  # seconds of load seen by the EWMA
+        self.samples = 0
+        self._last_time = None
+        self._last_current = None
+
+    def update(self, current, level, timestamp=None):
+        """
+        Function for feeding one telemetry sample
+
+        Parameters
+        -----------
+        current : float
+            battery current [Ampere], as returned by get_battery_current()
+        level : int
+            battery level [%], as returned by get_battery_level()
+        timestamp : float (optional)
+            sample time in seconds (default is time.monotonic())
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        if current is None:
+            return
+
+        # discharge current in mA, positive while the battery is drained
+        discharge = current * 1000.0 * self.sign
+        level_charge = None
+        if level is not None:
+            level_charge = self.design_capacity * level / 100.0
+
+        dt = 0.0
+        if self.charge is None:
+            if level_charge is None:
+                return
+            self.charge = level_charge
+        elif self._last_time is not None:
+            dt = timestamp - self._last_time
+            if 0 < dt <= self.max_gap:
+                # trapezoidal coulomb counting, mA * s -> mAh
+                used = (discharge + self._last_current) * 0.5 * dt / 3600.0
+                self.charge = min(max(self.charge - used, 0.0), self.design_capacity)
+
+                if level_charge is not None:
+                    self.charge += (level_charge - self.charge) * (1.0 - math.exp(-dt / self.level_tau))
+
+        if self.load is None:
+            self.load = discharge
+        elif 0 < dt <= self.max_gap:
+            # a plain running mean until tau worth of load has been seen, so
+            # the first sample does not bias the load for the next hour
+            self._load_time += dt
+            alpha = max(1.0 - math.exp(-dt / self.tau), dt / self._load_time)
+            diff = discharge - self.load
+            incr = alpha * diff
+            self.load += incr
+            self.load_var = (1.0 - alpha) * (self.load_var + diff * incr)
+
+        self._last_time = timestamp
+        self._last_current = discharge
+        self.samples += 1
+
+    def update_sample(self, sample):
+        """
+        Function for feeding a telemetry sample dictionary
+
+        Parameters
+        -----------
+        sample : dict
+            must contain "battery_current" and "battery_level"; "timestamp" is optional
+        """
+        self.update(
+            sample.get("battery_current"),
+            sample.get("battery_level"),
+            sample.get("timestamp"),
+        )
+
+    @property
+    def level(self):
+        """Estimated battery level [%], or None before the first sample."""
+        if self.charge is None:
+            return None
+        return self.charge * 100.0 / self.design_capacity
+
+    def _runtime(self, charge_to_use, sigmas):
+        if self.load is None or charge_to_use is None:
+            return None
+
+        std = math.sqrt(self.load_var)
+        if self.load <= 0:
+            return (math.inf, math.inf, math.inf)
+
+        charge_to_use = max(charge_to_use, 0.0)
+        estimate = charge_to_use / self.load * 60.0
+        high_load = self.load + sigmas * std
+        low_load = self.load - sigmas * std
+        low = charge_to_use / high_load * 60.0
+        high = charge_to_use / low_load * 60.0 if low_load > 0 else math.inf
+        return (estimate, low, high)
+
+    def runtime_to_empty(self, sigmas=2.0):
+        """
+        Function for getting the runtime left until the battery is empty
+
+        Parameters
+        -----------
+        sigmas : float (optional)
+            width of the confidence band in standard deviations of the load (default is 2.0)
+
+        Returns
+        -------
+        runtime : tuple
+            (estimate, low, high) in [minutes]; inf while charging, None before the first sample
+        """
+        return self._runtime(self.charge, sigmas)
+
+    def runtime_to_shutdown(self, level=None, sigmas=2.0):
+        """
+        Function for getting the runtime left until the safe shutdown level
+
+        Parameters
+        -----------
+        level : int (optional)
+            threshold level [%] (default is safe_shutdown_level)
+        sigmas : float (optional)
+            width of the confidence band in standard deviations of the load (default is 2.0)
+
+        Returns
+        -------
+        runtime : tuple
+            (estimate, low, high) in [minutes]; inf while charging, None before the first sample
+        """
+        if level is None:
+            level = self.safe_shutdown_level
+        if self.charge is None:
+            return None
+        return self._runtime(self.charge - self.design_capacity * level / 100.0, sigmas)
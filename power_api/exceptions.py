@@ -1,2 +1,53 @@
-class crc_check_failed(Exception):
-    pass
\ No newline at end of file
+class power_api_error(Exception):
+    """Base class of the errors raised by the API."""
+    pass
+
+
+class invalid_argument(power_api_error, ValueError):
+    """A parameter is out of its documented range, raised before any bus access."""
+    pass
+
+
+class bus_error(power_api_error, RuntimeError):
+    """An I2C transfer failed, errno holds the code of the underlying OSError."""
+
+    def __init__(self, message="", errno=None):
+        super().__init__(message)
+        self.errno = errno
+
+
+class device_not_found(bus_error):
+    """The HAT does not acknowledge its address or the I2C bus is missing."""
+    pass
+
+
+class response_timeout(power_api_error, RuntimeError):
+    """No complete response frame was received in time."""
+    pass
+
+
+class crc_check_failed(power_api_error):
+    pass
+
+
+class command_not_supported(power_api_error):
+    """The firmware of the HAT does not know the command, see SixfabPower.probe_capabilities()."""
+    pass
+
+
+class command_failed(power_api_error):
+    """The HAT answered SET_FAILED."""
+    pass
+
+
+class daemon_request_failed(power_api_error):
+    pass
+
+
+class bus_lock_timeout(power_api_error):
+    pass
+
+
+class bus_lock_unavailable(bus_error):
+    """The bus lock file can not be opened, see power_api.buslock."""
+    pass
@@ -0,0 +1,268 @@
+#!/usr/bin/python3
+
+import time
+import threading
+import traceback
+
+from power_api.definitions import Definition
+
+
+class PowerStateEvent:
+    """
+    Power state transition reported by PowerStateMonitor.
+
+    Attributes
+    ----------
+    type : Definition Object Property
+        --> Definition.EVENT_ADAPTER_LOST
+        --> Definition.EVENT_ADAPTER_RESTORED
+        --> Definition.EVENT_FULLY_CHARGED
+    previous_mode : int
+        working mode before the transition, None for the initial event
+    mode : int
+        working mode after the transition
+    input_power : float
+        input power [Watt] read while confirming the transition, or None
+    timestamp : float
+        time.monotonic() at which the transition was confirmed
+    """
+
+    __slots__ = ("type", "previous_mode", "mode", "input_power", "timestamp")
+
+    def __init__(self, type, previous_mode, mode, input_power=None, timestamp=0.0):
+        self.type = type
+        self.previous_mode = previous_mode
+        self.mode = mode
+        self.input_power = input_power
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return "PowerStateEvent(type={}, previous_mode={}, mode={}, input_power={})".format(
+            self.type, self.previous_mode, self.mode, self.input_power
+        )
+
+
+class PowerStateMonitor:
+    """
+    Long-running watcher of the HAT working mode.
+
+    Polls get_working_mode() slowly while nothing changes and switches to a
+    fast rate as soon as a different mode is seen, so a power outage is
+    confirmed within slow_interval + (debounce - 1) * fast_interval seconds.
+    Input power is only read while the HAT reports BATTERY_POWERED, which
+    keeps the idle bus load to a single short command per slow tick.
+
+    Parameters
+    -----------
+    api : SixfabPower
+        api instance used for bus access
+    slow_interval : float (optional)
+        poll period in seconds while the state is stable (default is 0.5)
+    fast_interval : float (optional)
+        poll period in seconds while a transition is being confirmed and for
+        fast_period seconds after it (default is 0.05)
+    fast_period : float (optional)
+        seconds to stay on the fast rate after a transition (default is 5.0)
+    debounce : int (optional)
+        consecutive identical readings needed to accept a new mode (default is 2)
+    power_threshold : float (optional)
+        input power [Watt] above which a BATTERY_POWERED reading is treated
+        as a glitch (default is 0.0)
+    initial : bool (optional)
+        report EVENT_ADAPTER_LOST when the first confirmed mode is already
+        BATTERY_POWERED, with previous_mode None (default is True)
+    """
+
+    def __init__(
+        self,
+        api,
+        slow_interval=0.5,
+        fast_interval=0.05,
+        fast_period=5.0,
+        debounce=2,
+        power_threshold=0.0,
+        initial=True,
+    ):
+        self.api = api
+        self.slow_interval = slow_interval
+        self.fast_interval = fast_interval
+        self.fast_period = fast_period
+        self.debounce = max(1, int(debounce))
+        self.power_threshold = power_threshold
+        self.initial = initial
+
+        self.mode = None
+        self.input_power = None
+
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+        self._candidate = None
+        self._candidate_count = 0
+        self._fast_until = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    #############################################################
+    ### Callbacks ###############################################
+    #############################################################
+
+    def add_callback(self, callback, event_type=None):
+        """
+        Function for registering a transition callback
+
+        Parameters
+        -----------
+        callback : callable
+            called with a PowerStateEvent from the monitor thread
+        event_type : int (optional)
+            only deliver events of this type (default is None, all events)
+        """
+        with self._callbacks_lock:
+            self._callbacks.append((callback, event_type))
+
+    def remove_callback(self, callback):
+        """Function for removing a callback registered with add_callback."""
+        with self._callbacks_lock:
+            self._callbacks = [c for c in self._callbacks if c[0] is not callback]
+
+    def _dispatch(self, event):
+        with self._callbacks_lock:
+            callbacks = list(self._callbacks)
+
+        for callback, event_type in callbacks:
+            if event_type is not None and event_type != event.type:
+                continue
+            try:
+                callback(event)
+            except Exception:
+                traceback.print_exc()
+
+    async def events(self, event_type=None):
+        """
+        Async iterator over transition events
+
+        Parameters
+        -----------
+        event_type : int (optional)
+            only yield events of this type (default is None, all events)
+
+        Yields
+        ------
+        event : PowerStateEvent
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def forward(event):
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+        self.add_callback(forward, event_type)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.remove_callback(forward)
+
+    #############################################################
+    ### Polling #################################################
+    #############################################################
+
+    def poll(self, now=None):
+        """
+        Function for taking one sample and updating the state machine
+
+        Parameters
+        -----------
+        now : float (optional)
+            time.monotonic() value of the sample (default is the current time)
+
+        Returns
+        -------
+        interval : float
+            seconds to wait before the next poll
+        """
+        if now is None:
+            now = time.monotonic()
+
+        observed = self.api.get_working_mode()
+        power = None
+
+        if observed == Definition.BATTERY_POWERED:
+            power = self.api.get_input_power()
+            if power is not None and power > self.power_threshold:
+                observed = None
+
+        if observed is None:
+            # unreadable or inconsistent sample, confirmation starts over
+            self._candidate = None
+            self._candidate_count = 0
+        elif observed == self.mode:
+            self._candidate = None
+            self._candidate_count = 0
+            if power is not None:
+                self.input_power = power
+        else:
+            if observed == self._candidate:
+                self._candidate_count += 1
+            else:
+                self._candidate = observed
+                self._candidate_count = 1
+
+            if self._candidate_count >= self.debounce:
+                self._commit(observed, power, now)
+
+        if self._candidate is not None or now < self._fast_until:
+            return self.fast_interval
+        return self.slow_interval
+
+    def _commit(self, mode, power, now):
+        previous = self.mode
+        self.mode = mode
+        self.input_power = power
+        self._candidate = None
+        self._candidate_count = 0
+
+        battery = Definition.BATTERY_POWERED
+        if previous is None:
+            # starting on battery is an outage the caller has not been told about
+            if self.initial and mode == battery:
+                self._dispatch(PowerStateEvent(Definition.EVENT_ADAPTER_LOST, None, mode, power, now))
+            return
+
+        self._fast_until = now + self.fast_period
+
+        types = []
+        if mode == battery:
+            types.append(Definition.EVENT_ADAPTER_LOST)
+        elif previous == battery:
+            types.append(Definition.EVENT_ADAPTER_RESTORED)
+        if mode == Definition.ADAPTER_POWERED_AND_FULLY_CHARGED:
+            types.append(Definition.EVENT_FULLY_CHARGED)
+
+        for event_type in types:
+            self._dispatch(PowerStateEvent(event_type, previous, mode, power, now))
+
+    def run(self):
+        """Function for polling until stop() is called. Blocks the caller."""
+        while not self._stop.is_set():
+            interval = self.poll()
+            self._stop.wait(interval)
+
+    def start(self):
+        """Function for running the monitor on a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self.run, name="PowerStateMonitor", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Function for stopping the monitor thread started with start()."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
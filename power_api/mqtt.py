@@ -0,0 +1,662 @@
+#!/usr/bin/python3
+"""
+MQTT telemetry publisher with batching and offline spooling.
+
+    sixfab-mqtt --host broker.local --topic vehicles/42/ups [--format cbor] [--hat]
+
+Needs paho-mqtt for a real broker (pip install power_api[mqtt]) and cbor2
+for CBOR payloads (pip install power_api[cbor]).
+
+Snapshots are sampled every interval seconds, by default from the shared
+memory segment of sixfab-powerd --shm (run it with --shm-interval 0.1 for
+10 Hz). Reading the HAT directly (--hat) takes about 0.3 s per snapshot of
+all SNAPSHOT_FIELDS and can not keep 10 Hz; samples that start late are
+counted as overruns in status(). A sample is kept when a
+value moved by more than its deadband or max_interval passed since the
+last kept one; kept samples are sent in batches of batch_size samples or
+batch_interval seconds. A change of an EVENT_FIELDS value (e.g. the
+adapter was lost) closes the batch at once. Payload:
+
+    {"v": 1, "fields": [name, ...], "t": epoch seconds of the first sample,
+     "samples": [[ms since t, value, ...], ...]}
+
+While the broker is unreachable batches go to a bounded spool directory,
+which is flushed on reconnect, event batches first, at most flush_limit
+messages per sample so the sampling rate holds.
+"""
+
+import os
+import sys
+import json
+import time
+import bisect
+import argparse
+import threading
+import traceback
+
+try:
+    import paho.mqtt.client as paho
+except ImportError:
+    paho = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+from power_api.power_api import SNAPSHOT_FIELDS
+
+PAYLOAD_VERSION = 1
+PAYLOAD_FORMATS = ("json", "cbor")
+
+DEFAULT_TOPIC = "sixfab/power/telemetry"
+
+# Changes smaller than these (in the units of the getters) do not make a
+# sample worth sending, fields not listed are sent on any change
+DEFAULT_DEADBANDS = {
+    "input_temp": 0.5,
+    "input_voltage": 0.05,
+    "input_current": 0.02,
+    "input_power": 0.1,
+    "system_voltage": 0.05,
+    "system_current": 0.02,
+    "system_power": 0.1,
+    "battery_temp": 0.5,
+    "battery_voltage": 0.01,
+    "battery_current": 0.02,
+    "battery_power": 0.1,
+    "fan_speed": 100,
+}
+
+# A change of these closes the batch and is flushed first from the spool
+EVENT_FIELDS = ("working_mode", "fan_health")
+
+PRIORITY_EVENT = 0
+PRIORITY_TELEMETRY = 1
+
+
+def _require(module, name, extra):
+    if module is None:
+        raise ImportError("power_api.mqtt needs {}: pip install power_api[{}]".format(name, extra))
+
+
+def default_spool_path():
+    """Function for getting the spool directory, under $XDG_CACHE_HOME or ~/.cache."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "sixfab-power", "mqtt-spool")
+
+
+def encode_batch(fields, start, samples, payload_format="json"):
+    """
+    Function for building a batch payload
+
+    Parameters
+    -----------
+    fields : sequence
+        value names, in the order of the sample rows
+    start : float
+        epoch seconds of the first sample
+    samples : list
+        [ms since start, value, ...] rows
+    payload_format : str (optional)
+        "json" or "cbor" (default is "json")
+
+    Returns
+    -------
+    payload : bytes
+    """
+    batch = {"v": PAYLOAD_VERSION, "fields": list(fields), "t": start, "samples": samples}
+    if payload_format == "cbor":
+        _require(cbor2, "cbor2", "cbor")
+        return cbor2.dumps(batch)
+    return json.dumps(batch, separators=(",", ":")).encode()
+
+
+def decode_batch(payload):
+    """
+    Function for reading a batch payload of either format
+
+    Returns
+    -------
+    samples : list
+        one dict per sample, {"timestamp": epoch seconds, <name>: value, ...}
+    """
+    if payload[:1] == b"{":
+        batch = json.loads(payload)
+    else:
+        _require(cbor2, "cbor2", "cbor")
+        batch = cbor2.loads(payload)
+    fields = batch["fields"]
+    start = batch["t"]
+    samples = []
+    for row in batch["samples"]:
+        sample = {"timestamp": start + row[0] / 1000.0}
+        sample.update(zip(fields, row[1:]))
+        samples.append(sample)
+    return samples
+
+
+class DiskSpool:
+    """
+    Bounded on-disk queue of payloads.
+
+    Each payload is one file named <priority>-<sequence>, written aside and
+    renamed so a crash never leaves a partial message. Files are taken
+    lowest priority number first, then oldest first; when the spool is over
+    its limits the oldest payload of the least important priority is
+    dropped. The directory is listed once, in the constructor.
+
+    Parameters
+    -----------
+    path : str
+        spool directory, created when missing
+    max_bytes : int (optional)
+        total payload size kept (default is 8 MiB)
+    max_files : int (optional)
+        number of payloads kept (default is 10000)
+    """
+
+    def __init__(self, path, max_bytes=8 << 20, max_files=10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.dropped = 0
+        os.makedirs(path, exist_ok=True)
+
+        self._entries = []  # sorted (priority, sequence, size)
+        self._bytes = 0
+        for name in os.listdir(path):
+            try:
+                priority, sequence = (int(part) for part in name.split("-"))
+                size = os.path.getsize(os.path.join(path, name))
+            except (ValueError, OSError):
+                continue
+            self._entries.append((priority, sequence, size))
+            self._bytes += size
+        self._entries.sort()
+        self._sequence = max((entry[1] for entry in self._entries), default=0)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _file(self, entry):
+        return os.path.join(self.path, "{}-{:016d}".format(entry[0], entry[1]))
+
+    def put(self, payload, priority=PRIORITY_TELEMETRY):
+        """Function for storing a payload."""
+        self._sequence += 1
+        entry = (priority, self._sequence, len(payload))
+        path = self._file(entry)
+        with open(path + ".tmp", "wb") as f:
+            f.write(payload)
+        os.replace(path + ".tmp", path)
+        bisect.insort(self._entries, entry)
+        self._bytes += entry[2]
+
+        while self._entries and (len(self._entries) > self.max_files or self._bytes > self.max_bytes):
+            # oldest entry of the last priority present
+            last = self._entries[-1][0]
+            self._remove(self._entries[bisect.bisect_left(self._entries, (last,))])
+            self.dropped += 1
+
+    def peek(self):
+        """
+        Function for getting the next payload without removing it
+
+        Returns
+        -------
+        item : tuple
+            (entry, payload), None when the spool is empty
+        """
+        while self._entries:
+            entry = self._entries[0]
+            try:
+                with open(self._file(entry), "rb") as f:
+                    return entry, f.read()
+            except OSError:
+                # removed behind our back
+                self._entries.pop(0)
+                self._bytes -= entry[2]
+        return None
+
+    def remove(self, entry):
+        """Function for removing a payload returned by peek()."""
+        self._remove(entry)
+
+    def _remove(self, entry):
+        self._entries.remove(entry)
+        self._bytes -= entry[2]
+        try:
+            os.unlink(self._file(entry))
+        except OSError:
+            pass
+
+
+class MemoryTransport:
+    """
+    Broker stand-in keeping the published messages in memory, for tests
+    and dry runs. Set connected to False to simulate an unreachable broker.
+    """
+
+    def __init__(self):
+        self.connected = True
+        self.messages = []  # (topic, payload, qos, retain)
+
+    def is_connected(self):
+        return self.connected
+
+    def publish(self, topic, payload, qos=1, retain=False):
+        if not self.connected:
+            return False
+        self.messages.append((topic, payload, qos, retain))
+        return True
+
+    def close(self):
+        pass
+
+
+class PahoTransport:
+    """
+    Connection to an MQTT broker with paho-mqtt, reconnecting in the
+    background.
+
+    Parameters
+    -----------
+    host : str (optional)
+        broker address (default is "localhost")
+    port : int (optional)
+        broker port (default is 1883)
+    client_id : str (optional)
+        MQTT client id (default is "", generated by the broker)
+    keepalive : int (optional)
+        seconds between pings (default is 60)
+    username : str (optional)
+    password : str (optional)
+    """
+
+    def __init__(self, host="localhost", port=1883, client_id="", keepalive=60, username=None, password=None):
+        _require(paho, "paho-mqtt", "mqtt")
+        try:
+            self.client = paho.Client(paho.CallbackAPIVersion.VERSION2, client_id=client_id)
+        except AttributeError:
+            # paho-mqtt < 2.0
+            self.client = paho.Client(client_id=client_id)
+        if username is not None:
+            self.client.username_pw_set(username, password)
+        self.client.reconnect_delay_set(1, 60)
+        self.client.connect_async(host, port, keepalive)
+        self.client.loop_start()
+
+    def is_connected(self):
+        return self.client.is_connected()
+
+    def publish(self, topic, payload, qos=1, retain=False):
+        # paho would queue QoS 1 messages while offline, they are spooled instead
+        if not self.client.is_connected():
+            return False
+        return self.client.publish(topic, payload, qos, retain).rc == paho.MQTT_ERR_SUCCESS
+
+    def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+class MqttPublisher:
+    """
+    Samples snapshots and publishes them in batches over MQTT.
+
+    Parameters
+    -----------
+    source : callable
+        returns a snapshot dict like SixfabPower.get_snapshot(), e.g.
+        api.get_snapshot or lambda: reader.read().to_dict() for the shared
+        memory segment of sixfab-powerd --shm
+    transport : PahoTransport or MemoryTransport
+        connection to the broker
+    topic : str (optional)
+        topic of the batches (default is DEFAULT_TOPIC)
+    fields : sequence (optional)
+        values sent (default is SNAPSHOT_FIELDS)
+    interval : float (optional)
+        seconds between samples in run() (default is 0.1)
+    max_interval : float (optional)
+        seconds after which a sample is kept even if nothing changed (default is 60)
+    batch_size : int (optional)
+        samples per batch (default is 50)
+    batch_interval : float (optional)
+        seconds a kept sample may wait for its batch (default is 10)
+    deadbands : dict (optional)
+        per value deadbands (default is DEFAULT_DEADBANDS)
+    payload_format : str (optional)
+        "json" or "cbor" (default is "json")
+    qos : int (optional)
+        MQTT QoS of the batches (default is 1)
+    spool : DiskSpool (optional)
+        queue for batches the broker did not take, None drops them
+    flush_limit : int (optional)
+        spooled batches sent per sample after a reconnect (default is 10)
+    """
+
+    def __init__(
+        self,
+        source,
+        transport,
+        topic=DEFAULT_TOPIC,
+        fields=SNAPSHOT_FIELDS,
+        interval=0.1,
+        max_interval=60.0,
+        batch_size=50,
+        batch_interval=10.0,
+        deadbands=None,
+        payload_format="json",
+        qos=1,
+        spool=None,
+        flush_limit=10,
+    ):
+        if payload_format not in PAYLOAD_FORMATS:
+            raise ValueError("payload_format must be one of {}".format(PAYLOAD_FORMATS))
+        if payload_format == "cbor":
+            _require(cbor2, "cbor2", "cbor")
+
+        self.source = source
+        self.transport = transport
+        self.topic = topic
+        self.fields = tuple(fields)
+        self.interval = interval
+        self.max_interval = max_interval
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.payload_format = payload_format
+        self.qos = qos
+        self.spool = spool
+        self.flush_limit = flush_limit
+
+        deadbands = DEFAULT_DEADBANDS if deadbands is None else deadbands
+        self._deadbands = tuple(deadbands.get(name, 0) for name in self.fields)
+        self._events = tuple(index for index, name in enumerate(self.fields) if name in EVENT_FIELDS)
+
+        self.samples = 0
+        self.kept = 0
+        self.published = 0
+        self.spooled = 0
+        self.dropped = 0
+        self.overruns = 0  # samples run() started late
+
+        self._last = None  # values of the last kept sample
+        self._last_time = None
+        self._batch = []
+        self._batch_start = None  # epoch seconds of the first sample in _batch
+        self._batch_opened = None  # time.monotonic() of the first sample in _batch
+        self._priority = PRIORITY_TELEMETRY
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _changed(self, values):
+        last = self._last
+        event = False
+        changed = False
+        for index, value in enumerate(values):
+            previous = last[index]
+            if value == previous:
+                continue
+            if value is None or previous is None or abs(value - previous) > self._deadbands[index]:
+                changed = True
+                if index in self._events:
+                    event = True
+        return changed, event
+
+    def sample(self, snapshot, now=None):
+        """
+        Function for offering one snapshot, see the module docstring for
+        which samples are kept
+
+        Parameters
+        -----------
+        snapshot : dict
+            {"timestamp": epoch seconds, <name>: value or None, ...}
+        now : float (optional)
+            time.monotonic() of the sample (default is the current time)
+
+        Returns
+        -------
+        kept : bool
+        """
+        if now is None:
+            now = time.monotonic()
+        self.samples += 1
+        values = [snapshot.get(name) for name in self.fields]
+
+        if self._last is None:
+            changed, event = True, False
+        else:
+            changed, event = self._changed(values)
+        if not changed and now - self._last_time < self.max_interval:
+            return False
+
+        timestamp = snapshot.get("timestamp")
+        if timestamp is None:
+            timestamp = time.time()
+        if not self._batch:
+            self._batch_start = timestamp
+            self._batch_opened = now
+        self._batch.append([int(round((timestamp - self._batch_start) * 1000))] + values)
+        self._last = values
+        self._last_time = now
+        self.kept += 1
+
+        if event:
+            self._priority = PRIORITY_EVENT
+        if event or len(self._batch) >= self.batch_size:
+            self.flush()
+        return True
+
+    def flush(self):
+        """Function for sending the pending samples now, spooling them when the broker does not take them."""
+        if not self._batch:
+            return
+        payload = encode_batch(self.fields, self._batch_start, self._batch, self.payload_format)
+        priority = self._priority
+        self._batch = []
+        self._priority = PRIORITY_TELEMETRY
+
+        # spooled batches go first, the live one queues behind them
+        if (self.spool is None or not len(self.spool)) and self.transport.publish(self.topic, payload, self.qos):
+            self.published += 1
+        elif self.spool is not None:
+            self.spool.put(payload, priority)
+            self.spooled += 1
+        else:
+            self.dropped += 1
+
+    def drain(self, limit=None):
+        """
+        Function for sending spooled batches while the broker is reachable
+
+        Parameters
+        -----------
+        limit : int (optional)
+            batches to send at most (default is flush_limit)
+
+        Returns
+        -------
+        sent : int
+        """
+        if self.spool is None or not self.transport.is_connected():
+            return 0
+        limit = self.flush_limit if limit is None else limit
+        sent = 0
+        while sent < limit:
+            item = self.spool.peek()
+            if item is None:
+                break
+            entry, payload = item
+            if not self.transport.publish(self.topic, payload, self.qos):
+                break
+            self.spool.remove(entry)
+            self.published += 1
+            sent += 1
+        return sent
+
+    def poll(self, now=None):
+        """Function for taking one snapshot from source and sending what is due."""
+        if now is None:
+            now = time.monotonic()
+        self.sample(self.source(), now)
+        if self._batch and now - self._batch_opened >= self.batch_interval:
+            self.flush()
+        self.drain()
+
+    def status(self):
+        """
+        Function for getting the publisher counters
+
+        Returns
+        -------
+        status : dict
+            {"samples", "kept", "published", "spooled", "dropped", "overruns",
+            "pending", "spool"}
+        """
+        return {
+            "samples": self.samples,
+            "kept": self.kept,
+            "published": self.published,
+            "spooled": self.spooled,
+            "dropped": self.dropped + (self.spool.dropped if self.spool is not None else 0),
+            "overruns": self.overruns,
+            "pending": len(self._batch),
+            "spool": len(self.spool) if self.spool is not None else 0,
+        }
+
+    def run(self):
+        """
+        Function for sampling every interval seconds until stop() is called. Blocks the caller.
+
+        A poll that takes longer than interval is counted in overruns and
+        the schedule restarts from it instead of bursting to catch up.
+        """
+        next_time = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception:
+                traceback.print_exc()
+            # fixed rate; after an overrun the schedule restarts instead of bursting
+            next_time += self.interval
+            delay = next_time - time.monotonic()
+            if delay < 0:
+                self.overruns += 1
+                next_time -= delay
+                delay = 0
+            self._stop.wait(delay)
+        self.flush()
+
+    def start(self):
+        """Function for running the publisher on a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="MqttPublisher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Function for stopping the publisher thread started with start(), the pending samples are sent or spooled."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="sixfab-mqtt", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="localhost", help="broker address (default is localhost)")
+    parser.add_argument("--port", type=int, default=1883, help="broker port (default is 1883)")
+    parser.add_argument("--client-id", default="", help="MQTT client id")
+    parser.add_argument("--username", default=None)
+    parser.add_argument("--password", default=os.environ.get("SIXFAB_MQTT_PASSWORD"), help="default is $SIXFAB_MQTT_PASSWORD")
+    parser.add_argument("--topic", default=DEFAULT_TOPIC, help="default is " + DEFAULT_TOPIC)
+    parser.add_argument("--format", choices=PAYLOAD_FORMATS, default="json", help="payload format (default is json)")
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.1,
+        help="seconds between samples (default is 0.1); 10 Hz needs the shared memory segment, "
+        "with --hat a snapshot takes about 0.3 s and the rate is limited by the bus",
+    )
+    parser.add_argument("--max-interval", type=float, default=60.0, help="seconds between samples sent without changes (default is 60)")
+    parser.add_argument("--batch-size", type=int, default=50, help="samples per message (default is 50)")
+    parser.add_argument("--batch-interval", type=float, default=10.0, help="seconds a sample waits for its batch (default is 10)")
+    parser.add_argument("--spool", default=None, help="spool directory (default is ~/.cache/sixfab-power/mqtt-spool)")
+    parser.add_argument("--spool-size", type=int, default=8 << 20, help="spool size in bytes (default is 8 MiB)")
+    parser.add_argument(
+        "--shm",
+        default=None,
+        metavar="PATH",
+        help="shared memory segment of sixfab-powerd --shm --shm-interval 0.1, sampled by default "
+        "(default is /dev/shm/sixfab-power-telemetry)",
+    )
+    parser.add_argument(
+        "--hat",
+        action="store_true",
+        help="read the HAT directly instead of the segment; can not reach 10 Hz, see --interval",
+    )
+    parser.add_argument("--emulator", action="store_true", help="read power_api.emulator directly instead of the segment")
+    parser.add_argument("--dry-run", action="store_true", help="print the payloads instead of connecting to a broker")
+    args = parser.parse_args(argv)
+
+    if not (args.hat or args.emulator):
+        from power_api.shm import TelemetryReader, DEFAULT_PATH
+
+        try:
+            reader = TelemetryReader(args.shm or DEFAULT_PATH)
+        except (OSError, ValueError) as e:
+            parser.error("{} (start sixfab-powerd --shm --shm-interval 0.1, or use --hat)".format(e))
+
+        def source():
+            snapshot = reader.read()
+            return {} if snapshot is None else snapshot.to_dict()
+
+    else:
+        from power_api.power_api import SixfabPower
+
+        if args.emulator:
+            from power_api.emulator import EmulatedBus
+
+            api = SixfabPower(bus=EmulatedBus())
+        else:
+            api = SixfabPower()
+            api.enable_bus_lock()
+        source = api.get_snapshot
+
+    if args.dry_run:
+        transport = MemoryTransport()
+
+        def publish(topic, payload, qos=1, retain=False):
+            print(topic, payload.decode() if args.format == "json" else payload.hex(), flush=True)
+            return True
+
+        transport.publish = publish
+    else:
+        transport = PahoTransport(args.host, args.port, args.client_id, username=args.username, password=args.password)
+
+    publisher = MqttPublisher(
+        source,
+        transport,
+        topic=args.topic,
+        interval=args.interval,
+        max_interval=args.max_interval,
+        batch_size=args.batch_size,
+        batch_interval=args.batch_interval,
+        payload_format=args.format,
+        spool=DiskSpool(args.spool or default_spool_path(), max_bytes=args.spool_size),
+    )
+    try:
+        publisher.run()
+    except KeyboardInterrupt:
+        publisher.flush()
+    finally:
+        transport.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
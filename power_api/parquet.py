@@ -0,0 +1,279 @@
+#!/usr/bin/python3
+"""
+Parquet export of HAT telemetry (needs pyarrow: pip install power_api[parquet]).
+
+    from power_api.parquet import TelemetryWriter, record_telemetry, read_telemetry
+
+    record_telemetry(api, "ups.parquet", interval=1.0, count=3600)
+    table = read_telemetry("ups.parquet", columns=["battery_level"], start=time.time() - 600)
+
+Samples are the dicts of SixfabPower.get_snapshot(). Working mode and fan
+health are stored dictionary encoded with their names, every other value
+as a plain column in the units of its getter.
+"""
+
+import time
+import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from power_api.definitions import Definition
+
+# Dictionaries of the enum columns, None marks values outside of them
+WORKING_MODES = {
+    Definition.ADAPTER_POWERED_AND_CHARGING: "charging",
+    Definition.ADAPTER_POWERED_AND_FULLY_CHARGED: "fully_charged",
+    Definition.BATTERY_POWERED: "battery_powered",
+}
+FAN_HEALTH = {
+    Definition.FAN_HEALTY: "healthy",
+    Definition.FAN_BROKEN: "broken",
+}
+ENUMS = {"working_mode": WORKING_MODES, "fan_health": FAN_HEALTH}
+
+# Exported values: (snapshot field, arrow type name)
+TELEMETRY_FIELDS = (
+    ("input_voltage", "float64"),
+    ("input_current", "float64"),
+    ("input_power", "float64"),
+    ("input_temp", "float64"),
+    ("system_voltage", "float64"),
+    ("system_current", "float64"),
+    ("system_power", "float64"),
+    ("battery_voltage", "float64"),
+    ("battery_current", "float64"),
+    ("battery_power", "float64"),
+    ("battery_temp", "float64"),
+    ("battery_level", "uint8"),
+    ("battery_health", "uint8"),
+    ("fan_speed", "int32"),
+    ("fan_health", "enum"),
+    ("working_mode", "enum"),
+)
+
+DEFAULT_ROW_GROUP_SIZE = 65536
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("power_api.parquet needs pyarrow: pip install pyarrow")
+
+
+def telemetry_schema(fields=TELEMETRY_FIELDS):
+    """
+    Function for getting the Arrow schema of exported telemetry
+
+    Parameters
+    -----------
+    fields : iterable (optional)
+        (field, type name) tuples (default is TELEMETRY_FIELDS)
+
+    Returns
+    -------
+    schema : pyarrow.Schema
+        timestamp [UTC, microseconds] followed by the fields
+    """
+    _require_pyarrow()
+    columns = [pa.field("timestamp", pa.timestamp("us", tz="UTC"), nullable=False)]
+    for name, type_name in fields:
+        if type_name == "enum":
+            type = pa.dictionary(pa.int8(), pa.string())
+        else:
+            type = getattr(pa, type_name)()
+        columns.append(pa.field(name, type))
+    return pa.schema(columns)
+
+
+def _to_datetime(value):
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromtimestamp(value, datetime.timezone.utc)
+
+
+class TelemetryWriter:
+    """
+    Streams telemetry samples into a Parquet file.
+
+    Samples are collected column-wise until row_group_size of them are
+    buffered, then converted to one Arrow record batch and written as a row
+    group, so memory stays bounded by one row group however long the
+    recording runs. The file is complete after close().
+
+    Usage
+    -----
+    with TelemetryWriter("ups.parquet") as writer:
+        writer.write(api.get_snapshot())
+
+    Parameters
+    -----------
+    path : str
+        Parquet file to create
+    row_group_size : int (optional)
+        samples per row group (default is DEFAULT_ROW_GROUP_SIZE)
+    compression : str (optional)
+        Parquet codec (default is "zstd")
+    fields : iterable (optional)
+        (field, type name) tuples (default is TELEMETRY_FIELDS)
+    """
+
+    def __init__(self, path, row_group_size=DEFAULT_ROW_GROUP_SIZE, compression="zstd", fields=TELEMETRY_FIELDS):
+        _require_pyarrow()
+        self.path = path
+        self.row_group_size = row_group_size
+        self.fields = tuple(fields)
+        self.schema = telemetry_schema(self.fields)
+        self.rows = 0
+        self._dictionaries = {}
+        self._codes = {}
+        for name, type_name in self.fields:
+            if type_name == "enum":
+                names = ENUMS[name]
+                self._dictionaries[name] = pa.array(list(names.values()), pa.string())
+                self._codes[name] = {value: code for code, value in enumerate(names)}
+        self._writer = pq.ParquetWriter(path, self.schema, compression=compression)
+        self._reset()
+
+    def _reset(self):
+        self._columns = {"timestamp": []}
+        for name, _ in self.fields:
+            self._columns[name] = []
+
+    def write(self, sample):
+        """
+        Function for adding one sample
+
+        Parameters
+        -----------
+        sample : dict
+            {"timestamp": epoch seconds, <field>: value or None, ...} as
+            returned by SixfabPower.get_snapshot(), missing fields are null
+        """
+        columns = self._columns
+        columns["timestamp"].append(int(sample.get("timestamp", time.time()) * 1000000))
+        for name, _ in self.fields:
+            value = sample.get(name)
+            codes = self._codes.get(name)
+            if codes is not None:
+                value = codes.get(value)
+            columns[name].append(value)
+
+        if len(columns["timestamp"]) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        """Function for writing the buffered samples as a row group."""
+        count = len(self._columns["timestamp"])
+        if count == 0:
+            return
+        arrays = []
+        for field in self.schema:
+            values = self._columns[field.name]
+            dictionary = self._dictionaries.get(field.name)
+            if dictionary is not None:
+                indices = pa.array(values, pa.int8())
+                arrays.append(pa.DictionaryArray.from_arrays(indices, dictionary))
+            else:
+                arrays.append(pa.array(values, field.type))
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        self._writer.write_batch(batch, row_group_size=self.row_group_size)
+        self.rows += count
+        self._reset()
+
+    def close(self):
+        """Function for flushing the remaining samples and finishing the file."""
+        if self._writer is not None:
+            self.flush()
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def record_telemetry(api, path, interval=1.0, count=None, duration=None, timeout=None, **kwargs):
+    """
+    Function for sampling the HAT periodically into a Parquet file
+
+    Parameters
+    -----------
+    api : SixfabPower
+    path : str
+        Parquet file to create
+    interval : float (optional)
+        seconds between samples (default is 1)
+    count : int (optional)
+        number of samples, None runs until duration or KeyboardInterrupt
+    duration : float (optional)
+        seconds to record, None runs until count or KeyboardInterrupt
+    timeout : int (optional)
+        timeout of each getter, see get_snapshot()
+    **kwargs
+        passed to TelemetryWriter
+
+    Returns
+    -------
+    rows : int
+        number of samples written
+    """
+    writer = TelemetryWriter(path, **kwargs)
+    names = [name for name, _ in writer.fields]
+    start = time.monotonic()
+    samples = 0
+    try:
+        while count is None or samples < count:
+            if duration is not None and time.monotonic() - start >= duration:
+                break
+            writer.write(api.get_snapshot(names, timeout))
+            samples += 1
+            delay = start + samples * interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+    return writer.rows
+
+
+def read_telemetry(path, columns=None, start=None, end=None):
+    """
+    Function for reading exported telemetry
+
+    Only the requested columns are decoded, and row groups outside of the
+    time range are skipped using their statistics.
+
+    Parameters
+    -----------
+    path : str
+        Parquet file or directory of files
+    columns : list (optional)
+        fields to read besides timestamp (default is all)
+    start : float/datetime (optional)
+        first time to include, epoch seconds or aware datetime
+    end : float/datetime (optional)
+        time to stop before, epoch seconds or aware datetime
+
+    Returns
+    -------
+    table : pyarrow.Table
+        use table.to_pandas() or table.column(name) to work with it
+    """
+    _require_pyarrow()
+    if columns is not None:
+        columns = ["timestamp"] + [name for name in columns if name != "timestamp"]
+
+    filters = []
+    if start is not None:
+        filters.append(("timestamp", ">=", _to_datetime(start)))
+    if end is not None:
+        filters.append(("timestamp", "<", _to_datetime(end)))
+
+    return pq.read_table(path, columns=columns, filters=filters or None)
@@ -5,7 +5,25 @@ import datetime
 from power_api.command import Command
 from power_api.definitions import Definition
 from power_api.event import Event
+from power_api.exceptions import (
+    crc_check_failed,
+    bus_error,
+    bus_lock_unavailable,
+    device_not_found,
+    response_timeout,
+    command_failed,
+    command_not_supported,
+    invalid_argument,
+)
+from power_api.stats import CommandStats, COMMAND_NAMES, ERROR_CRC, ERROR_BUS, ERROR_NO_RESPONSE, ERROR_OTHER
+from power_api.capture import FrameCapture
+from power_api.registers import REGISTERS
+from power_api.scheduler import BusScheduler
+from power_api.buslock import BusLock
 import os
+import errno
+import threading
+import contextlib
 
 command = Command()
 
@@ -17,6 +35,18 @@ buffer_receive = list()
 buffer_recieve_index = 0
 
 RESPONSE_DELAY = 10
+RETRY_COUNT = 10
+RETRY_DELAY = 100  # [ms] between failed attempts
+
+# The HAT is taken as absent after ABSENT_ATTEMPTS attempts in a row that
+# are not acknowledged, and later transactions fail at once for
+# DEVICE_ABSENT_HOLD seconds.
+ABSENT_ATTEMPTS = 3
+DEVICE_ABSENT_HOLD = 5.0
+NACK_ERRNOS = (errno.EREMOTEIO, errno.ENXIO)
+
+# Serializes add_hook() and remove_hook(), the hook tuples are replaced as a whole
+_hooks_lock = threading.Lock()
 
 START_BYTE_RECIEVED = 0xDC  # Start Byte Recieved
 START_BYTE_SENT = 0xCD  # Start Byte Sent
@@ -35,6 +65,38 @@ COMMAND_TYPE_RESPONSE = 0x02
 DEVICE_ADDRESS = 0x41  # 7 bit address (will be left shifted to add the read write bit)
 BATTERY_TEMP_ADDRESS = 0x48 # This one uses when the battery holder is seperated from HAT.
 
+# Values read by SixfabPower.get_snapshot(), each one has a get_<name> method
+SNAPSHOT_FIELDS = (
+    "input_temp",
+    "input_voltage",
+    "input_current",
+    "input_power",
+    "system_voltage",
+    "system_current",
+    "system_power",
+    "battery_temp",
+    "battery_voltage",
+    "battery_current",
+    "battery_power",
+    "battery_level",
+    "battery_health",
+    "fan_speed",
+    "fan_health",
+    "working_mode",
+)
+
+# Commands answering Definition.SET_OK or Definition.SET_FAILED
+SET_RESULT_COMMANDS = frozenset(
+    command_num
+    for command_num, name in COMMAND_NAMES.items()
+    if not name.startswith(("GET_", "IS_"))
+)
+
+# Steps run by SixfabPower.shutdown_sequence(): (method name, args, kwargs)
+DEFAULT_SHUTDOWN_STEPS = (
+    ("set_edm_status", (1,), {"timeout": 500}),
+)
+
 ###########################################
 ### Private Methods #######################
 ###########################################
@@ -55,38 +117,233 @@ def delay_ms(ms):
     time.sleep(float(ms / 1000.0))
 
 
-def retry_command(command_num, size, timeout=RESPONSE_DELAY):
-    for i in range(10):
-        try:
-            command.create_command(command_num)
-            command.send_command()
-            delay_ms(timeout)
-            raw = command.receive_command(size)
-        except:
-            pass
+def transaction(command, command_num, size, timeout, build, args):
+    """
+    Function for running one request/response exchange with retries.
+
+    Every getter and setter goes through here. When command.stats is set
+    each attempt is classified and the transaction is recorded, and the
+    pre/post hooks of the command are called around it. With a
+    command.scheduler each attempt waits for its turn on the bus and with a
+    command.lock it holds the cross-process bus lock. command.deadline bounds
+    the waits and retries.
+
+    The error of a failed transaction is kept in command.last_error and
+    raised when command.strict is set. A HAT that does not acknowledge
+    ABSENT_ATTEMPTS attempts in a row is cached as absent, so transactions
+    fail without bus access for DEVICE_ABSENT_HOLD seconds. Deadline bounded
+    transactions ignore that cache and keep trying until their budget ends.
+    Commands in command.unsupported fail at once as well.
+    """
+    stats = command.stats
+    scheduler = command.scheduler
+    lock = command.lock
+    deadline = command.deadline
+    for hook in command.pre_hooks:
+        hook(command_num)
+
+    start = time.perf_counter()
+    bytes_sent = 0
+    attempts = 0
+    slept = 0
+    raw = None
+    error = None
+    nacks = 0
+    retry_delay = RETRY_DELAY
+    max_attempts = RETRY_COUNT
+
+    if command_num in command.unsupported:
+        error = command_not_supported(
+            "{} is not supported by the firmware".format(COMMAND_NAMES.get(command_num, command_num))
+        )
+        max_attempts = 0
+    elif deadline is None and command.absent_until is not None:
+        if time.monotonic() < command.absent_until:
+            error = device_not_found("HAT is not responding at 0x{:02X}".format(DEVICE_ADDRESS))
+            max_attempts = 0
         else:
-            if raw != None:
-                return raw
-
-        delay_ms(100)
-    return None
-
-
-def retry_set_command(command_num, size, value, value_len, timeout=RESPONSE_DELAY):
-    for i in range(10):
+            command.absent_until = None
+
+    while attempts < max_attempts:
+        if deadline is not None:
+            # waits are cut to what is left of the budget, no attempt is
+            # started once it is spent
+            remaining = (deadline - time.monotonic()) * 1000
+            if remaining <= 0:
+                break
+            timeout = min(timeout, remaining)
+
+        attempts += 1
         try:
-            command.create_set_command(command_num, value, value_len)
-            command.send_command()
-            delay_ms(timeout)
-            raw = command.receive_command(size)
-        except:
-            pass
+            # the bus is held for one attempt only, more urgent commands
+            # can go first during the retry delay
+            if scheduler is not None:
+                scheduler.acquire(command_num)
+            try:
+                if lock is not None:
+                    lock.acquire()
+                try:
+                    build(*args)
+                    bytes_sent += len(command.buffer_send)
+                    command.send_command()
+                    delay_ms(timeout)
+                    slept += timeout
+                    raw = command.receive_command(size)
+                finally:
+                    if lock is not None:
+                        lock.release()
+            finally:
+                if scheduler is not None:
+                    scheduler.release()
+        except Exception as e:
+            raw = None
+            error = e
+            if stats is not None:
+                if isinstance(e, crc_check_failed):
+                    kind = ERROR_CRC
+                elif isinstance(e, response_timeout):
+                    kind = ERROR_NO_RESPONSE
+                elif isinstance(e, bus_error):
+                    kind = ERROR_BUS
+                else:
+                    kind = ERROR_OTHER
+                stats.error(command_num, kind)
+
+            if isinstance(e, device_not_found) and deadline is None:
+                # the bus itself is missing
+                command.absent_until = time.monotonic() + DEVICE_ABSENT_HOLD
+                break
+            if isinstance(e, bus_lock_unavailable):
+                # a retry can not open the lock file either
+                break
+            nacks = nacks + 1 if isinstance(e, bus_error) and e.errno in NACK_ERRNOS else 0
+            if nacks >= ABSENT_ATTEMPTS and deadline is None:
+                command.absent_until = time.monotonic() + DEVICE_ABSENT_HOLD
+                error = device_not_found(
+                    "HAT did not acknowledge {} attempts at 0x{:02X}".format(nacks, DEVICE_ADDRESS)
+                )
+                error.__cause__ = e
+                break
         else:
             if raw != None:
-                return raw
+                command.absent_until = None
+                break
+
+        if command.retry_budget is not None and attempts < max_attempts:
+            # retries are drawn from a budget shared by a whole batch, see
+            # SixfabPower.execute_batch()
+            if command.retry_budget <= 0:
+                break
+            command.retry_budget -= 1
+
+        if deadline is not None:
+            retry_delay = max(0, min(RETRY_DELAY, (deadline - time.monotonic()) * 1000))
+        delay_ms(retry_delay)
+        slept += retry_delay
+
+    if stats is not None:
+        stats.record(
+            command_num,
+            time.perf_counter() - start,
+            attempts,
+            raw is not None,
+            bytes_sent,
+            attempts * size,
+            slept / 1000.0,
+        )
+
+    if raw is None and command.capture is not None:
+        command.capture.failed()
+
+    calls = command._calls
+    if calls is not None:
+        counted = getattr(calls, "attempts", None)
+        if counted is not None:
+            calls.attempts = counted + attempts
+
+    for hook in command.post_hooks:
+        hook(command_num, raw, time.perf_counter() - start, attempts)
+
+    if raw is None:
+        if error is None:
+            error = response_timeout("Deadline passed before a response was received")
+        command.last_error = error
+        if command.strict:
+            raise error
+    else:
+        command.last_error = None
+        if (
+            command.strict
+            and size == COMMAND_SIZE_FOR_UINT8
+            and command_num in SET_RESULT_COMMANDS
+            and raw[PROTOCOL_HEADER_SIZE] == Definition.SET_FAILED
+        ):
+            raise command_failed("{} answered SET_FAILED".format(COMMAND_NAMES[command_num]))
+
+    return raw
+
+
+class exclusive:
+    """
+    Context manager holding the bus for frames sent outside transaction(),
+    a no-op unless a scheduler or bus lock is attached to the command.
+    """
 
-        delay_ms(100)
-    return None
+    def __init__(self, command, command_num):
+        self.scheduler = command.scheduler
+        self.lock = command.lock
+        self.command_num = command_num
+
+    def __enter__(self):
+        if self.scheduler is not None:
+            self.scheduler.acquire(self.command_num)
+        if self.lock is not None:
+            try:
+                self.lock.acquire()
+            except:
+                if self.scheduler is not None:
+                    self.scheduler.release()
+                raise
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.lock is not None:
+            self.lock.release()
+        if self.scheduler is not None:
+            self.scheduler.release()
+
+
+def retry_command(command_num, size, timeout=RESPONSE_DELAY, command=command):
+    return transaction(
+        command, command_num, size, timeout, command.create_command, (command_num,)
+    )
+
+
+def retry_set_command(command_num, size, value, value_len, timeout=RESPONSE_DELAY, command=command):
+    # a value that does not fit is a caller error, not worth a bus access or
+    # retry; like SixfabPower._invalid_argument() it is only raised in strict
+    # mode, otherwise the setter answers SET_FAILED
+    message = None
+    if isinstance(value, int):
+        if value < 0 or value >= 1 << (8 * value_len):
+            message = "{} value {} does not fit in {} bytes".format(COMMAND_NAMES.get(command_num), value, value_len)
+    elif not isinstance(value, (bytes, bytearray)) or len(value) < value_len:
+        message = "{} value must be int or {} bytes".format(COMMAND_NAMES.get(command_num), value_len)
+    if message is not None:
+        error = invalid_argument(message)
+        command.last_error = error
+        if command.strict:
+            raise error
+        response = bytearray(size)
+        response[PROTOCOL_HEADER_SIZE] = Definition.SET_FAILED
+        return bytes(response)
+    return transaction(
+        command,
+        command_num,
+        size,
+        timeout,
+        command.create_set_command,
+        (command_num, value, value_len),
+    )
 
 
 #############################################################
@@ -101,9 +358,214 @@ class SixfabPower:
     board = "Sixfab Raspberry Pi UPS HAT"
 
     # Initializer function
-    def __init__(self):
+    def __init__(self, bus=None, strict=False):
         # debug_print(self.board + " Class initialized!")
-        pass
+        # bus : smbus2 compatible object, the shared SMBus(1) when None
+        # strict : raise power_api.exceptions errors instead of returning None
+        #          or SET_FAILED, strict instances get a Command of their own
+        if bus is None and not strict:
+            self.command = command
+        else:
+            self.command = Command(bus)
+            self.command.strict = strict
+
+    def last_error(self):
+        """
+        Function for getting why the last command failed
+        
+        Returns
+        ------- 
+        error : Exception
+            device_not_found, bus_error, response_timeout, crc_check_failed or
+            invalid_argument from power_api.exceptions, None after a success
+        """
+        return self.command.last_error
+
+    def _invalid_argument(self, message):
+        # arguments are checked before any bus access, like the transport
+        # errors they are only raised in strict mode
+        error = invalid_argument(message)
+        self.command.last_error = error
+        if self.command.strict:
+            raise error
+        return Definition.SET_FAILED
+
+    def probe_capabilities(self, cache_path=None, refresh=False, timeout=RESPONSE_DELAY):
+        """
+        Function for finding out which commands the firmware supports
+
+        The read-only commands are sent once each and the ones left
+        unanswered are marked unsupported, together with their SET
+        counterparts. The result is stored in a cache file keyed by the
+        firmware version, so later runs only read the version. Afterwards
+        unsupported commands fail at once (raising command_not_supported in
+        strict mode) and get_snapshot() skips their fields.
+
+        Parameters
+        -----------
+        cache_path : str (optional)
+            cache file (default is ~/.cache/sixfab-power/capabilities.json)
+        refresh : bool (optional)
+            probe even if the version is cached (default is False)
+        timeout : int (optional)
+            timeout while receiving each probe response (default is RESPONSE_DELAY)
+
+        Returns
+        -------
+        capabilities : dict
+            {"firmware": version, "unsupported": [command names], "cached": bool},
+            None when the firmware version could not be read
+        """
+        from power_api import capabilities
+
+        return capabilities.negotiate(self, cache_path, refresh, timeout)
+
+    #############################################################
+    ### Instrumentation #########################################
+    #############################################################
+
+    def enable_stats(self):
+        """
+        Function for enabling transaction counters and latency histograms.
+        Instances created without a bus share the default Command and so
+        share its counters.
+        """
+        if self.command.stats is None:
+            self.command.stats = CommandStats()
+
+    def disable_stats(self):
+        """Function for disabling and dropping transaction counters."""
+        self.command.stats = None
+
+    def stats(self):
+        """
+        Function for getting transaction counters
+        
+        Returns
+        ------- 
+        stats : dict
+            see CommandStats.snapshot(), None while stats are disabled
+        """
+        if self.command.stats is None:
+            return None
+        return self.command.stats.snapshot()
+
+    def enable_capture(self, capacity=4096, dump_on_error=None):
+        """
+        Function for recording every sent and received frame in a ring buffer
+        
+        Parameters
+        -----------
+        capacity : int (optional)
+            number of frames kept (default is 4096)
+        dump_on_error : str (optional)
+            capture file written whenever a command runs out of retries
+
+        Returns
+        ------- 
+        capture : FrameCapture
+            use capture.dump(path) to save it, see python3 -m power_api.replay
+        """
+        self.command.capture = FrameCapture(capacity, dump_on_error)
+        return self.command.capture
+
+    def disable_capture(self):
+        """Function for stopping the frame capture."""
+        self.command.capture = None
+
+    def enable_scheduler(self, rate_limits=None):
+        """
+        Function for dispatching bus transactions by priority class
+        (safety, control, telemetry, bulk), see power_api.scheduler
+        
+        Parameters
+        -----------
+        rate_limits : dict (optional)
+            {priority: (transactions per second, burst)}, e.g.
+            {PRIORITY_TELEMETRY: (20, 5)}
+
+        Returns
+        ------- 
+        scheduler : BusScheduler
+            use scheduler.snapshot() for the queue wait metrics
+        """
+        if self.command.scheduler is None:
+            self.command.scheduler = BusScheduler(rate_limits)
+        elif rate_limits:
+            for priority, (rate, burst) in rate_limits.items():
+                self.command.scheduler.set_rate_limit(priority, rate, burst)
+        return self.command.scheduler
+
+    def disable_scheduler(self):
+        """Function for removing the transaction scheduler."""
+        self.command.scheduler = None
+
+    def enable_bus_lock(self, path=None, timeout=5.0):
+        """
+        Function for serializing bus transactions with other processes
+        through a flock()ed lock file, see power_api.buslock
+        
+        Parameters
+        -----------
+        path : str (optional)
+            lock file, must be the same for all processes (default is
+            /run/lock/sixfab-power-i2c-1.lock)
+        timeout : float (optional)
+            seconds to wait for a holder before the attempt fails (default is 5)
+
+        Returns
+        ------- 
+        lock : BusLock
+        """
+        if self.command.lock is None:
+            self.command.lock = BusLock(path, timeout)
+        return self.command.lock
+
+    def disable_bus_lock(self):
+        """Function for stopping to use the cross-process bus lock."""
+        lock = self.command.lock
+        self.command.lock = None
+        if lock is not None:
+            lock.close()
+
+    def bus_session(self):
+        """
+        Function for holding the cross-process bus lock over several calls,
+        a no-op without enable_bus_lock()
+
+        Usage
+        -----
+        with api.bus_session():
+            level = api.get_battery_level()
+            mode = api.get_working_mode()
+        """
+        if self.command.lock is None:
+            return contextlib.nullcontext()
+        return self.command.lock
+
+    def add_hook(self, pre=None, post=None):
+        """
+        Function for registering transaction hooks
+        
+        Parameters
+        -----------
+        pre : callable (optional)
+            called as pre(command_id) before the first attempt
+        post : callable (optional)
+            called as post(command_id, raw, elapsed, attempts) when the
+            transaction is over, raw is None when every attempt failed
+        """
+        with _hooks_lock:
+            if pre is not None:
+                self.command.pre_hooks += (pre,)
+            if post is not None:
+                self.command.post_hooks += (post,)
+
+    def remove_hook(self, hook):
+        """Function for removing a hook registered with add_hook()."""
+        with _hooks_lock:
+            self.command.pre_hooks = tuple(h for h in self.command.pre_hooks if h != hook)
+            self.command.post_hooks = tuple(h for h in self.command.post_hooks if h != hook)
 
     def __del__(self):
         # print("Class Destructed")
@@ -129,7 +591,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_INPUT_TEMP,
             COMMAND_SIZE_FOR_INT32,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -156,7 +619,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_INPUT_VOLTAGE,
             COMMAND_SIZE_FOR_INT32,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -184,7 +648,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_INPUT_CURRENT,
             COMMAND_SIZE_FOR_INT32,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -212,7 +677,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_INPUT_POWER,
             COMMAND_SIZE_FOR_INT32,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -268,7 +734,8 @@ class SixfabPower:
             COMMAND_SIZE_FOR_UINT8,
             int(tempInt),
             4,
-            timeout
+            timeout,
+            self.command
         )
         
         if raw != None:
@@ -278,6 +745,100 @@ class SixfabPower:
         else:
             return None
         
+    def send_battery_temperature(self, temperature, timeout=RESPONSE_DELAY):
+        """
+        Function for sending the temperature of a separated battery holder to mcu
+        ** NOTE: Only used while battery separation is enabled, see power_api.batterytemp
+        
+        Parameters
+        -----------
+        temperature : float
+            battery temperature [Celsius] [min : -40 , max : 125]
+        timeout : int (optional)
+            timeout while receiving the response (default is RESPONSE_DELAY)
+
+        Returns
+        ------- 
+        result : int
+            "1" for SET OK, "2" for SET FAILED
+        """
+        if not -40 <= temperature <= 125:
+            return self._invalid_argument("temperature must be between -40 and 125")
+        value = bytearray(int(round(temperature * 100)).to_bytes(4, "big", signed=True))
+
+        raw = retry_set_command(
+            command.PROTOCOL_COMMAND_SEND_BATTERY_TEMPERATURE,
+            COMMAND_SIZE_FOR_UINT8,
+            value,
+            4,
+            timeout,
+            self.command
+        )
+        if raw != None:
+            result = raw[PROTOCOL_HEADER_SIZE]
+            return result
+        else:
+            return None
+
+    def get_battery_separation_status(self, timeout=RESPONSE_DELAY):
+        """
+        Function for getting battery separation status
+        
+        Parameters
+        -----------
+        timeout : int (optional)
+            timeout while receiving the response (default is RESPONSE_DELAY)
+
+        Returns
+        ------- 
+        status : int
+            "1" for SEPARATED (temperature from the sensor at 0x48), "2" for ON HAT
+        """
+        raw = retry_command(
+            command.PROTOCOL_COMMAND_GET_BATTERY_SEPARATION_STATUS,
+            COMMAND_SIZE_FOR_UINT8,
+            timeout,
+            self.command
+        )
+
+        if raw != None:
+            status = raw[PROTOCOL_HEADER_SIZE]
+            return status
+        else:
+            return None
+
+    def set_battery_separation_status(self, status, timeout=RESPONSE_DELAY):
+        """
+        Function for setting battery separation status
+        
+        Parameters
+        -----------
+        status : int
+            "1" for SEPARATED, "2" for ON HAT
+        timeout : int (optional)
+            timeout while receiving the response (default is RESPONSE_DELAY)
+
+        Returns
+        ------- 
+        result : int
+            "1" for SET OK, "2" for SET FAILED
+        """
+        if not 1 <= status <= 2:
+            return self._invalid_argument("status must be between 1 and 2")
+        raw = retry_set_command(
+            command.PROTOCOL_COMMAND_SET_BATTERY_SEPARATION_STATUS,
+            COMMAND_SIZE_FOR_UINT8,
+            status,
+            1,
+            timeout,
+            self.command
+        )
+        if raw != None:
+            result = raw[PROTOCOL_HEADER_SIZE]
+            return result
+        else:
+            return None
+
     def get_system_voltage(self, timeout=RESPONSE_DELAY):
         """
         Function for getting system voltage
@@ -295,7 +856,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_SYSTEM_VOLTAGE,
             COMMAND_SIZE_FOR_INT32,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -323,7 +885,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_SYSTEM_CURRENT,
             COMMAND_SIZE_FOR_INT32,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -351,7 +914,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_SYSTEM_POWER,
             COMMAND_SIZE_FOR_INT32,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -379,7 +943,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_BATTERY_TEMP,
             COMMAND_SIZE_FOR_INT32,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:    
@@ -407,7 +972,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_BATTERY_VOLTAGE,
             COMMAND_SIZE_FOR_INT32,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -435,7 +1001,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_BATTERY_CURRENT,
             COMMAND_SIZE_FOR_INT32,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -463,7 +1030,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_BATTERY_POWER,
             COMMAND_SIZE_FOR_INT32,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -491,7 +1059,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_BATTERY_LEVEL,
             COMMAND_SIZE_FOR_INT32,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -519,7 +1088,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_FAN_HEALTH,
             COMMAND_SIZE_FOR_INT32,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -547,7 +1117,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_BATTERY_HEALTH,
             COMMAND_SIZE_FOR_INT32,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -575,7 +1146,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_FAN_SPEED,
             COMMAND_SIZE_FOR_INT32,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -604,7 +1176,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_WATCHDOG_STATUS,
             COMMAND_SIZE_FOR_UINT8,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -628,12 +1201,15 @@ class SixfabPower:
         result : int
             "1" for SET OK, "2" for SET FAILED 
         """
+        if not 1 <= status <= 2:
+            return self._invalid_argument("status must be between 1 and 2")
         raw = retry_set_command(
             command.PROTOCOL_COMMAND_SET_WATCHDOG_STATUS,
             COMMAND_SIZE_FOR_UINT8,
             status,
             1,
-            timeout
+            timeout,
+            self.command
         )
         if raw != None:
             result = raw[PROTOCOL_HEADER_SIZE]
@@ -658,6 +1234,12 @@ class SixfabPower:
         result : int
             "1" for SET OK, "2" for SET FAILED 
         """
+        if not 1 <= anim_type <= 3:
+            return self._invalid_argument("anim_type must be between 1 and 3")
+        if not 1 <= color <= 8:
+            return self._invalid_argument("color must be between 1 and 8")
+        if not 1 <= speed <= 3:
+            return self._invalid_argument("speed must be between 1 and 3")
         value = bytearray()
         value.append(int(anim_type))
         value.append(int(color))
@@ -668,7 +1250,8 @@ class SixfabPower:
             COMMAND_SIZE_FOR_UINT8,
             value,
             3,
-            timeout
+            timeout,
+            self.command
         )
         if raw != None:
             result = raw[PROTOCOL_HEADER_SIZE]
@@ -715,7 +1298,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_RGB_ANIMATION,
             10,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -745,6 +1329,10 @@ class SixfabPower:
             "1" for SET OK, "2" for SET FAILED 
         """
 
+        if not 0 <= slow_threshold <= 100:
+            return self._invalid_argument("slow_threshold must be between 0 and 100")
+        if not 0 <= fast_threshold <= 100:
+            return self._invalid_argument("fast_threshold must be between 0 and 100")
         value = bytearray()
         value.append(int(slow_threshold))
         value.append(int(fast_threshold))
@@ -754,7 +1342,8 @@ class SixfabPower:
             COMMAND_SIZE_FOR_UINT8,
             value,
             2,
-            timeout
+            timeout,
+            self.command
         )
         if raw != None:
             result = raw[PROTOCOL_HEADER_SIZE]
@@ -779,7 +1368,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_FAN_AUTOMATION,
             COMMAND_SIZE_FOR_INT16,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -806,12 +1396,15 @@ class SixfabPower:
         result : int
             "1" for SET OK, "2" for SET FAILED
         """
+        if not 60 <= level <= 100:
+            return self._invalid_argument("level must be between 60 and 100")
         raw = retry_set_command(
             command.PROTOCOL_COMMAND_SET_BATTERY_MAX_CHARGE_LEVEL,
             COMMAND_SIZE_FOR_UINT8,
             level,
             1,
-            timeout
+            timeout,
+            self.command
         )
         if raw != None:
             level = raw[PROTOCOL_HEADER_SIZE]
@@ -836,7 +1429,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_BATTERY_MAX_CHARGE_LEVEL,
             COMMAND_SIZE_FOR_UINT8,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -862,7 +1456,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_WORKING_MODE,
             COMMAND_SIZE_FOR_UINT8,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -888,7 +1483,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_BUTTON1_STATUS,
             COMMAND_SIZE_FOR_UINT8,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -914,7 +1510,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_BUTTON2_STATUS,
             COMMAND_SIZE_FOR_UINT8,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -939,12 +1536,15 @@ class SixfabPower:
         result : int
             "1" for SET_OK, "2" for SET_FAILED
         """
+        if not 0 <= timestamp <= 0xFFFFFFFF:
+            return self._invalid_argument("timestamp must be between 0 and 0xFFFFFFFF")
         raw = retry_set_command(
             command.PROTOCOL_COMMAND_SET_RTC_TIME,
             COMMAND_SIZE_FOR_UINT8,
             timestamp,
             4,
-            timeout
+            timeout,
+            self.command
         )
         if raw != None:
             result = raw[PROTOCOL_HEADER_SIZE]
@@ -974,7 +1574,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_RTC_TIME,
             COMMAND_SIZE_FOR_INT32,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -1018,7 +1619,8 @@ class SixfabPower:
             COMMAND_SIZE_FOR_UINT8,
             1,
             1,
-            timeout
+            timeout,
+            self.command
         )
         if raw != None:
             status = raw[PROTOCOL_HEADER_SIZE]
@@ -1043,7 +1645,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_BATTERY_DESIGN_CAPACITY,
             COMMAND_SIZE_FOR_INT16,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -1070,12 +1673,15 @@ class SixfabPower:
         result : int
             "1" for SET_OK, "2" for SET_FAILED 
         """
+        if not 100 <= capacity <= 10000:
+            return self._invalid_argument("capacity must be between 100 and 10000")
         raw = retry_set_command(
             command.PROTOCOL_COMMAND_SET_BATTERY_DESIGN_CAPACITY,
             COMMAND_SIZE_FOR_UINT8,
             capacity,
             2,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -1162,6 +1768,12 @@ class SixfabPower:
         result : int
             "1" for SET_OK, "2" for SET_FAILED 
         """
+        if not 1 <= event_id <= 10:
+            return self._invalid_argument("event_id must be between 1 and 10")
+        if not 0 <= time_or_interval <= 0xFFFFFFFF:
+            return self._invalid_argument("time_or_interval must be between 0 and 0xFFFFFFFF")
+        if not 0 <= repeat_period <= 255:
+            return self._invalid_argument("repeat_period must be between 0 and 255")
         value = bytearray()
         value.append(event_id)
         value.append(schedule_type)
@@ -1179,7 +1791,8 @@ class SixfabPower:
             COMMAND_SIZE_FOR_UINT8,
             value,
             10,
-            timeout
+            timeout,
+            self.command
         )
         
         if raw != None:
@@ -1221,7 +1834,8 @@ class SixfabPower:
             COMMAND_SIZE_FOR_UINT8,
             value,
             10,
-            timeout
+            timeout,
+            self.command
         )
         
         if raw != None:
@@ -1247,7 +1861,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_SCHEDULED_EVENT_IDS,
             COMMAND_SIZE_FOR_INT16,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -1279,12 +1894,15 @@ class SixfabPower:
         result : int
             "1" for SET_OK, "2" for SET_FAILED
         """
+        if not 1 <= event_id <= 10:
+            return self._invalid_argument("event_id must be between 1 and 10")
         raw = retry_set_command(
             command.PROTOCOL_COMMAND_REMOVE_SCHEDULED_EVENT,
             COMMAND_SIZE_FOR_UINT8,
             event_id,
             1,
-            timeout
+            timeout,
+            self.command
         )
         
         if raw != None:
@@ -1310,7 +1928,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_REMOVE_ALL_SCHEDULED_EVENTS,
             COMMAND_SIZE_FOR_UINT8,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -1338,7 +1957,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_FIRMWARE_VER,
             15,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -1423,25 +2043,26 @@ class SixfabPower:
 
                 last_process = process
 
-            # send data to MCU
+            # send data to MCU, other commands may use the bus between packets
             if data:
-                if packet_id == packet_count:
-                    command.create_firmware_update_command(
-                        packet_count,
-                        requesting_packet_id,
-                        data,
-                        packet_len=leap_packet_size,
-                    )
-                    command.send_command()
-                    delay_ms(timeout)
-                    raw = command.receive_command(COMMAND_SIZE_FOR_INT16)
-                else:
-                    command.create_firmware_update_command(
-                        packet_count, requesting_packet_id, data
-                    )
-                    command.send_command()
-                    delay_ms(timeout)
-                    raw = command.receive_command(COMMAND_SIZE_FOR_INT16)
+                with exclusive(self.command, command.PROTOCOL_COMMAND_FIRMWARE_UPDATE):
+                    if packet_id == packet_count:
+                        self.command.create_firmware_update_command(
+                            packet_count,
+                            requesting_packet_id,
+                            data,
+                            packet_len=len(data),
+                        )
+                        self.command.send_command()
+                        delay_ms(timeout)
+                        raw = self.command.receive_command(COMMAND_SIZE_FOR_INT16)
+                    else:
+                        self.command.create_firmware_update_command(
+                            packet_count, requesting_packet_id, data
+                        )
+                        self.command.send_command()
+                        delay_ms(timeout)
+                        raw = self.command.receive_command(COMMAND_SIZE_FOR_INT16)
 
                 try:
                     requesting_packet_id = (raw[5] << 8) | (raw[6] & 0xFF)
@@ -1477,7 +2098,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_CLEAR_PROGRAM_STORAGE,
             COMMAND_SIZE_FOR_UINT8,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -1499,8 +2121,9 @@ class SixfabPower:
         None
         """
         try:
-            command.create_command(command.PROTOCOL_COMMAND_RESET_MCU)
-            command.send_command()
+            with exclusive(self.command, command.PROTOCOL_COMMAND_RESET_MCU):
+                self.command.create_command(command.PROTOCOL_COMMAND_RESET_MCU)
+                self.command.send_command()
         except:
             return None
         else:
@@ -1519,8 +2142,9 @@ class SixfabPower:
         None
         """
         try:
-            command.create_command(command.PROTOCOL_COMMAND_RESET_MCU_FOR_BOOT_UPDATE)
-            command.send_command()
+            with exclusive(self.command, command.PROTOCOL_COMMAND_RESET_MCU_FOR_BOOT_UPDATE):
+                self.command.create_command(command.PROTOCOL_COMMAND_RESET_MCU_FOR_BOOT_UPDATE)
+                self.command.send_command()
         except:
             return None
         else:
@@ -1547,12 +2171,15 @@ class SixfabPower:
         result : int
             "1" for SET OK, "2" for SET FAILED
         """
+        if not 1 <= status <= 2:
+            return self._invalid_argument("status must be between 1 and 2")
         raw = retry_set_command(
             command.PROTOCOL_COMMAND_SET_EASY_DEPLOYMENT_MODE,
             COMMAND_SIZE_FOR_UINT8,
             status,
             1,
-            timeout
+            timeout,
+            self.command
         )
         
         if raw != None:
@@ -1561,6 +2188,35 @@ class SixfabPower:
         else:
             return None
         
+    def is_any_soft_action_exist(self, timeout=RESPONSE_DELAY):
+        """
+        Function for checking if the MCU asks the end device for a soft shutdown or reboot,
+        e.g. for a scheduled SOFT_POWER_OFF event. The MCU reports a pending action once.
+        See power_api.softaction.SoftActionAgent for carrying it out.
+
+        Parameters
+        -----------
+        timeout : int (optional)
+            timeout while receiving the response (default is RESPONSE_DELAY)
+
+        Returns
+        ------- 
+        action : int
+            Definition.ACTION_SOFT_SHUTDOWN, Definition.ACTION_SOFT_REBOOT or Definition.NO_SOFT_ACTION
+        """
+        raw = retry_command(
+            command.PROTOCOL_COMMAND_IS_ANY_SOFT_ACTION_EXIST,
+            COMMAND_SIZE_FOR_UINT8,
+            timeout,
+            self.command
+        )
+
+        if raw != None:
+            action = raw[PROTOCOL_HEADER_SIZE]
+            return action
+        else:
+            return None
+
     def get_edm_status(self, timeout=RESPONSE_DELAY):
         """
         Function for getting easy deployment mode status. The EDM mode provides ulta power saving 
@@ -1580,7 +2236,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_EASY_DEPLOYMENT_MODE,
             COMMAND_SIZE_FOR_UINT8,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -1605,12 +2262,15 @@ class SixfabPower:
         result : int
             "1" for SET OK, "2" for SET FAILED
         """
+        if not 1 <= mode <= 3:
+            return self._invalid_argument("mode must be between 1 and 3")
         raw = retry_set_command(
             command.PROTOCOL_COMMAND_SET_FAN_MODE,
             COMMAND_SIZE_FOR_UINT8,
             mode,
             1,
-            timeout
+            timeout,
+            self.command
         )
         
         if raw != None:
@@ -1636,7 +2296,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_FAN_MODE,
             COMMAND_SIZE_FOR_UINT8,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -1662,16 +2323,16 @@ class SixfabPower:
             "1" for SET OK, "2" for SET FAILED
         """
 
-        if(interval < 4) or (interval > 180):
-            print("Wrong argument. min:4 max:180")
-            return 2
+        if not 4 <= interval <= 180:
+            return self._invalid_argument("interval must be between 4 and 180")
 
         raw = retry_set_command(
             command.PROTOCOL_COMMAND_SET_WATCHDOG_INTERVAL,
             COMMAND_SIZE_FOR_UINT8,
             interval,
             1,
-            timeout
+            timeout,
+            self.command
         )
         
         if raw != None:
@@ -1698,7 +2359,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_WATCHDOG_INTERVAL,
             COMMAND_SIZE_FOR_UINT8,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -1723,7 +2385,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_POWER_OUTAGE_PARAMS,
             COMMAND_SIZE_FOR_INT32,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -1763,6 +2426,10 @@ class SixfabPower:
             "1" for SET_OK, "2" for SET_FAILED 
         """
 
+        if not 2 <= sleep_time <= 1439:
+            return self._invalid_argument("sleep_time must be between 2 and 1439")
+        if not 0 <= run_time <= 1437:
+            return self._invalid_argument("run_time must be between 0 and 1437")
         params = bytearray()
         params.append((sleep_time >> 8) & 0xFF)
         params.append(sleep_time & 0xFF)
@@ -1774,7 +2441,8 @@ class SixfabPower:
             COMMAND_SIZE_FOR_UINT8,
             params,
             4,
-            timeout
+            timeout,
+            self.command
         )
         
         if raw != None:
@@ -1801,7 +2469,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_POWER_OUTAGE_EVENT_STATUS,
             COMMAND_SIZE_FOR_UINT8,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -1827,12 +2496,15 @@ class SixfabPower:
         result : int
             "1" for SET OK, "2" for SET FAILED
         """
+        if not 1 <= status <= 2:
+            return self._invalid_argument("status must be between 1 and 2")
         raw = retry_set_command(
             command.PROTOCOL_COMMAND_SET_POWER_OUTAGE_EVENT_STATUS,
             COMMAND_SIZE_FOR_UINT8,
             status,
             1,
-            timeout
+            timeout,
+            self.command
         )
         
         if raw != None:
@@ -1859,7 +2531,8 @@ class SixfabPower:
         raw = retry_command(
             command.PROTOCOL_COMMAND_GET_END_DEVICE_ALIVE_THRESHOLD,
             COMMAND_SIZE_FOR_INT16,
-            timeout
+            timeout,
+            self.command
         )
 
         if raw != None:
@@ -1886,12 +2559,15 @@ class SixfabPower:
         result : int
             "1" for SET_OK, "2" for SET_FAILED 
         """
+        if not 0 <= threshold <= 3000:
+            return self._invalid_argument("threshold must be between 0 and 3000")
         raw = retry_set_command(
             command.PROTOCOL_COMMAND_SET_END_DEVICE_ALIVE_THRESHOLD,
             COMMAND_SIZE_FOR_UINT8,
             threshold,
             2,
-            timeout
+            timeout,
+            self.command
         )
         
         if raw != None:
@@ -1915,9 +2591,372 @@ class SixfabPower:
         """
 
         try:
-            command.create_command(command.PROTOCOL_COMMAND_RESTORE_FACTORY_SETTINGS)
-            command.send_command()
+            with exclusive(self.command, command.PROTOCOL_COMMAND_RESTORE_FACTORY_SETTINGS):
+                self.command.create_command(command.PROTOCOL_COMMAND_RESTORE_FACTORY_SETTINGS)
+                self.command.send_command()
         except:
             return None
         else:
             return 1
+
+
+    def get_snapshot(self, fields=SNAPSHOT_FIELDS, timeout=None):
+        """
+        Function for reading several values in one call
+
+        Parameters
+        -----------
+        fields : iterable (optional)
+            names of the values to read, each with a get_<name> method (default is SNAPSHOT_FIELDS)
+        timeout : int (optional)
+            timeout while receiving each response (default is the default of each getter)
+
+        Returns
+        ------- 
+        snapshot : dict
+            {"timestamp": epoch seconds, <name>: value or None, ...}, fields
+            the firmware does not support (see probe_capabilities()) are left out
+        """
+        snapshot = {"timestamp": time.time()}
+        unsupported = self.command.unsupported
+        with self.bus_session():
+            for name in fields:
+                if unsupported and getattr(Command, "PROTOCOL_COMMAND_GET_" + name.upper(), None) in unsupported:
+                    continue
+                getter = getattr(self, "get_" + name)
+                if timeout is None:
+                    snapshot[name] = getter()
+                else:
+                    snapshot[name] = getter(timeout=timeout)
+        return snapshot
+
+    def shutdown_sequence(self, deadline=8.0, steps=DEFAULT_SHUTDOWN_STEPS, step_reserve=0.25):
+        """
+        Function for running the final commands before power off within a fixed time
+        
+        The steps run in order. A failing step is retried until its share of
+        the budget is used, waits and retry delays are cut to what is left of
+        it, and step_reserve seconds per later step are kept free so a failing
+        step can not starve the ones after it. A step that fails without any
+        bus attempt (unknown method, invalid argument, unsupported command)
+        is not repeated. A step without time left is skipped, nothing runs
+        past the deadline. The deadline only applies to the calling thread.
+
+        Parameters
+        -----------
+        deadline : float (optional)
+            time budget of the whole sequence in seconds (default is 8, the
+            EDM service is stopped after 10)
+        steps : iterable (optional)
+            (method name, args, kwargs) tuples of SixfabPower methods, e.g.
+            ("remove_all_scheduled_events", (), {}) or
+            ("set_power_outage_params", (1439, 0), {}) (default is DEFAULT_SHUTDOWN_STEPS,
+            enabling EDM)
+        step_reserve : float (optional)
+            seconds kept for each step that is still to come (default is 0.25)
+
+        Returns
+        ------- 
+        report : dict
+            {"ok": bool, "elapsed": seconds, "steps": [{"step", "result", "ok",
+            "skipped", "attempts", "elapsed"}, ...]}
+        """
+        start = time.monotonic()
+        end = start + deadline
+        steps = list(steps)
+        report = {"ok": True, "elapsed": 0.0, "steps": []}
+
+        lock = self.command.lock
+        lock_timeout = lock.timeout if lock is not None else None
+        # both only apply to the calling thread, see Command.attempts
+        previous = (self.command.deadline, self.command.attempts)
+        try:
+            for index, step in enumerate(steps):
+                name, args = step[0], step[1]
+                kwargs = step[2] if len(step) > 2 else {}
+
+                now = time.monotonic()
+                step_end = max(end - step_reserve * (len(steps) - index - 1), now)
+                entry = {"step": name, "result": None, "ok": False, "skipped": False, "attempts": 0}
+
+                if step_end - now <= 0:
+                    entry["skipped"] = True
+                else:
+                    self.command.attempts = 0
+                    self.command.deadline = step_end
+                    if lock is not None:
+                        lock.timeout = step_end - now if lock_timeout is None else min(lock_timeout, step_end - now)
+                    # the command is repeated while its share of the budget lasts
+                    while not entry["ok"] and time.monotonic() < step_end:
+                        tries = self.command.attempts
+                        try:
+                            entry["result"] = getattr(self, name)(*args, **kwargs)
+                        except Exception as e:
+                            entry["result"] = "{}: {}".format(type(e).__name__, e)
+                        else:
+                            entry["ok"] = entry["result"] is not None and entry["result"] != Definition.SET_FAILED
+                        if self.command.attempts == tries:
+                            # failed before reaching the bus, a repeat fails the same way
+                            break
+                    entry["attempts"] = self.command.attempts
+
+                entry["elapsed"] = time.monotonic() - now
+                report["ok"] = report["ok"] and entry["ok"]
+                report["steps"].append(entry)
+        finally:
+            self.command.deadline, self.command.attempts = previous
+            if lock is not None:
+                lock.timeout = lock_timeout
+
+        report["elapsed"] = time.monotonic() - start
+        return report
+
+    def execute_batch(self, operations, retry_budget=None, deadline=None, stop_on_failure=False):
+        """
+        Function for running several get and set operations in one bus session
+
+        The bus lock (if enabled) is held once for the whole batch instead of
+        per command, and the retries of all operations are drawn from one
+        retry_budget, so a flaky bus can not multiply the run time by the
+        number of operations.
+
+        Usage
+        -----
+        api.execute_batch([
+            ("set_fan_mode", (3,)),
+            ("set_battery_max_charge_level", (95,)),
+            ("get_battery_level",),
+        ])
+
+        Parameters
+        -----------
+        operations : iterable
+            (method name, args, kwargs) tuples of SixfabPower methods, args
+            and kwargs are optional
+        retry_budget : int (optional)
+            retries shared by all operations, None keeps RETRY_COUNT per
+            command (default is None)
+        deadline : float (optional)
+            time budget of the whole batch in seconds (default is None, no limit)
+        stop_on_failure : bool (optional)
+            skip the remaining operations after a failure (default is False)
+
+        Returns
+        ------- 
+        results : list
+            one dict per operation: {"operation", "result", "ok", "skipped",
+            "error", "attempts", "elapsed"}
+        """
+        operations = list(operations)
+        results = []
+
+        # all three only apply to the calling thread, see Command.deadline
+        previous = (self.command.retry_budget, self.command.deadline, self.command.attempts)
+        self.command.retry_budget = retry_budget
+        if deadline is not None:
+            self.command.deadline = time.monotonic() + deadline
+        failed = False
+        try:
+            with self.bus_session():
+                for operation in operations:
+                    name = operation[0]
+                    args = operation[1] if len(operation) > 1 else ()
+                    kwargs = operation[2] if len(operation) > 2 else {}
+                    entry = {
+                        "operation": name,
+                        "result": None,
+                        "ok": False,
+                        "skipped": False,
+                        "error": None,
+                        "attempts": 0,
+                        "elapsed": 0.0,
+                    }
+                    results.append(entry)
+                    if failed and stop_on_failure:
+                        entry["skipped"] = True
+                        continue
+
+                    self.command.attempts = 0
+                    self.command.last_error = None
+                    start = time.monotonic()
+                    try:
+                        entry["result"] = getattr(self, name)(*args, **kwargs)
+                    except Exception as e:
+                        entry["error"] = "{}: {}".format(type(e).__name__, e)
+                    else:
+                        # a getter may legitimately answer 2
+                        entry["ok"] = entry["result"] is not None and (
+                            name.startswith(("get_", "is_")) or entry["result"] != Definition.SET_FAILED
+                        )
+                        error = self.command.last_error
+                        if not entry["ok"] and error is not None:
+                            entry["error"] = "{}: {}".format(type(error).__name__, error)
+                    if isinstance(entry["result"], (bytes, bytearray)):
+                        entry["result"] = list(entry["result"])
+                    entry["attempts"] = self.command.attempts
+                    entry["elapsed"] = time.monotonic() - start
+                    failed = failed or not entry["ok"]
+        finally:
+            self.command.retry_budget, self.command.deadline, self.command.attempts = previous
+        return results
+
+
+#############################################################
+### Table Driven Commands ###################################
+#############################################################
+
+# Commands without a hand written method above, each one becomes a
+# SixfabPower method of the same name:
+# name: (command id, value length, (min, max), description)
+# value length None reads a GET command decoded like registers.REGISTERS,
+# 0 sends the command without a value.
+OPERATIONS = {
+    "get_lpm_status": (
+        Command.PROTOCOL_COMMAND_GET_LOW_POWER_MODE, None, None,
+        'low power mode status, "1" for ENABLED, "2" for DISABLED',
+    ),
+    "set_lpm_status": (
+        Command.PROTOCOL_COMMAND_SET_LOW_POWER_MODE, 1, (1, 2),
+        'low power mode status, "1" for ENABLED, "2" for DISABLED',
+    ),
+    "get_safe_shutdown_battery_level": (
+        Command.PROTOCOL_COMMAND_GET_SAFE_SHUTDOWN_BATTERY_LEVEL, None, None,
+        "battery level [%] at which the end device is shut down safely",
+    ),
+    "set_safe_shutdown_battery_level": (
+        Command.PROTOCOL_COMMAND_SET_SAFE_SHUTDOWN_BATTERY_LEVEL, 1, (0, 100),
+        "battery level [%] at which the end device is shut down safely",
+    ),
+    "get_safe_shutdown_status": (
+        Command.PROTOCOL_COMMAND_GET_SAFE_SHUTDOWN_STATUS, None, None,
+        'safe shutdown status, "1" for ENABLED, "2" for DISABLED',
+    ),
+    "set_safe_shutdown_status": (
+        Command.PROTOCOL_COMMAND_SET_SAFE_SHUTDOWN_STATUS, 1, (1, 2),
+        'safe shutdown status, "1" for ENABLED, "2" for DISABLED',
+    ),
+    "get_debug_config": (
+        Command.PROTOCOL_COMMAND_GET_DEBUG_CONFIG, None, None,
+        "debug configuration flags of the firmware",
+    ),
+    "set_debug_config": (
+        Command.PROTOCOL_COMMAND_SET_DEBUG_CONFIG, 1, (0, 255),
+        "debug configuration flags of the firmware",
+    ),
+    "set_fan_speed": (
+        Command.PROTOCOL_COMMAND_SET_FAN_SPEED, 1, (0, 100),
+        "fan speed [%] while the fan mode is ON",
+    ),
+    "hard_power_off": (
+        Command.PROTOCOL_COMMAND_HARD_POWER_OFF, 0, None,
+        "cutting the power of the end device",
+    ),
+    "hard_power_on": (
+        Command.PROTOCOL_COMMAND_HARD_POWER_ON, 0, None,
+        "powering the end device on",
+    ),
+    "hard_reboot": (
+        Command.PROTOCOL_COMMAND_HARD_REBOOT, 0, None,
+        "power cycling the end device",
+    ),
+    "soft_power_off": (
+        Command.PROTOCOL_COMMAND_SOFT_POWER_OFF, 0, None,
+        "asking the end device to shut down, see is_any_soft_action_exist()",
+    ),
+    "soft_power_on": (
+        Command.PROTOCOL_COMMAND_SOFT_POWER_ON, 0, None,
+        "powering the end device on after a soft power off",
+    ),
+    "soft_reboot": (
+        Command.PROTOCOL_COMMAND_SOFT_REBOOT, 0, None,
+        "asking the end device to reboot, see is_any_soft_action_exist()",
+    ),
+}
+
+
+def _decode_register(command_num, raw):
+    name, length, scale, signed = REGISTERS[command_num]
+    data = raw[PROTOCOL_HEADER_SIZE : PROTOCOL_HEADER_SIZE + length]
+    if scale is None:
+        return bytearray(data)
+    value = int.from_bytes(bytes(data), "big", signed=signed)
+    return value if scale == 1 else value / scale
+
+
+def _table_operation(name, command_num, value_len, limits, description):
+    if value_len is None:
+        size = PROTOCOL_FRAME_SIZE + REGISTERS[command_num][1]
+
+        def operation(self, timeout=RESPONSE_DELAY):
+            raw = retry_command(command_num, size, timeout, self.command)
+            if raw != None:
+                return _decode_register(command_num, raw)
+            else:
+                return None
+
+        doc = "Function for getting " + description + RETURN_VALUE_DOC
+    elif value_len == 0:
+
+        def operation(self, timeout=RESPONSE_DELAY):
+            raw = retry_command(command_num, COMMAND_SIZE_FOR_UINT8, timeout, self.command)
+            if raw != None:
+                return raw[PROTOCOL_HEADER_SIZE]
+            else:
+                return None
+
+        doc = "Function for " + description + PARAMETERS_DOC + RETURN_RESULT_DOC
+    else:
+
+        def operation(self, value, timeout=RESPONSE_DELAY):
+            if limits is not None and not limits[0] <= value <= limits[1]:
+                return self._invalid_argument(
+                    "{} value must be between {} and {}".format(name, limits[0], limits[1])
+                )
+            raw = retry_set_command(command_num, COMMAND_SIZE_FOR_UINT8, value, value_len, timeout, self.command)
+            if raw != None:
+                return raw[PROTOCOL_HEADER_SIZE]
+            else:
+                return None
+
+        doc = "Function for setting " + description + VALUE_DOC.format(*(limits or ("", ""))) + RETURN_RESULT_DOC
+
+    operation.__name__ = name
+    operation.__qualname__ = "SixfabPower." + name
+    operation.__doc__ = doc
+    return operation
+
+
+PARAMETERS_DOC = """
+
+        Parameters
+        -----------"""
+
+VALUE_DOC = PARAMETERS_DOC + """
+        value : int
+            [min : {} , max : {}]"""
+
+RETURN_VALUE_DOC = """
+
+        Parameters
+        -----------
+        timeout : int (optional)
+            timeout while receiving the response (default is RESPONSE_DELAY)
+
+        Returns
+        ------- 
+        value : int
+        """
+
+RETURN_RESULT_DOC = """
+        timeout : int (optional)
+            timeout while receiving the response (default is RESPONSE_DELAY)
+
+        Returns
+        ------- 
+        result : int
+            "1" for SET OK, "2" for SET FAILED
+        """
+
+for _name, _spec in OPERATIONS.items():
+    if not hasattr(SixfabPower, _name):
+        setattr(SixfabPower, _name, _table_operation(_name, *_spec))
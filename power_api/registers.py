@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+
+from power_api.command import Command
+
+# Values answered by the GET commands, shared by the emulator and the bulk
+# decoder. The getters in power_api.py decode them the same way:
+# int.from_bytes(data, "big", signed=signed) / scale, a scale of None marks
+# composite values (several fields or a string).
+#
+# GET command id: (value name, data length, scale, signed)
+REGISTERS = {
+    Command.PROTOCOL_COMMAND_GET_INPUT_TEMP: ("input_temp", 4, 100, False),
+    Command.PROTOCOL_COMMAND_GET_INPUT_VOLTAGE: ("input_voltage", 4, 1000, False),
+    Command.PROTOCOL_COMMAND_GET_INPUT_CURRENT: ("input_current", 4, 1000, False),
+    Command.PROTOCOL_COMMAND_GET_INPUT_POWER: ("input_power", 4, 1000, False),
+    Command.PROTOCOL_COMMAND_GET_SYSTEM_VOLTAGE: ("system_voltage", 4, 1000, False),
+    Command.PROTOCOL_COMMAND_GET_SYSTEM_CURRENT: ("system_current", 4, 1000, False),
+    Command.PROTOCOL_COMMAND_GET_SYSTEM_POWER: ("system_power", 4, 1000, False),
+    Command.PROTOCOL_COMMAND_GET_BATTERY_TEMP: ("battery_temp", 4, 100, False),
+    Command.PROTOCOL_COMMAND_GET_BATTERY_VOLTAGE: ("battery_voltage", 4, 1000, False),
+    Command.PROTOCOL_COMMAND_GET_BATTERY_CURRENT: ("battery_current", 4, 1000, True),
+    Command.PROTOCOL_COMMAND_GET_BATTERY_POWER: ("battery_power", 4, 1000, True),
+    Command.PROTOCOL_COMMAND_GET_BATTERY_LEVEL: ("battery_level", 4, 1, False),
+    Command.PROTOCOL_COMMAND_GET_BATTERY_HEALTH: ("battery_health", 4, 1, False),
+    Command.PROTOCOL_COMMAND_GET_FAN_SPEED: ("fan_speed", 4, 1, False),
+    Command.PROTOCOL_COMMAND_GET_FAN_HEALTH: ("fan_health", 4, 1, False),
+    Command.PROTOCOL_COMMAND_GET_WATCHDOG_STATUS: ("watchdog_status", 1, 1, False),
+    Command.PROTOCOL_COMMAND_GET_RGB_ANIMATION: ("rgb_animation", 3, None, False),
+    Command.PROTOCOL_COMMAND_GET_FAN_AUTOMATION: ("fan_automation", 2, None, False),
+    Command.PROTOCOL_COMMAND_GET_BATTERY_MAX_CHARGE_LEVEL: ("battery_max_charge_level", 1, 1, False),
+    Command.PROTOCOL_COMMAND_GET_SAFE_SHUTDOWN_BATTERY_LEVEL: ("safe_shutdown_battery_level", 1, 1, False),
+    Command.PROTOCOL_COMMAND_GET_SAFE_SHUTDOWN_STATUS: ("safe_shutdown_status", 1, 1, False),
+    Command.PROTOCOL_COMMAND_GET_WORKING_MODE: ("working_mode", 1, 1, False),
+    Command.PROTOCOL_COMMAND_GET_BUTTON1_STATUS: ("button1_status", 1, 1, False),
+    Command.PROTOCOL_COMMAND_GET_BUTTON2_STATUS: ("button2_status", 1, 1, False),
+    Command.PROTOCOL_COMMAND_GET_BATTERY_DESIGN_CAPACITY: ("battery_design_capacity", 2, 1, False),
+    Command.PROTOCOL_COMMAND_IS_ANY_SOFT_ACTION_EXIST: ("soft_action", 1, 1, False),
+    Command.PROTOCOL_COMMAND_GET_LOW_POWER_MODE: ("lpm_status", 1, 1, False),
+    Command.PROTOCOL_COMMAND_GET_EASY_DEPLOYMENT_MODE: ("edm_status", 1, 1, False),
+    Command.PROTOCOL_COMMAND_GET_FAN_MODE: ("fan_mode", 1, 1, False),
+    Command.PROTOCOL_COMMAND_GET_WATCHDOG_INTERVAL: ("watchdog_interval", 1, 1, False),
+    Command.PROTOCOL_COMMAND_GET_BATTERY_SEPARATION_STATUS: ("battery_separation_status", 1, 1, False),
+    Command.PROTOCOL_COMMAND_GET_POWER_OUTAGE_PARAMS: ("power_outage_params", 4, None, False),
+    Command.PROTOCOL_COMMAND_GET_POWER_OUTAGE_EVENT_STATUS: ("power_outage_event_status", 1, 1, False),
+    Command.PROTOCOL_COMMAND_GET_END_DEVICE_ALIVE_THRESHOLD: ("end_device_alive_threshold", 2, 1, False),
+    Command.PROTOCOL_COMMAND_GET_DEBUG_CONFIG: ("debug_config", 1, 1, False),
+    Command.PROTOCOL_COMMAND_GET_FIRMWARE_VER: ("firmware_ver", 8, None, False),
+}
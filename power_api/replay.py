@@ -0,0 +1,200 @@
+#!/usr/bin/python3
+"""
+Replay tool for frame captures written by FrameCapture.dump().
+
+    python3 -m power_api.replay capture.bin --print       # hex listing
+    python3 -m power_api.replay capture.bin               # re-parse received frames
+    python3 -m power_api.replay capture.bin --emulator    # resend requests to EmulatedBus
+
+Parsing feeds every received frame through Command.check_command and reports
+how many decode and how many fail the CRC check, which makes field captures
+usable for regression tests of the parser. Emulator mode sends the captured
+requests to power_api.emulator.EmulatedBus and compares the responses with
+the recorded ones (command id, length and payload).
+"""
+
+import sys
+import time
+import argparse
+
+from power_api.command import Command
+from power_api.exceptions import crc_check_failed
+from power_api.capture import (
+    load,
+    SENT,
+    RECEIVED,
+    OUTCOME_OK,
+    OUTCOME_CRC,
+    OUTCOME_BUS,
+    OUTCOME_INCOMPLETE,
+)
+from power_api.stats import COMMAND_NAMES
+
+OUTCOME_NAMES = {
+    OUTCOME_OK: "ok",
+    OUTCOME_CRC: "crc",
+    OUTCOME_BUS: "bus",
+    OUTCOME_INCOMPLETE: "incomplete",
+}
+
+
+def _pace(records, speed):
+    """Function for yielding records, sleeping the recorded gaps unless speed is "max"."""
+    if not records:
+        return
+    first = records[0][0]
+    start = time.monotonic()
+    for record in records:
+        if speed == "recorded":
+            delay = (record[0] - first) / 1e9 - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+        yield record
+
+
+def print_records(records, out=sys.stdout):
+    if not records:
+        return
+    first = records[0][0]
+    for timestamp, direction, outcome, command_id, frame in records:
+        out.write(
+            "{:12.6f} {} {:<28} {:<10} {}\n".format(
+                (timestamp - first) / 1e9,
+                "->" if direction == SENT else "<-",
+                COMMAND_NAMES.get(command_id, str(command_id)),
+                OUTCOME_NAMES.get(outcome, str(outcome)),
+                frame.hex(" "),
+            )
+        )
+
+
+def parse_records(records, speed="max"):
+    """
+    Function for re-parsing the received frames of a capture
+
+    Returns
+    -------
+    result : dict
+        frames, ok, crc_failed, incomplete, mismatched (decoded outcome differs
+        from the recorded one), seconds and frames_per_second
+    """
+    cmd = Command()
+    result = dict(frames=0, ok=0, crc_failed=0, incomplete=0, mismatched=0)
+
+    start = time.perf_counter()
+    for timestamp, direction, outcome, command_id, frame in _pace(records, speed):
+        if direction != RECEIVED or outcome == OUTCOME_BUS:
+            continue
+        result["frames"] += 1
+        cmd.buffer_receive.clear()
+        cmd.buffer_receive_index = 0
+
+        msg = None
+        decoded = OUTCOME_INCOMPLETE
+        try:
+            for byte in frame:
+                msg = cmd.check_command(byte)
+            if msg != None and msg != -1 and msg != Command.CRC_CHECK_FAILED:
+                decoded = OUTCOME_OK
+        except crc_check_failed:
+            decoded = OUTCOME_CRC
+
+        if decoded == OUTCOME_OK:
+            result["ok"] += 1
+        elif decoded == OUTCOME_CRC:
+            result["crc_failed"] += 1
+        else:
+            result["incomplete"] += 1
+        if decoded != outcome:
+            result["mismatched"] += 1
+
+    seconds = time.perf_counter() - start
+    result["seconds"] = seconds
+    result["frames_per_second"] = result["frames"] / seconds if seconds > 0 else 0.0
+    return result
+
+
+def emulate_records(records, speed="max", emulator=None):
+    """
+    Function for resending the captured requests to an EmulatedBus
+
+    Each request is paired with the next recorded response. Payload values
+    depend on the emulator state, so "same_frame" is informational while
+    "mismatched" counts responses whose command id or length differ.
+
+    Returns
+    -------
+    result : dict
+        requests, answered, same_frame, mismatched, unanswered
+    """
+    from power_api.emulator import EmulatedBus
+
+    if emulator is None:
+        emulator = EmulatedBus()
+    cmd = Command(emulator)
+    result = dict(requests=0, answered=0, same_frame=0, mismatched=0, unanswered=0)
+
+    request = None
+    for timestamp, direction, outcome, command_id, frame in _pace(records, speed):
+        if direction == SENT:
+            if outcome != OUTCOME_BUS:
+                result["requests"] += 1
+                request = frame
+            continue
+
+        # the recorded response tells how many bytes the request was read with
+        if request is None or outcome == OUTCOME_BUS:
+            continue
+        cmd.buffer_send = list(request)
+        request = None
+        try:
+            cmd.send_command()
+            response = bytes(cmd.receive_command(len(frame)))
+        except Exception:
+            continue
+
+        result["answered"] += 1
+        if response == frame:
+            result["same_frame"] += 1
+        elif outcome == OUTCOME_OK and (response[1] != frame[1] or len(response) != len(frame)):
+            result["mismatched"] += 1
+
+    result["unanswered"] = result["requests"] - result["answered"]
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("capture", help="file written by FrameCapture.dump()")
+    parser.add_argument("--print", dest="listing", action="store_true", help="print a hex listing")
+    parser.add_argument("--emulator", action="store_true", help="resend requests to EmulatedBus")
+    parser.add_argument(
+        "--speed",
+        choices=("recorded", "max"),
+        default="max",
+        help="keep the recorded timing or replay as fast as possible (default)",
+    )
+    args = parser.parse_args(argv)
+
+    records = load(args.capture)
+    if args.listing:
+        print_records(records)
+        return
+
+    if args.emulator:
+        result = emulate_records(records, args.speed)
+    else:
+        result = parse_records(records, args.speed)
+
+    for key, value in result.items():
+        if isinstance(value, float):
+            print("{:<18} {:.6g}".format(key, value))
+        else:
+            print("{:<18} {}".format(key, value))
+
+    if result.get("mismatched"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/python3
+
+import time
+import bisect
+import threading
+import collections
+
+from power_api.command import Command
+from power_api.stats import LATENCY_BUCKETS, COMMAND_NAMES
+
+# Priority classes, lower is more urgent
+PRIORITY_SAFETY = 0
+PRIORITY_CONTROL = 1
+PRIORITY_TELEMETRY = 2
+PRIORITY_BULK = 3
+
+PRIORITY_NAMES = ("safety", "control", "telemetry", "bulk")
+
+# Commands outside the default rule (GET_* is telemetry, anything else control)
+COMMAND_PRIORITIES = {
+    Command.PROTOCOL_COMMAND_WATCHDOG_SIGNAL: PRIORITY_SAFETY,
+    Command.PROTOCOL_COMMAND_SET_EASY_DEPLOYMENT_MODE: PRIORITY_SAFETY,
+    Command.PROTOCOL_COMMAND_HARD_POWER_OFF: PRIORITY_SAFETY,
+    Command.PROTOCOL_COMMAND_SOFT_POWER_OFF: PRIORITY_SAFETY,
+    Command.PROTOCOL_COMMAND_HARD_REBOOT: PRIORITY_SAFETY,
+    Command.PROTOCOL_COMMAND_SOFT_REBOOT: PRIORITY_SAFETY,
+    Command.PROTOCOL_COMMAND_GET_BUTTON1_STATUS: PRIORITY_CONTROL,
+    Command.PROTOCOL_COMMAND_GET_BUTTON2_STATUS: PRIORITY_CONTROL,
+    Command.PROTOCOL_COMMAND_CREATE_SCHEDULED_EVENT: PRIORITY_BULK,
+    Command.PROTOCOL_COMMAND_REMOVE_SCHEDULED_EVENT: PRIORITY_BULK,
+    Command.PROTOCOL_COMMAND_REMOVE_ALL_SCHEDULED_EVENTS: PRIORITY_BULK,
+    Command.PROTOCOL_COMMAND_FIRMWARE_UPDATE: PRIORITY_BULK,
+    Command.PROTOCOL_COMMAND_WRITE_FIRMWARE_TO_FLASH: PRIORITY_BULK,
+    Command.PROTOCOL_COMMAND_CLEAR_PROGRAM_STORAGE: PRIORITY_BULK,
+    Command.PROTOCOL_COMMAND_CLEAR_PROGRAM_AREA: PRIORITY_BULK,
+    Command.PROTOCOL_COMMAND_RESET_MCU_FOR_BOOT_UPDATE: PRIORITY_BULK,
+}
+
+for _command_num, _name in COMMAND_NAMES.items():
+    if _command_num not in COMMAND_PRIORITIES:
+        COMMAND_PRIORITIES[_command_num] = (
+            PRIORITY_TELEMETRY if _name.startswith("GET_") else PRIORITY_CONTROL
+        )
+
+
+class _TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "last")
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+
+    def wait_time(self, now):
+        """Seconds until one token is available, 0 if there is one."""
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class _ClassStats:
+    __slots__ = ("granted", "wait_time", "max_wait", "rate_limited", "histogram")
+
+    def __init__(self):
+        self.granted = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.rate_limited = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+
+class BusScheduler:
+    """
+    Priority scheduler for bus transactions.
+
+    Every attempt of a transaction (one request frame and its response) holds
+    the bus exclusively. When the bus is released it is handed to the oldest
+    waiter of the most urgent class that is not held back by its rate limit,
+    so a safety command waits at most for the frame currently on the bus,
+    even behind a firmware update or a burst of telemetry. Retry delays and
+    the gaps between the packets of bulk operations are spent outside the
+    bus, which is where urgent commands get in.
+
+    Attach it with SixfabPower.enable_scheduler().
+
+    Parameters
+    -----------
+    rate_limits : dict (optional)
+        {priority: (transactions per second, burst)} for the classes to limit
+    """
+
+    def __init__(self, rate_limits=None):
+        self._cond = threading.Condition(threading.Lock())
+        self._queues = [collections.deque() for _ in PRIORITY_NAMES]
+        self._buckets = [None] * len(PRIORITY_NAMES)
+        self._owner = None
+        self._depth = 0
+        self._local = threading.local()
+        self._stats = [_ClassStats() for _ in PRIORITY_NAMES]
+
+        for priority, (rate, burst) in (rate_limits or {}).items():
+            self.set_rate_limit(priority, rate, burst)
+
+    def set_rate_limit(self, priority, rate, burst=1):
+        """
+        Function for limiting the transaction rate of a priority class
+
+        Parameters
+        -----------
+        priority : int
+            PRIORITY_SAFETY, PRIORITY_CONTROL, PRIORITY_TELEMETRY or PRIORITY_BULK
+        rate : float
+            transactions per second, None removes the limit
+        burst : int (optional)
+            transactions allowed back to back (default is 1)
+        """
+        with self._cond:
+            self._buckets[priority] = None if rate is None else _TokenBucket(rate, burst)
+            self._cond.notify_all()
+
+    def priority(self, priority):
+        """
+        Function for overriding the class of the commands of the calling thread
+
+        Usage
+        -----
+        with scheduler.priority(PRIORITY_SAFETY):
+            api.set_edm_status(Definition.ENABLED)
+        """
+        return _PriorityOverride(self._local, priority)
+
+    def _next(self, now):
+        """Class to serve next and the seconds until a rate limited class may go."""
+        retry = None
+        for priority, queue in enumerate(self._queues):
+            if not queue:
+                continue
+            bucket = self._buckets[priority]
+            if bucket is None:
+                return priority, None
+            wait = bucket.wait_time(now)
+            if wait == 0.0:
+                return priority, None
+            if retry is None or wait < retry:
+                retry = wait
+        return None, retry
+
+    def acquire(self, command_num):
+        """
+        Function for waiting until the calling thread may use the bus
+
+        Re-entrant for the owning thread. Every acquire() needs a release().
+
+        Parameters
+        -----------
+        command_num : int
+            protocol command id, selects the priority class
+        """
+        me = threading.get_ident()
+        priority = getattr(self._local, "priority", None)
+        if priority is None:
+            priority = COMMAND_PRIORITIES.get(command_num, PRIORITY_CONTROL)
+
+        with self._cond:
+            if self._owner == me:
+                self._depth += 1
+                return
+
+            start = time.monotonic()
+            ticket = object()
+            queue = self._queues[priority]
+            queue.append(ticket)
+            limited = False
+            try:
+                while True:
+                    timeout = None
+                    if self._owner is None:
+                        selected, timeout = self._next(time.monotonic())
+                        if selected == priority and queue[0] is ticket:
+                            break
+                        if selected is None and self._buckets[priority] is not None:
+                            limited = True
+                    self._cond.wait(timeout)
+            except BaseException:
+                queue.remove(ticket)
+                self._cond.notify_all()
+                raise
+
+            queue.popleft()
+            bucket = self._buckets[priority]
+            if bucket is not None:
+                bucket.tokens -= 1.0
+            self._owner = me
+            self._depth = 1
+
+            wait = time.monotonic() - start
+            stats = self._stats[priority]
+            stats.granted += 1
+            stats.wait_time += wait
+            if wait > stats.max_wait:
+                stats.max_wait = wait
+            if limited:
+                stats.rate_limited += 1
+            stats.histogram[bisect.bisect_left(LATENCY_BUCKETS, wait)] += 1
+
+    def release(self):
+        """Function for handing the bus to the next waiter."""
+        with self._cond:
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                self._cond.notify_all()
+
+    def snapshot(self):
+        """
+        Function for getting the queue wait metrics
+
+        Returns
+        -------
+        stats : dict
+            {"buckets": LATENCY_BUCKETS, "classes": {name: counters}} where
+            counters holds granted, queued (waiting now), wait_time and
+            max_wait [seconds], rate_limited and the wait histogram
+        """
+        classes = {}
+        with self._cond:
+            for priority, name in enumerate(PRIORITY_NAMES):
+                stats = self._stats[priority]
+                classes[name] = {
+                    "granted": stats.granted,
+                    "queued": len(self._queues[priority]),
+                    "wait_time": stats.wait_time,
+                    "max_wait": stats.max_wait,
+                    "rate_limited": stats.rate_limited,
+                    "histogram": list(stats.histogram),
+                }
+        return {"buckets": list(LATENCY_BUCKETS), "classes": classes}
+
+    def clear(self):
+        """Function for resetting the queue wait metrics."""
+        with self._cond:
+            self._stats = [_ClassStats() for _ in PRIORITY_NAMES]
+
+
+class _PriorityOverride:
+    def __init__(self, local, priority):
+        self.local = local
+        self.priority = priority
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = getattr(self.local, "priority", None)
+        self.local.priority = self.priority
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.local.priority = self.previous
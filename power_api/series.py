@@ -0,0 +1,639 @@
+#!/usr/bin/python3
+"""
+Compressed telemetry series files (Gorilla encoding).
+
+    from power_api.series import SeriesWriter, SeriesReader, record_series
+
+    record_series(api, "ups.series", interval=0.1, duration=3600)
+    with SeriesReader("ups.series") as reader:
+        columns = reader.read(["battery_voltage"], start=time.time() - 600)
+
+Timestamps are stored as delta-of-delta milliseconds and values as the XOR
+with the previous value of their column, so a sample where nothing changed
+costs a few bits instead of 8 bytes per value. Register values are stored at
+register resolution (value * scale as a float), where a small change only
+touches a few mantissa bits; they are read back exactly as the getter
+returned them.
+
+The file is a sequence of block_size blocks. Block 0 holds the file header,
+every other one is encoded on its own:
+
+    0   4s   magic b"SFTB"
+    4   I    sample count
+    8   q    first timestamp [ms]
+    16  q    last timestamp [ms]
+    24  I    payload length [bits]
+    28  I    crc32 of the payload
+    32  ...  payload, zero padded to block_size
+
+The block headers are the index: a reader finds the blocks of a time range
+from them and decodes only those. A block is written when it is full (or on
+flush()), one aligned write per block_size of samples.
+
+The open block is written with magic b"SFTO" by flush(). Each version of it
+goes to the one of two neighbouring slots that does not hold the previous
+version, so a power cut during a write tears at most the newest copy. A
+reader keeps the longest copy of a block with a valid crc and skips the
+other one, and read() skips (and reports) corrupt blocks instead of failing.
+"""
+
+import os
+import json
+import mmap
+import time
+import zlib
+import struct
+
+from power_api.command import Command
+from power_api.registers import REGISTERS
+from power_api.power_api import SNAPSHOT_FIELDS
+from power_api.exceptions import invalid_argument
+
+MAGIC = b"SFTS"
+BLOCK_MAGIC = b"SFTB"
+OPEN_MAGIC = b"SFTO"
+VERSION = 1
+
+DEFAULT_BLOCK_SIZE = 4096
+
+# Values of SeriesWriter by default
+SERIES_FIELDS = SNAPSHOT_FIELDS
+
+# magic, version, flags, block size, length of the JSON description
+FILE_HEADER = struct.Struct("<4sHHIH")
+BLOCK = struct.Struct("<4sIqqII")
+
+# Stored for values that were not read, decoded as None
+NONE_BITS = 0x7FF8000000000001
+
+_FLOAT = struct.Struct("<d")
+_BITS = struct.Struct("<Q")
+_MASK64 = (1 << 64) - 1
+
+
+def field_scale(name):
+    """
+    Function for getting the register scale of a field
+
+    Returns
+    -------
+    scale : int
+        the getter divides the register by it, None for values that are
+        not plain registers (stored as they are)
+    """
+    command = getattr(Command, "PROTOCOL_COMMAND_GET_" + name.upper(), None)
+    register = REGISTERS.get(command)
+    return register[2] if register is not None else None
+
+
+#############################################################
+### Block encoding ##########################################
+#############################################################
+
+
+def _encode_dod(dod):
+    # (bits, length) of a timestamp delta-of-delta
+    if dod == 0:
+        return 0, 1
+    if -63 <= dod <= 64:
+        return (0b10 << 7) | (dod + 63), 9
+    if -255 <= dod <= 256:
+        return (0b110 << 9) | (dod + 255), 12
+    if -2047 <= dod <= 2048:
+        return (0b1110 << 12) | (dod + 2047), 16
+    return (0b1111 << 64) | (dod & _MASK64), 68
+
+
+def decode_block(payload, count, first, fields):
+    """
+    Function for decoding the payload of one block
+
+    Parameters
+    -----------
+    payload : bytes
+    count : int
+        samples in the block
+    first : int
+        timestamp of the first sample [ms]
+    fields : int
+        number of value columns
+
+    Returns
+    -------
+    timestamps : list
+        [ms]
+    columns : list
+        one list of raw 64 bit patterns per field
+    """
+    data = bytes(payload) + bytes(9)
+    from_bytes = int.from_bytes
+    position = 0
+
+    def read(length):
+        nonlocal position
+        index = position >> 3
+        window = from_bytes(data[index : index + 9], "big")
+        shift = 72 - (position & 7) - length
+        position += length
+        return (window >> shift) & ((1 << length) - 1)
+
+    if count == 0:
+        return [], [[] for _ in range(fields)]
+    columns = [[read(64)] for _ in range(fields)]
+    timestamps = [first]
+
+    state = [[column[0], 0, 0] for column in columns]  # previous, leading, trailing zeros
+    timestamp = first
+    delta = 0
+    for _ in range(count - 1):
+        if read(1):
+            if not read(1):
+                dod = read(7) - 63
+            elif not read(1):
+                dod = read(9) - 255
+            elif not read(1):
+                dod = read(12) - 2047
+            else:
+                dod = read(64)
+                if dod >> 63:
+                    dod -= 1 << 64
+            delta += dod
+        timestamp += delta
+        timestamps.append(timestamp)
+
+        for column, previous in zip(columns, state):
+            if read(1):
+                if read(1):
+                    leading = read(5)
+                    length = read(6) or 64
+                    trailing = 64 - leading - length
+                    previous[1] = leading
+                    previous[2] = trailing
+                else:
+                    leading = previous[1]
+                    trailing = previous[2]
+                    length = 64 - leading - trailing
+                previous[0] ^= read(length) << trailing
+            column.append(previous[0])
+
+    return timestamps, columns
+
+
+#############################################################
+### Writer ##################################################
+#############################################################
+
+
+class SeriesWriter:
+    """
+    Streams telemetry samples into a compressed series file.
+
+    Each write() encodes the sample into the open block right away, so
+    memory stays bounded by one block however long the recording runs. A
+    sample that does not fit closes the block, which is then written with
+    one aligned write. flush() writes the open block in place, later
+    samples rewrite it until it is full; a power cut loses the samples
+    since the last flush() (close() flushes).
+
+    An existing file with the same fields and block size is continued in a
+    new block.
+
+    Usage
+    -----
+    with SeriesWriter("ups.series") as writer:
+        writer.write(api.get_snapshot())
+
+    Parameters
+    -----------
+    path : str
+        series file
+    fields : iterable (optional)
+        names of the values to store (default is SERIES_FIELDS)
+    block_size : int (optional)
+        bytes per block, a multiple of 512 (default is DEFAULT_BLOCK_SIZE)
+    """
+
+    def __init__(self, path, fields=SERIES_FIELDS, block_size=DEFAULT_BLOCK_SIZE):
+        fields = tuple(fields)
+        if block_size % 512 or (block_size - BLOCK.size) * 8 < 128 * len(fields) + 68:
+            raise invalid_argument("block_size must be a multiple of 512 that holds two samples")
+        self.path = path
+        self.fields = fields
+        self.block_size = block_size
+        self.scales = tuple(field_scale(name) for name in fields)
+        self.samples = 0
+        self.blocks = 0  # blocks written completely
+
+        self._capacity = (block_size - BLOCK.size) * 8
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            size = os.fstat(self._fd).st_size
+            if size:
+                header = _read_header(self._fd, path)
+                if header[0] != fields or header[2] != block_size:
+                    raise invalid_argument("{} has other fields or another block size".format(path))
+                self._block = -(-size // block_size)
+            else:
+                description = json.dumps({"fields": fields, "scales": self.scales}).encode()
+                head = FILE_HEADER.pack(MAGIC, VERSION, 0, block_size, len(description)) + description
+                if len(head) > block_size:
+                    raise invalid_argument("block_size is too small for the file header")
+                os.pwrite(self._fd, head.ljust(block_size, b"\0"), 0)
+                self._block = 1
+        except BaseException:
+            os.close(self._fd)
+            raise
+        self._count = 0
+        self._slot = None  # slot of the last written version of the open block
+
+    def _values(self, sample):
+        values = []
+        for name, scale in zip(self.fields, self.scales):
+            value = sample.get(name)
+            if value is None:
+                values.append(NONE_BITS)
+            else:
+                if scale is not None:
+                    value = round(value * scale)
+                values.append(_BITS.unpack(_FLOAT.pack(value))[0])
+        return values
+
+    def _start(self, timestamp, values):
+        self._first = timestamp
+        self._last = timestamp
+        self._delta = 0
+        self._count = 1
+        self._state = [[value, 65, 0] for value in values]  # previous, leading, trailing zeros
+        self._buffer = bytearray()
+        self._bits = 0
+        self._pending = 0
+        for value in values:
+            self._put(value, 64)
+
+    def _put(self, bits, length):
+        pending = (self._bits << length) | bits
+        length += self._pending
+        if length >= 64:
+            spare = length & 7
+            self._buffer += (pending >> spare).to_bytes(length >> 3, "big")
+            pending &= (1 << spare) - 1
+            length = spare
+        self._bits = pending
+        self._pending = length
+
+    def _used(self):
+        return len(self._buffer) * 8 + self._pending
+
+    def write(self, sample):
+        """
+        Function for adding one sample
+
+        Parameters
+        -----------
+        sample : dict
+            {"timestamp": epoch seconds, <field>: value or None, ...} as
+            returned by SixfabPower.get_snapshot(), missing fields are None
+        """
+        timestamp = sample.get("timestamp")
+        if timestamp is None:
+            timestamp = time.time()
+        timestamp = int(round(timestamp * 1000))
+        values = self._values(sample)
+        self.samples += 1
+
+        # a clock going backwards starts a block, keeping blocks ordered
+        if self._count == 0 or timestamp < self._last:
+            if self._count:
+                self._close_block()
+            self._start(timestamp, values)
+            return
+
+        delta = timestamp - self._last
+        bits, length = _encode_dod(delta - self._delta)
+        windows = []
+        for index, value in enumerate(values):
+            previous = self._state[index]
+            xor = value ^ previous[0]
+            if xor == 0:
+                bits <<= 1
+                length += 1
+                continue
+            leading = min(64 - xor.bit_length(), 31)
+            trailing = (xor & -xor).bit_length() - 1
+            if leading >= previous[1] and trailing >= previous[2]:
+                meaningful = 64 - previous[1] - previous[2]
+                bits = (((bits << 2) | 0b10) << meaningful) | (xor >> previous[2])
+                length += 2 + meaningful
+            else:
+                meaningful = 64 - leading - trailing
+                bits = (((((bits << 2) | 0b11) << 11) | (leading << 6) | (meaningful & 63)) << meaningful) | (
+                    xor >> trailing
+                )
+                length += 13 + meaningful
+                windows.append((previous, leading, trailing))
+
+        if self._used() + length > self._capacity:
+            self._close_block()
+            self._start(timestamp, values)
+            return
+
+        self._put(bits, length)
+        for previous, leading, trailing in windows:
+            previous[1] = leading
+            previous[2] = trailing
+        for previous, value in zip(self._state, values):
+            previous[0] = value
+        self._delta = delta
+        self._last = timestamp
+        self._count += 1
+
+    def _write_block(self, magic):
+        # never over the last written version, see the module documentation
+        slot = self._block if self._slot != self._block else self._block + 1
+        used = self._used()
+        payload = bytes(self._buffer)
+        if self._pending:
+            payload += (self._bits << (-self._pending & 7)).to_bytes((self._pending + 7) >> 3, "big")
+        header = BLOCK.pack(magic, self._count, self._first, self._last, used, zlib.crc32(payload))
+        os.pwrite(self._fd, (header + payload).ljust(self.block_size, b"\0"), slot * self.block_size)
+        self._slot = slot
+
+    def _close_block(self):
+        self._write_block(BLOCK_MAGIC)
+        self._block = self._slot + 1
+        self._slot = None
+        self.blocks += 1
+        self._count = 0
+
+    def flush(self, sync=False):
+        """
+        Function for writing the open block, see the module documentation
+
+        Parameters
+        -----------
+        sync : bool (optional)
+            also fsync the file (default is False)
+        """
+        if self._count:
+            self._write_block(OPEN_MAGIC)
+        if sync:
+            os.fsync(self._fd)
+
+    def close(self):
+        """Function for writing the open block and closing the file."""
+        if self._fd is not None:
+            if self._count:
+                self._close_block()
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def record_series(api, path, interval=1.0, count=None, duration=None, timeout=None, flush_interval=60.0, **kwargs):
+    """
+    Function for sampling the HAT periodically into a series file
+
+    Parameters
+    -----------
+    api : SixfabPower
+    path : str
+        series file
+    interval : float (optional)
+        seconds between samples (default is 1)
+    count : int (optional)
+        number of samples, None runs until duration or KeyboardInterrupt
+    duration : float (optional)
+        seconds to record, None runs until count or KeyboardInterrupt
+    timeout : int (optional)
+        timeout of each getter, see get_snapshot()
+    flush_interval : float (optional)
+        seconds between writes of the open block (default is 60)
+    **kwargs
+        passed to SeriesWriter
+
+    Returns
+    -------
+    samples : int
+        number of samples written
+    """
+    writer = SeriesWriter(path, **kwargs)
+    start = time.monotonic()
+    flushed = start
+    samples = 0
+    try:
+        while count is None or samples < count:
+            now = time.monotonic()
+            if duration is not None and now - start >= duration:
+                break
+            if now - flushed >= flush_interval:
+                writer.flush()
+                flushed = now
+            writer.write(api.get_snapshot(writer.fields, timeout))
+            samples += 1
+            delay = start + samples * interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+    return samples
+
+
+#############################################################
+### Reader ##################################################
+#############################################################
+
+
+def _read_header(fd, path):
+    head = os.pread(fd, FILE_HEADER.size, 0)
+    if len(head) < FILE_HEADER.size:
+        raise ValueError("Not a series file: " + path)
+    magic, version, _, block_size, length = FILE_HEADER.unpack(head)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a series file: " + path)
+    description = json.loads(os.pread(fd, length, FILE_HEADER.size))
+    return tuple(description["fields"]), tuple(description["scales"]), block_size
+
+
+class SeriesReader:
+    """
+    Reads a series file written by SeriesWriter.
+
+    The block headers are read into index when the file is opened; blocks
+    are only decoded when their samples are requested, so reading a time
+    range costs the blocks it overlaps. Blocks written after opening are
+    seen after refresh().
+
+    Parameters
+    -----------
+    path : str
+        series file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = os.open(path, os.O_RDONLY)
+        try:
+            self.fields, self.scales, self.block_size = _read_header(self._fd, path)
+        except BaseException:
+            os.close(self._fd)
+            raise
+        self._columns = {name: index for index, name in enumerate(self.fields)}
+        self.corrupt = []  # blocks skipped by the last read()
+        self.refresh()
+
+    def refresh(self):
+        """
+        Function for reading the block index again
+
+        index is a list of (block number, first, last, count) tuples with
+        the timestamps in epoch seconds; unwritten blocks and superseded
+        copies of a flushed block are left out.
+        """
+        self.index = []
+        size = os.fstat(self._fd).st_size
+        blocks = size // self.block_size
+        if blocks < 2:
+            return
+        with mmap.mmap(self._fd, blocks * self.block_size, access=mmap.ACCESS_READ) as data:
+            previous = None
+            for number in range(1, blocks):
+                offset = number * self.block_size
+                magic, count, first, last, used, crc = BLOCK.unpack_from(data, offset)
+                if magic not in (BLOCK_MAGIC, OPEN_MAGIC) or not count:
+                    previous = None
+                    continue
+                entry = (number, first / 1000.0, last / 1000.0, count)
+                if (
+                    previous is not None
+                    and previous[0][0] == number - 1
+                    and previous[0][1] == entry[1]
+                    and OPEN_MAGIC in (previous[1], magic)
+                ):
+                    # two versions of one block: the longest intact one,
+                    # the complete one among equals
+                    versions = sorted(
+                        (previous, (entry, magic, offset, used, crc)),
+                        key=lambda version: (version[0][3], version[1] == BLOCK_MAGIC),
+                        reverse=True,
+                    )
+                    for version in versions:
+                        start = version[2] + BLOCK.size
+                        if zlib.crc32(data[start : start + ((version[3] + 7) >> 3)]) == version[4]:
+                            break
+                    else:
+                        version = versions[0]
+                    self.index[-1] = version[0]
+                    previous = None
+                    continue
+                self.index.append(entry)
+                previous = (entry, magic, offset, used, crc)
+
+    @property
+    def samples(self):
+        return sum(entry[3] for entry in self.index)
+
+    def read_block(self, number, columns=None):
+        """
+        Function for decoding one block
+
+        Parameters
+        -----------
+        number : int
+            block number, see index
+        columns : list (optional)
+            fields to return besides timestamp (default is all)
+
+        Returns
+        -------
+        samples : dict
+            {"timestamp": [epoch seconds], <field>: [values], ...}
+        """
+        data = os.pread(self._fd, self.block_size, number * self.block_size)
+        magic, count, first, _, used, crc = BLOCK.unpack_from(data)
+        if magic not in (BLOCK_MAGIC, OPEN_MAGIC):
+            raise ValueError("Block {} of {} is not written".format(number, self.path))
+        payload = data[BLOCK.size : BLOCK.size + ((used + 7) >> 3)]
+        if zlib.crc32(payload) != crc:
+            raise ValueError("Block {} of {} is corrupted".format(number, self.path))
+        timestamps, raw = decode_block(payload, count, first, len(self.fields))
+
+        result = {"timestamp": [timestamp / 1000.0 for timestamp in timestamps]}
+        for name in self.fields if columns is None else columns:
+            index = self._columns[name]
+            bits = raw[index]
+            values = list(struct.unpack("<{}d".format(count), struct.pack("<{}Q".format(count), *bits)))
+            scale = self.scales[index]
+            if scale == 1:
+                values = [int(value) if value == value else None for value in values]
+            elif scale is not None:
+                values = [value / scale for value in values]
+            if NONE_BITS in bits:
+                values = [None if b == NONE_BITS else value for b, value in zip(bits, values)]
+            result[name] = values
+        return result
+
+    def read(self, columns=None, start=None, end=None):
+        """
+        Function for reading samples
+
+        Only the blocks overlapping the time range are decoded. Blocks that
+        fail their crc check are skipped, their numbers are left in corrupt.
+
+        Parameters
+        -----------
+        columns : list (optional)
+            fields to read besides timestamp (default is all)
+        start : float (optional)
+            first time to include, epoch seconds
+        end : float (optional)
+            time to stop before, epoch seconds
+
+        Returns
+        -------
+        samples : dict
+            {"timestamp": [epoch seconds], <field>: [values], ...}
+        """
+        names = self.fields if columns is None else [name for name in columns if name != "timestamp"]
+        result = {"timestamp": []}
+        for name in names:
+            if name not in self._columns:
+                raise invalid_argument("{} is not stored in {}".format(name, self.path))
+            result[name] = []
+
+        self.corrupt = []
+        for number, first, last, _ in self.index:
+            if (start is not None and last < start) or (end is not None and first >= end):
+                continue
+            try:
+                block = self.read_block(number, names)
+            except ValueError:
+                self.corrupt.append(number)
+                continue
+            keep = range(len(block["timestamp"]))
+            if (start is not None and first < start) or (end is not None and last >= end):
+                keep = [
+                    i for i, t in enumerate(block["timestamp"])
+                    if (start is None or t >= start) and (end is None or t < end)
+                ]
+            for name, values in block.items():
+                result[name].extend(values[i] for i in keep)
+        return result
+
+    def close(self):
+        """Function for closing the file."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,300 @@
+#!/usr/bin/python3
+"""
+Latest HAT telemetry in shared memory, for many local readers.
+
+One TelemetryPublisher (e.g. sixfab-powerd --shm) writes get_snapshot()
+into a fixed layout file under /dev/shm. TelemetryReader maps it once;
+read() is then a struct unpack from the mapping, without system calls and
+without any bus traffic, however many readers there are.
+
+Layout (little endian):
+
+    0   4s   magic b"SFPT"
+    4   H    layout version
+    6   H    record size
+    8   Q    sequence, odd while the record is being written
+    16  d    timestamp, epoch seconds of the snapshot
+    24  Q    valid mask, bit i set when SEGMENT_FIELDS[i] was read
+    32  ...  SEGMENT_FIELDS, q for integer values, d for scaled ones
+
+A reader retries until it sees the same even sequence before and after
+copying the record (seqlock), so it never returns a half written one.
+"""
+
+import os
+import mmap
+import time
+import struct
+import threading
+import traceback
+from collections import namedtuple
+
+from power_api.command import Command
+from power_api.registers import REGISTERS
+from power_api.power_api import SNAPSHOT_FIELDS
+
+DEFAULT_PATH = os.environ.get("SIXFAB_POWER_SHM", "/dev/shm/sixfab-power-telemetry")
+
+MAGIC = b"SFPT"
+VERSION = 1
+
+# Values in the segment; the layout depends on this order, change VERSION
+# together with it
+SEGMENT_FIELDS = SNAPSHOT_FIELDS
+
+# Integer fields hold MISSING and scaled fields NaN when their bit in
+# TelemetrySnapshot.valid is clear
+MISSING = -1
+
+_INTEGER = tuple(
+    REGISTERS[getattr(Command, "PROTOCOL_COMMAND_GET_" + name.upper())][2] == 1 for name in SEGMENT_FIELDS
+)
+
+HEADER = struct.Struct("<4sHH")
+SEQUENCE = struct.Struct("<Q")
+RECORD = struct.Struct("<Qd" + "Q" + "".join("q" if integer else "d" for integer in _INTEGER))
+
+SEQUENCE_OFFSET = HEADER.size
+SEGMENT_SIZE = SEQUENCE_OFFSET + RECORD.size
+_BODY_OFFSET = SEQUENCE_OFFSET + SEQUENCE.size
+
+
+class TelemetrySnapshot(namedtuple("TelemetrySnapshot", ("sequence", "timestamp", "valid") + SEGMENT_FIELDS)):
+    """
+    One consistent record of the segment, see TelemetryReader.read().
+
+    Attributes
+    ----------
+    sequence : int
+        even sequence number, grows by 2 per published snapshot
+    timestamp : float
+        epoch seconds the snapshot was read at
+    valid : int
+        bit i is set when SEGMENT_FIELDS[i] holds a reading
+    <field> : int or float
+        one attribute per SEGMENT_FIELDS value
+    """
+
+    __slots__ = ()
+
+    def get(self, name):
+        """Function for getting a value, None when it was not read."""
+        if not self.valid & (1 << SEGMENT_FIELDS.index(name)):
+            return None
+        return getattr(self, name)
+
+    def age(self, now=None):
+        """Function for getting the seconds since the snapshot was read."""
+        return (time.time() if now is None else now) - self.timestamp
+
+    def to_dict(self):
+        """Function for getting the snapshot as returned by SixfabPower.get_snapshot()."""
+        snapshot = {"timestamp": self.timestamp}
+        for index, name in enumerate(SEGMENT_FIELDS):
+            snapshot[name] = self[index + 3] if self.valid & (1 << index) else None
+        return snapshot
+
+
+class TelemetryPublisher:
+    """
+    Writes SixfabPower.get_snapshot() into the shared memory segment.
+
+    The segment is created atomically (written aside and renamed) so a
+    reader never maps a partial header; an existing segment of the same
+    layout is continued in place, so readers survive a publisher restart.
+    There must be a single publisher per path. The file stays in place after close(), readers see the last
+    snapshot and can tell its age from the timestamp.
+
+    Parameters
+    -----------
+    api : SixfabPower
+        api instance used for bus access, may be None when only publish() is used
+    path : str (optional)
+        segment file (default is DEFAULT_PATH, $SIXFAB_POWER_SHM overrides it)
+    interval : float (optional)
+        seconds between snapshots in run() (default is 1)
+    mode : int (optional)
+        file permissions of the segment (default is 0o644)
+    executor : callable (optional)
+        called as executor(func, args, kwargs) to read each snapshot, e.g.
+        PowerDaemon._execute when other threads use api too (default is
+        None, snapshots are read directly)
+    """
+
+    def __init__(self, api, path=DEFAULT_PATH, interval=1.0, mode=0o644, executor=None):
+        self.api = api
+        self.executor = executor
+        self.path = path
+        self.interval = interval
+        self.sequence = 0
+        self.published = 0
+
+        self._map = self._reuse(path)
+        if self._map is None:
+            tmp = "{}.{}.tmp".format(path, os.getpid())
+            fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, mode)
+            try:
+                os.ftruncate(fd, SEGMENT_SIZE)
+                self._map = mmap.mmap(fd, SEGMENT_SIZE)
+            finally:
+                os.close(fd)
+            HEADER.pack_into(self._map, 0, MAGIC, VERSION, RECORD.size)
+            os.replace(tmp, path)
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _reuse(self, path):
+        # A segment of a previous publisher is written in place: readers
+        # that mapped it keep seeing new snapshots, a renamed file would
+        # leave them on the old inode forever.
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            return None
+        try:
+            if os.fstat(fd).st_size < SEGMENT_SIZE:
+                return None
+            segment = mmap.mmap(fd, SEGMENT_SIZE)
+        finally:
+            os.close(fd)
+        if HEADER.unpack_from(segment, 0) != (MAGIC, VERSION, RECORD.size):
+            segment.close()
+            return None
+
+        sequence = SEQUENCE.unpack_from(segment, SEQUENCE_OFFSET)[0]
+        if sequence & 1:
+            # the previous publisher stopped while writing, the record is
+            # given up instead of leaving readers waiting for it
+            sequence += 1
+            segment[_BODY_OFFSET + 8 : _BODY_OFFSET + 16] = struct.pack("<Q", 0)
+            segment[SEQUENCE_OFFSET:_BODY_OFFSET] = SEQUENCE.pack(sequence)
+        self.sequence = sequence
+        return segment
+
+    def publish(self, snapshot):
+        """
+        Function for writing one snapshot into the segment
+
+        Parameters
+        -----------
+        snapshot : dict
+            {"timestamp": epoch seconds, <name>: value or None, ...}, as
+            returned by get_snapshot(), missing names count as not read
+        """
+        valid = 0
+        values = []
+        for index, name in enumerate(SEGMENT_FIELDS):
+            value = snapshot.get(name)
+            if value is None:
+                values.append(MISSING if _INTEGER[index] else float("nan"))
+            else:
+                valid |= 1 << index
+                values.append(int(value) if _INTEGER[index] else float(value))
+
+        timestamp = snapshot.get("timestamp")
+        if timestamp is None:
+            timestamp = time.time()
+
+        # plain copies only: pack_into() zero fills its target before
+        # packing, a reader could take the zeroed sequence for a valid one
+        sequence = self.sequence
+        record = RECORD.pack(sequence + 1, timestamp, valid, *values)
+        self._map[SEQUENCE_OFFSET:_BODY_OFFSET] = SEQUENCE.pack(sequence + 1)
+        self._map[_BODY_OFFSET:SEGMENT_SIZE] = record[SEQUENCE.size :]
+        self._map[SEQUENCE_OFFSET:_BODY_OFFSET] = SEQUENCE.pack(sequence + 2)
+        self.sequence = sequence + 2
+        self.published += 1
+
+    def poll(self):
+        """Function for reading a snapshot from the HAT and publishing it."""
+        if self.executor is not None:
+            self.publish(self.executor(self.api.get_snapshot, (), {}))
+        else:
+            self.publish(self.api.get_snapshot())
+
+    def run(self):
+        """Function for publishing every interval seconds until stop() is called. Blocks the caller."""
+        while not self._stop.is_set():
+            start = time.monotonic()
+            try:
+                self.poll()
+            except Exception:
+                traceback.print_exc()
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - start)))
+
+    def start(self):
+        """Function for running the publisher on a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="TelemetryPublisher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Function for stopping the publisher thread started with start()."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def close(self):
+        """Function for stopping and unmapping the segment, the file is kept."""
+        self.stop()
+        self._map.close()
+
+
+class TelemetryReader:
+    """
+    Reads the latest snapshot of a TelemetryPublisher.
+
+    The segment is mapped read-only once; read() does not enter the kernel.
+
+    Parameters
+    -----------
+    path : str (optional)
+        segment file (default is DEFAULT_PATH, $SIXFAB_POWER_SHM overrides it)
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            size = os.fstat(fd).st_size
+            if size < SEGMENT_SIZE:
+                raise ValueError("Not a telemetry segment: " + path)
+            self._map = mmap.mmap(fd, SEGMENT_SIZE, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        if HEADER.unpack_from(self._map, 0) != (MAGIC, VERSION, RECORD.size):
+            self._map.close()
+            raise ValueError("Not a telemetry segment: " + path)
+
+    def read(self, _unpack=RECORD.unpack_from, _sequence=SEQUENCE.unpack_from, _new=tuple.__new__):
+        """
+        Function for getting the latest snapshot
+
+        Returns
+        -------
+        snapshot : TelemetrySnapshot
+            None before the first snapshot was published
+        """
+        buffer = self._map
+        while True:
+            record = _unpack(buffer, SEQUENCE_OFFSET)
+            sequence = record[0]
+            # odd: being written, changed: overwritten while copying
+            if not sequence & 1 and (sequence,) == _sequence(buffer, SEQUENCE_OFFSET):
+                if sequence == 0:
+                    return None
+                return _new(TelemetrySnapshot, record)
+
+    def close(self):
+        """Function for unmapping the segment."""
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
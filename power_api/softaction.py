@@ -0,0 +1,321 @@
+#!/usr/bin/python3
+"""
+Soft-action agent: carries out shutdowns and reboots requested by the HAT.
+
+    python3 -m power_api.softaction [--interval 30] [--fast-interval 1] [--dry-run]
+"""
+
+import sys
+import time
+import datetime
+import argparse
+import threading
+import traceback
+import subprocess
+
+from power_api.definitions import Definition
+
+# Run directly, without a shell; systemd hands them to logind's shutdown logic
+SYSTEMCTL_COMMANDS = {
+    Definition.ACTION_SOFT_SHUTDOWN: ("systemctl", "poweroff"),
+    Definition.ACTION_SOFT_REBOOT: ("systemctl", "reboot"),
+}
+
+# Scheduled event actions that end in a soft action request
+SOFT_EVENT_ACTIONS = (Definition.SOFT_POWER_OFF, Definition.SOFT_REBOOT)
+
+INTERVAL_UNITS = {
+    Definition.INTERVAL_TYPE_SEC: 1,
+    Definition.INTERVAL_TYPE_MIN: 60,
+    Definition.INTERVAL_TYPE_HOUR: 3600,
+}
+
+
+def systemctl_executor(action):
+    """
+    Function for shutting down or rebooting the end device through systemd
+
+    Returns
+    -------
+    returncode : int
+        exit status of systemctl
+    """
+    return subprocess.run(SYSTEMCTL_COMMANDS[action], check=False).returncode
+
+
+class SoftActionAgent:
+    """
+    Polls is_any_soft_action_exist() and shuts down or reboots the end device
+    when the HAT asks for it, e.g. for a scheduled SOFT_POWER_OFF event.
+
+    The HAT is polled every interval seconds, and every fast_interval
+    seconds within window seconds of an expected event (see expect() and
+    expect_event()). The reaction latency is therefore bounded by interval,
+    or by fast_interval around expected events, while the idle bus load is a
+    single one-byte command per interval.
+
+    A pending action is reported by the MCU once. The agent reads the
+    command again to confirm the MCU has dropped it (acknowledged) before
+    calling executor, so an action is never carried out twice; without the
+    confirmation the read is repeated every fast_interval seconds. The HAT
+    cuts the power regardless, so after confirm_timeout seconds without a
+    confirmation the action is carried out anyway (acknowledged is False).
+    The agent stops after an action was executed.
+
+    Parameters
+    -----------
+    api : SixfabPower
+        api instance used for bus access
+    interval : float (optional)
+        poll period in seconds (default is 30)
+    fast_interval : float (optional)
+        poll period in seconds around expected events (default is 1)
+    window : float (optional)
+        seconds before and after an expected event polled fast (default is 60)
+    executor : callable (optional)
+        called with the action id, default is systemctl_executor
+    confirm_timeout : float (optional)
+        seconds to wait for the MCU to drop the action before executing it
+        unconfirmed (default is 5)
+    """
+
+    def __init__(self, api, interval=30.0, fast_interval=1.0, window=60.0, executor=None, confirm_timeout=5.0):
+        self.api = api
+        self.interval = interval
+        self.fast_interval = fast_interval
+        self.window = window
+        self.executor = executor or systemctl_executor
+        self.confirm_timeout = confirm_timeout
+
+        self.action = None
+        self.acknowledged = None
+        self.result = None
+        self._pending_since = None
+
+        self._expected = []  # epoch seconds
+        self._daily = []  # (seconds after local midnight, weekday mask)
+        self._periodic = []  # (anchor epoch seconds, period)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    #############################################################
+    ### Expected Events #########################################
+    #############################################################
+
+    def expect(self, timestamp):
+        """
+        Function for polling fast around a time a soft action may come
+
+        Parameters
+        -----------
+        timestamp : float
+            epoch seconds
+        """
+        with self._lock:
+            self._expected.append(float(timestamp))
+
+    def expect_event(self, event, now=None):
+        """
+        Function for polling fast around the occurrences of a scheduled event
+
+        Parameters
+        -----------
+        event : Event
+            event as passed to create_scheduled_event_with_event()
+        now : float (optional)
+            epoch seconds the event was created at, anchors interval events
+            (default is the current time)
+
+        Returns
+        -------
+        expected : bool
+            False when the event does not end in a soft action
+        """
+        if event.action not in SOFT_EVENT_ACTIONS:
+            return False
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            if event.schedule_type == Definition.EVENT_TIME:
+                if event.repeat == Definition.EVENT_REPEATED:
+                    self._daily.append((event.time_interval, event.day))
+                else:
+                    self._expected.append(self._next_daily(event.time_interval, 0, now))
+            elif event.schedule_type == Definition.EVENT_INTERVAL:
+                period = event.time_interval * INTERVAL_UNITS.get(event.interval_type, 1)
+                if event.repeat == Definition.EVENT_REPEATED:
+                    self._periodic.append((now, period))
+                else:
+                    self._expected.append(now + period)
+            else:
+                return False
+        return True
+
+    def clear_expected(self):
+        """Function for forgetting all expected events."""
+        with self._lock:
+            self._expected = []
+            self._daily = []
+            self._periodic = []
+
+    def _next_daily(self, seconds, day_mask, now):
+        # day_mask bit 0 is monday like in create_scheduled_event(), 0 is every day
+        midnight = datetime.datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        for day in range(8):
+            date = midnight + datetime.timedelta(days=day)
+            if day_mask and not day_mask & (1 << date.weekday()):
+                continue
+            candidate = (date + datetime.timedelta(seconds=seconds)).timestamp()
+            if candidate >= now:
+                return candidate
+        return None
+
+    def next_expected(self, now=None):
+        """
+        Function for getting the next expected event time
+
+        Parameters
+        -----------
+        now : float (optional)
+            epoch seconds (default is the current time)
+
+        Returns
+        -------
+        timestamp : float
+            epoch seconds of the next expected event not more than window
+            seconds ago, None without expected events
+        """
+        if now is None:
+            now = time.time()
+        since = now - self.window
+        times = []
+        with self._lock:
+            self._expected = [t for t in self._expected if t >= since]
+            times.extend(self._expected)
+            for seconds, day_mask in self._daily:
+                t = self._next_daily(seconds, day_mask, since)
+                if t is not None:
+                    times.append(t)
+            for anchor, period in self._periodic:
+                if period <= 0:
+                    continue
+                count = max(0, -(-(since - anchor) // period))
+                times.append(anchor + count * period)
+        return min(times) if times else None
+
+    #############################################################
+    ### Polling #################################################
+    #############################################################
+
+    def poll(self, now=None):
+        """
+        Function for checking for a soft action once and carrying it out
+
+        Parameters
+        -----------
+        now : float (optional)
+            epoch seconds of the poll (default is the current time)
+
+        Returns
+        -------
+        interval : float
+            seconds to wait before the next poll, None once an action was executed
+        """
+        if now is None:
+            now = time.time()
+
+        if self.action is None:
+            action = self.api.is_any_soft_action_exist()
+            if action in SYSTEMCTL_COMMANDS:
+                self.action = action
+                self._pending_since = now
+
+        if self.action is not None:
+            confirmation = self.api.is_any_soft_action_exist()
+            self.acknowledged = confirmation == Definition.NO_SOFT_ACTION
+            # failed read or reported again: not dropped yet, ask again soon
+            # unless the power is about to be cut anyway
+            if self.acknowledged or now - self._pending_since >= self.confirm_timeout:
+                self.result = self.executor(self.action)
+                return None
+            if confirmation in SYSTEMCTL_COMMANDS:
+                self.action = confirmation
+            return self.fast_interval
+
+        expected = self.next_expected(now)
+        if expected is None:
+            return self.interval
+        until_window = expected - self.window - now
+        if until_window <= 0:
+            return self.fast_interval
+        return max(self.fast_interval, min(self.interval, until_window))
+
+    def run(self):
+        """Function for polling until an action was executed or stop() is called. Blocks the caller."""
+        while not self._stop.is_set():
+            try:
+                interval = self.poll()
+            except Exception:
+                traceback.print_exc()
+                interval = self.interval
+            if interval is None:
+                break
+            self._stop.wait(interval)
+
+    def start(self):
+        """Function for running the agent on a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="SoftActionAgent", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Function for stopping the agent thread started with start()."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="sixfab-softaction", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--interval", type=float, default=30.0, help="poll period in seconds (default is 30)")
+    parser.add_argument("--fast-interval", type=float, default=1.0, help="poll period around --expect times (default is 1)")
+    parser.add_argument("--window", type=float, default=60.0, help="seconds around --expect times polled fast (default is 60)")
+    parser.add_argument("--expect", type=float, action="append", default=[], help="epoch time of an expected event, repeatable")
+    parser.add_argument("--confirm-timeout", type=float, default=5.0, help="seconds to wait for the HAT to confirm an action before executing it anyway (default is 5)")
+    parser.add_argument("--dry-run", action="store_true", help="print the action instead of executing it")
+    parser.add_argument("--emulator", action="store_true", help="use power_api.emulator instead of the HAT")
+    args = parser.parse_args(argv)
+
+    from power_api.power_api import SixfabPower
+
+    if args.emulator:
+        from power_api.emulator import EmulatedBus
+
+        api = SixfabPower(bus=EmulatedBus())
+    else:
+        api = SixfabPower()
+        api.enable_bus_lock()
+
+    executor = None
+    if args.dry_run:
+        def executor(action):
+            print("Would run: " + " ".join(SYSTEMCTL_COMMANDS[action]), flush=True)
+            return 0
+
+    agent = SoftActionAgent(api, args.interval, args.fast_interval, args.window, executor, args.confirm_timeout)
+    for timestamp in args.expect:
+        agent.expect(timestamp)
+    try:
+        agent.run()
+    except KeyboardInterrupt:
+        return 0
+    return 0 if agent.result in (None, 0) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+
+import bisect
+
+from power_api.command import Command
+
+# Upper bounds of the latency histogram buckets in seconds, a last bucket
+# collects everything slower than the final bound.
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5,
+    1.0, 2.5,
+)
+
+COMMAND_NAMES = {
+    value: name[len("PROTOCOL_COMMAND_"):]
+    for name, value in vars(Command).items()
+    if name.startswith("PROTOCOL_COMMAND_")
+}
+
+# Transaction attempt outcomes
+ERROR_CRC = 0
+ERROR_BUS = 1
+ERROR_NO_RESPONSE = 2
+ERROR_OTHER = 3
+
+
+class _Entry:
+    __slots__ = (
+        "transactions",
+        "attempts",
+        "failures",
+        "errors",
+        "bytes_sent",
+        "bytes_received",
+        "time",
+        "sleep_time",
+        "histogram",
+    )
+
+    def __init__(self):
+        self.transactions = 0
+        self.attempts = 0
+        self.failures = 0
+        self.errors = [0, 0, 0, 0]
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.time = 0.0
+        self.sleep_time = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+
+class CommandStats:
+    """
+    Per command counters and latency histograms of bus transactions.
+
+    An instance is attached to a Command with SixfabPower.enable_stats() and
+    filled by the transaction loop in power_api.py. Counters are plain
+    integers updated without locking, concurrent writers may lose an
+    increment but never corrupt the structure.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def _entry(self, command_num):
+        entry = self.entries.get(command_num)
+        if entry is None:
+            entry = self.entries[command_num] = _Entry()
+        return entry
+
+    def error(self, command_num, kind):
+        """Function for counting a failed attempt of kind ERROR_*."""
+        self._entry(command_num).errors[kind] += 1
+
+    def record(self, command_num, elapsed, attempts, ok, bytes_sent, bytes_received, sleep_time):
+        """Function for recording a finished transaction."""
+        entry = self._entry(command_num)
+        entry.transactions += 1
+        entry.attempts += attempts
+        if not ok:
+            entry.failures += 1
+        entry.bytes_sent += bytes_sent
+        entry.bytes_received += bytes_received
+        entry.time += elapsed
+        entry.sleep_time += sleep_time
+        entry.histogram[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+    def clear(self):
+        """Function for resetting all counters."""
+        self.entries = {}
+
+    def snapshot(self):
+        """
+        Function for getting a copy of all counters
+
+        Returns
+        -------
+        stats : dict
+            {"buckets": LATENCY_BUCKETS, "commands": {name: counters}, "totals": counters}
+            where counters holds transactions, attempts, retries, failures,
+            crc_failures, bus_errors, no_response, other_errors, bytes_sent,
+            bytes_received, time, sleep_time [seconds] and histogram (one
+            count per bucket plus an overflow bucket)
+        """
+        commands = {}
+        totals = dict.fromkeys(
+            (
+                "transactions", "attempts", "retries", "failures", "crc_failures",
+                "bus_errors", "no_response", "other_errors", "bytes_sent",
+                "bytes_received", "time", "sleep_time",
+            ),
+            0,
+        )
+
+        for command_num, entry in sorted(self.entries.items()):
+            counters = {
+                "id": command_num,
+                "transactions": entry.transactions,
+                "attempts": entry.attempts,
+                "retries": entry.attempts - entry.transactions,
+                "failures": entry.failures,
+                "crc_failures": entry.errors[ERROR_CRC],
+                "bus_errors": entry.errors[ERROR_BUS],
+                "no_response": entry.errors[ERROR_NO_RESPONSE],
+                "other_errors": entry.errors[ERROR_OTHER],
+                "bytes_sent": entry.bytes_sent,
+                "bytes_received": entry.bytes_received,
+                "time": entry.time,
+                "sleep_time": entry.sleep_time,
+                "histogram": list(entry.histogram),
+            }
+            for key in totals:
+                totals[key] += counters[key]
+            commands[COMMAND_NAMES.get(command_num, str(command_num))] = counters
+
+        return {"buckets": list(LATENCY_BUCKETS), "commands": commands, "totals": totals}
@@ -8,6 +8,7 @@ from termcolor import colored
 
 sys.path.append('./')
 from power_api.power_api import SixfabPower, Definition, Event
+from power_api.clock import ClockDiscipline, format_time, system_clock_synchronized
 
 sys.path.append('../gpsd-py3')
 import gpsd
@@ -16,6 +17,7 @@ sys.path.append('../openauto-pro-api/api_examples/python')
 import common.Api_pb2 as oap_api
 
 api = SixfabPower()
+api.enable_bus_lock()
 
 ENABLE_SHUTDOWN = True
 REQUIRE_EDM_FOR_SHUTDOWN = True
@@ -157,8 +159,9 @@ else:
 	gps_ept = 0
 	
 if GET_UPS:
-	rtc_date = api.get_rtc_time(Definition.TIME_FORMAT_DATE)
-	rtc_time = api.get_rtc_time(Definition.TIME_FORMAT_TIME)
+	# formatted locally from the single RTC read above
+	rtc_date = format_time(dt_rtc, Definition.TIME_FORMAT_DATE)
+	rtc_time = format_time(dt_rtc, Definition.TIME_FORMAT_TIME)
 else:
 	rtc_date = "??"
 	rtc_time = "??"
@@ -193,6 +196,7 @@ print("|*************************|*************************|********************
 
 SET_TIME = True	
 if SET_TIME:
+	reference = None	# current time from GPS, None for system clock / RTC
 	if GET_GPS and (t < gps_tim or FORCE_GPS_SET):
 		print("set using GPS time")
 		packet = gpsd.get_current()		# Get the packet again for most current time
@@ -201,35 +205,27 @@ if SET_TIME:
 				packet.time[0:19], "%Y-%m-%dT%H:%M:%S")
 			gps_tim = dt_gps.timestamp()-time.timezone
 			t = int(gps_tim)
+			reference = gps_tim
 			FORCE_RTC_SET = True
 			FORCE_SYS_SET = True
 
-	output_stream = os.popen('timedatectl status')
-	output = output_stream.read()
-	output_stream.close()
-	
-	if output.find("System clock synchronized: yes") != -1 and output.find("NTP service: active") != -1: 
-		USE_SYS_TIME = True
-	else:
-		USE_SYS_TIME = False
+	USE_SYS_TIME = system_clock_synchronized()
+	# the offset samples outlive this run, so the RTC drift is tracked across runs
+	clock = ClockDiscipline(api, threshold=1, path="/var/lib/sixfab-power/clock.json")
 
-	if (USE_SYS_TIME and math.fabs(t - dt_rtc) > 1) or FORCE_RTC_SET:
-		print("sys -> RTC")
-		api.set_rtc_time(t)
-		print("api.set_rtc_time(int(time.time()+time.timezone))")
+	if USE_SYS_TIME or FORCE_RTC_SET:
+		if clock.sync_rtc(reference, force=FORCE_RTC_SET):
+			print("sys -> RTC")
 
-	if math.fabs(t - dt_rtc) > 1 or FORCE_SYS_SET:
-		print("RTC -> sys")
-		cmd = str("sudo timedatectl set-ntp no")
-		print(cmd)
-		os.system(cmd)
-		dt = datetime.datetime.fromtimestamp(api.get_rtc_time(Definition.TIME_FORMAT_EPOCH))
-		cmd = str("sudo timedatectl set-time '"+str("%s" % (dt))+"'")
-		print(cmd)
-		os.system(cmd)
-		cmd = str("sudo timedatectl set-ntp yes")
-		print(cmd)
-		os.system(cmd)
+	# an NTP synchronized system clock is left alone
+	if not USE_SYS_TIME or FORCE_SYS_SET:
+		try:
+			correction = clock.sync_system(reference, force=FORCE_SYS_SET)
+		except OSError as e:
+			print("cannot set the system clock: " + str(e))
+		else:
+			if correction is not None:
+				print("RTC -> sys (%+.1f s)" % correction)
 
 if api.get_working_mode() == Definition.BATTERY_POWERED and api.get_input_power() <= 0.:
 #	
@@ -10,5 +10,14 @@ setup(
     url='https://github.com/sixfab/sixfab-power-python-api',
     dependency_links  = [],
     install_requires  = ['smbus2==0.3.0', 'crc16==0.1.1', 'vcgencmd==0.1.1'],
-    packages=find_packages()
+    extras_require    = {'numpy': ['numpy'], 'parquet': ['pyarrow'], 'mqtt': ['paho-mqtt'], 'cbor': ['cbor2']},
+    packages=find_packages(),
+    entry_points={
+        'console_scripts': [
+            'sixfab-power=power_api.cli:main',
+            'sixfab-powerd=power_api.daemon:main',
+            'sixfab-softaction=power_api.softaction:main',
+            'sixfab-mqtt=power_api.mqtt:main',
+        ],
+    },
 )
\ No newline at end of file
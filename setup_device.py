@@ -13,19 +13,23 @@ if __name__ == "__main__":
 #    api.restore_factory_defaults(4000)
 
     slow_threshold, fast_threshold, mode = 40, 60, 3
-    print(str(api.set_fan_automation(slow_threshold, fast_threshold, timeout=200)))
-    print(str(api.set_fan_mode(mode)))
-    
     level, status = 60, 2
-    api.set_safe_shutdown_battery_level(level)
-    api.set_safe_shutdown_status(status)
-
-    level, capacity = 95, 3000
-    api.set_battery_max_charge_level(level)
-    api.set_battery_design_capacity(capacity)
-
-    status = 1
-    api.set_lpm_status(status, 1000)
+    charge_level, capacity = 95, 3000
+    lpm_status = 1
+
+    # one bus session, retries shared by all commands
+    results = api.execute_batch([
+        ("set_fan_automation", (slow_threshold, fast_threshold), {"timeout": 200}),
+        ("set_fan_mode", (mode,)),
+        ("set_safe_shutdown_battery_level", (level,)),
+        ("set_safe_shutdown_status", (status,)),
+        ("set_battery_max_charge_level", (charge_level,)),
+        ("set_battery_design_capacity", (capacity,)),
+        ("set_lpm_status", (lpm_status, 1000)),
+    ], retry_budget=10)
+
+    for result in results:
+        print(result["operation"], "OK" if result["ok"] else "FAILED " + str(result["error"] or result["result"]))
 
     #status = 1
     #api.set_edm_status(status)
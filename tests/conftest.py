@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the tests run from a checkout, like the benchmarks
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
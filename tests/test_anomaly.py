@@ -0,0 +1,104 @@
+import math
+import random
+import statistics
+
+import pytest
+
+from power_api.anomaly import AnomalyDetector, MetricStats, Rule, DEFAULT_RULES
+from power_api.definitions import Definition
+from power_api.exceptions import invalid_argument
+
+
+def _feed(detector, metric, values, start=0.0, period=1.0):
+    events = []
+    for index, value in enumerate(values):
+        events += detector.update({metric: value}, start + index * period)
+    return events
+
+
+def test_metric_stats_match_the_batch_statistics():
+    rng = random.Random(7)
+    values = [rng.gauss(5.0, 0.3) for _ in range(500)]
+    stats = MetricStats()
+    for index, value in enumerate(values):
+        stats.update(value, float(index))
+    assert stats.count == 500
+    assert stats.mean == pytest.approx(statistics.fmean(values))
+    assert stats.variance == pytest.approx(statistics.variance(values))
+    assert stats.zscore(stats.mean) == pytest.approx(0.0)
+
+
+def test_ewma_and_rate_follow_time():
+    stats = MetricStats(tau=10.0, rate_tau=1e-9)
+    stats.update(0.0, 0.0)
+    stats.update(1.0, 10.0)
+    assert stats.ewma == pytest.approx(1.0 - math.exp(-1.0))
+    assert stats.rate == pytest.approx(0.1)
+    # a sample at the same time does not divide by zero
+    stats.update(2.0, 10.0)
+    assert stats.value == 2.0
+
+
+def test_rule_needs_one_threshold_and_a_known_source():
+    with pytest.raises(invalid_argument):
+        Rule("r", "m")
+    with pytest.raises(invalid_argument):
+        Rule("r", "m", above=1.0, below=0.0)
+    with pytest.raises(invalid_argument):
+        Rule("r", "m", above=1.0, source="median")
+
+
+def test_hysteresis_does_not_flap():
+    detector = AnomalyDetector([Rule("hot", "temp", above=55.0, clear=50.0)])
+    events = _feed(detector, "temp", [40.0, 56.0, 54.0, 56.0, 51.0, 49.0, 52.0])
+    assert [(e.type, e.value) for e in events] == [
+        (Definition.EVENT_ANOMALY_RAISED, 56.0),
+        (Definition.EVENT_ANOMALY_CLEARED, 49.0),
+    ]
+    assert events[1].threshold == 50.0
+    assert detector.active == {}
+
+
+def test_samples_must_be_consecutive():
+    detector = AnomalyDetector([Rule("sag", "input_voltage", below=4.75, clear=4.85, samples=3)])
+    assert _feed(detector, "input_voltage", [4.7, 4.7, 4.9, 4.7, 4.7]) == []
+    events = _feed(detector, "input_voltage", [4.7], start=10.0)
+    assert [e.type for e in events] == [Definition.EVENT_ANOMALY_RAISED]
+    assert detector.status()["active"] == ["sag"]
+
+
+def test_zscore_rules_wait_for_warmup():
+    detector = AnomalyDetector([Rule("spike", "current", above=4.0, clear=2.0, source="zscore")], warmup=30)
+    rng = random.Random(3)
+    baseline = [1.0 + rng.gauss(0.0, 0.01) for _ in range(29)]
+    # an outlier before warmup is only learned
+    assert _feed(detector, "current", baseline[:10] + [5.0] + baseline[10:]) == []
+
+    detector = AnomalyDetector([Rule("spike", "current", above=4.0, clear=2.0, source="zscore")], warmup=30)
+    assert _feed(detector, "current", baseline + [1.0]) == []
+    events = _feed(detector, "current", [5.0, 1.0], start=100.0)
+    assert [e.type for e in events] == [Definition.EVENT_ANOMALY_RAISED, Definition.EVENT_ANOMALY_CLEARED]
+
+
+def test_when_and_missing_values_skip_the_rule():
+    detector = AnomalyDetector(DEFAULT_RULES)
+    on_battery = {"input_voltage": 0.0, "working_mode": Definition.BATTERY_POWERED}
+    assert detector.update(on_battery, 0.0) == []
+    assert detector.update({"input_voltage": None}, 1.0) == []
+    assert detector.samples == 2
+    assert detector.metrics["input_voltage"].count == 1
+
+
+def test_callbacks_receive_the_events():
+    detector = AnomalyDetector([Rule("hot", "temp", above=55.0)])
+    raised = []
+
+    def callback(event):
+        raised.append(event)
+
+    detector.add_callback(callback, Definition.EVENT_ANOMALY_RAISED)
+    _feed(detector, "temp", [60.0, 40.0])
+    assert [e.rule for e in raised] == ["hot"]
+    detector.remove_callback(callback)
+    _feed(detector, "temp", [60.0], start=5.0)
+    assert len(raised) == 1
@@ -0,0 +1,67 @@
+import os
+import stat
+import shutil
+import tempfile
+
+import pytest
+
+from power_api.buslock import BusLock
+from power_api.emulator import EmulatedBus
+from power_api.exceptions import bus_lock_unavailable
+from power_api.power_api import SixfabPower
+
+
+@pytest.fixture
+def lock_dir():
+    # sticky and world writable like /run/lock, outside the 0700 pytest tree
+    directory = tempfile.mkdtemp()
+    os.chmod(directory, 0o1777)
+    yield directory
+    shutil.rmtree(directory)
+
+
+def test_lock_files_are_shared_despite_the_umask(lock_dir):
+    path = os.path.join(lock_dir, "bus.lock")
+    umask = os.umask(0o022)
+    try:
+        with BusLock(path):
+            pass
+    finally:
+        os.umask(umask)
+    for name in (path, path + ".wait"):
+        assert stat.S_IMODE(os.stat(name).st_mode) == 0o666
+
+
+@pytest.mark.skipif(not hasattr(os, "geteuid") or os.geteuid() != 0, reason="needs root to switch users")
+def test_other_users_can_take_a_lock_created_by_root(lock_dir):
+    path = os.path.join(lock_dir, "bus.lock")
+    with BusLock(path):
+        pass
+    # a file that only its owner may write still serves as a lock
+    os.chmod(path + ".wait", 0o644)
+
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.setgid(65534)
+            os.setuid(65534)
+            with BusLock(path):
+                status = 0
+        finally:
+            os._exit(status)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+
+def test_unopenable_lock_fails_once(lock_dir):
+    blocker = os.path.join(lock_dir, "file")
+    open(blocker, "w").close()
+    api = SixfabPower(bus=EmulatedBus())
+    api.enable_bus_lock(os.path.join(blocker, "bus.lock"))
+    attempts = []
+    api.add_hook(post=lambda command_num, raw, elapsed, tries: attempts.append(tries))
+
+    assert api.get_battery_level() is None
+    assert isinstance(api.last_error(), bus_lock_unavailable)
+    assert attempts == [1]
@@ -0,0 +1,119 @@
+import contextlib
+
+from power_api.buttons import ButtonWatcher
+from power_api.definitions import Definition
+
+PRESSED = Definition.BUTTON_SHORT_PRESS
+RELEASED = Definition.BUTTON_RELEASED
+
+
+class _Api:
+    def __init__(self):
+        self.levels = {1: RELEASED, 2: RELEASED}
+
+    def get_button1_status(self, timeout=None):
+        return self.levels[1]
+
+    def get_button2_status(self, timeout=None):
+        return self.levels[2]
+
+    def bus_session(self):
+        return contextlib.nullcontext()
+
+
+def _watcher(**kwargs):
+    api = _Api()
+    watcher = ButtonWatcher(api, **kwargs)
+    events = []
+    # collect the events on the polling thread instead of the callback worker
+    watcher._dispatch = events.append
+    return api, watcher, events
+
+
+def _drive(watcher, api, button, samples):
+    # samples: [(now, level)], one poll each
+    for now, level in samples:
+        api.levels[button] = level
+        watcher.poll(now)
+
+
+def _types(events):
+    return [(e.type, e.button) for e in events]
+
+
+def test_single_bounce_is_ignored():
+    api, watcher, events = _watcher()
+    _drive(watcher, api, 1, [(0.0, RELEASED), (0.05, PRESSED), (0.06, RELEASED), (0.07, RELEASED)])
+    assert events == []
+
+
+def test_press_is_confirmed_after_debounce_samples():
+    api, watcher, events = _watcher(debounce=3)
+    api.levels[1] = PRESSED
+    assert watcher.poll(0.0) == watcher.fast_interval
+    watcher.poll(0.01)
+    assert events == []
+    watcher.poll(0.02)
+    assert _types(events) == [(Definition.EVENT_BUTTON_PRESSED, 1)]
+    # timestamped at the first sample that saw the change
+    assert events[0].timestamp == 0.0
+
+
+def test_short_press_and_release_report_the_duration():
+    api, watcher, events = _watcher()
+    _drive(watcher, api, 2, [(0.0, PRESSED), (0.01, PRESSED), (0.3, RELEASED), (0.31, RELEASED)])
+    assert _types(events) == [(Definition.EVENT_BUTTON_PRESSED, 2), (Definition.EVENT_BUTTON_RELEASED, 2)]
+    assert abs(events[1].duration - 0.3) < 1e-9
+
+
+def test_long_press_is_reported_once_while_held():
+    api, watcher, events = _watcher(long_press=1.0)
+    _drive(watcher, api, 1, [(0.0, PRESSED), (0.01, PRESSED), (0.5, PRESSED), (1.0, PRESSED), (1.5, PRESSED)])
+    assert _types(events) == [(Definition.EVENT_BUTTON_PRESSED, 1), (Definition.EVENT_BUTTON_LONG_PRESS, 1)]
+    assert events[1].duration == 1.0
+
+
+def test_long_press_level_from_the_hat_is_reported_at_once():
+    api, watcher, events = _watcher(long_press=10.0)
+    _drive(watcher, api, 1, [(0.0, PRESSED), (0.01, Definition.BUTTON_LONG_PRESS)])
+    assert _types(events)[-1] == (Definition.EVENT_BUTTON_LONG_PRESS, 1)
+
+
+def test_double_press():
+    api, watcher, events = _watcher(double_press=0.4)
+    _drive(
+        watcher,
+        api,
+        1,
+        [
+            (0.0, PRESSED), (0.01, PRESSED),
+            (0.2, RELEASED), (0.21, RELEASED),
+            (0.5, PRESSED), (0.51, PRESSED),
+            (0.7, RELEASED), (0.71, RELEASED),
+            # a third press right after the double press does not make another one
+            (0.9, PRESSED), (0.91, PRESSED),
+        ],
+    )
+    types = [e.type for e in events]
+    assert types.count(Definition.EVENT_BUTTON_DOUBLE_PRESS) == 1
+    assert types.index(Definition.EVENT_BUTTON_DOUBLE_PRESS) == 3
+
+
+def test_presses_further_apart_are_not_double():
+    api, watcher, events = _watcher(double_press=0.4)
+    _drive(
+        watcher,
+        api,
+        1,
+        [(0.0, PRESSED), (0.01, PRESSED), (0.2, RELEASED), (0.21, RELEASED), (0.7, PRESSED), (0.71, PRESSED)],
+    )
+    assert Definition.EVENT_BUTTON_DOUBLE_PRESS not in [e.type for e in events]
+
+
+def test_fast_rate_is_kept_after_a_change():
+    api, watcher, events = _watcher(fast_period=0.5)
+    assert watcher.poll(0.0) == watcher.slow_interval
+    _drive(watcher, api, 1, [(1.0, PRESSED), (1.01, PRESSED)])
+    assert watcher.poll(1.4) == watcher.fast_interval
+    assert watcher.poll(1.6) == watcher.slow_interval
+    assert watcher.reads == 2 * watcher.polls
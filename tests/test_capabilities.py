@@ -0,0 +1,14 @@
+from power_api.power_api import SixfabPower
+from power_api.command import Command
+from power_api.definitions import Definition
+from power_api.emulator import EmulatedBus
+
+
+def test_probe_keeps_pending_soft_action(tmp_path):
+    bus = EmulatedBus()
+    api = SixfabPower(bus=bus)
+    bus.registers[Command.PROTOCOL_COMMAND_IS_ANY_SOFT_ACTION_EXIST] = bytes([Definition.ACTION_SOFT_REBOOT])
+
+    api.probe_capabilities(cache_path=str(tmp_path / "capabilities.json"))
+
+    assert api.is_any_soft_action_exist() == Definition.ACTION_SOFT_REBOOT
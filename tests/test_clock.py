@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from power_api.clock import ClockDiscipline
+from power_api.definitions import Definition
+
+
+class _Api:
+    def __init__(self, offset=0.0):
+        self.offset = offset
+        self.written = []
+
+    def get_rtc_time(self, timeout=None):
+        return int(time.time() + self.offset)
+
+    def set_rtc_time(self, timestamp):
+        self.written.append(timestamp)
+        return Definition.SET_OK
+
+
+def test_offset_samples_are_kept_across_runs(tmp_path):
+    path = str(tmp_path / "clock.json")
+    api = _Api(offset=10.0)
+
+    first = ClockDiscipline(api, path=path)
+    # an earlier run, 100 s ago with the RTC 0.5 s closer
+    first.samples.append((time.monotonic() - 100.0, 9.5))
+    first.measure()
+
+    second = ClockDiscipline(api, path=path)
+    assert len(second.samples) == 2
+    assert second.drift == pytest.approx(0.005, abs=0.01)
+    assert second.offset() == pytest.approx(10.0, abs=1.0)
+
+    assert second.sync_rtc(align=False)
+    assert len(api.written) == 1
+    assert len(ClockDiscipline(api, path=path).samples) == 0
+
+
+def test_without_a_path_nothing_is_written(tmp_path):
+    clock = ClockDiscipline(_Api(), path=None)
+    clock.measure()
+    assert len(clock.samples) == 1
+    assert not clock.load(str(tmp_path / "missing.json"))
@@ -0,0 +1,50 @@
+import threading
+
+import pytest
+
+from power_api.daemon import PowerDaemon
+from power_api.exceptions import daemon_request_failed
+
+
+class _Api:
+    def __init__(self):
+        self.level = 1
+        self.reading = threading.Event()
+        self.proceed = threading.Event()
+
+    def get_battery_level(self):
+        level = self.level
+        self.reading.set()
+        self.proceed.wait(5)
+        return level
+
+    def set_battery_max_charge_level(self, level):
+        self.level = level
+        return 1
+
+    def hard_power_off(self):
+        return 1
+
+
+def test_setter_is_not_undone_by_a_getter_in_flight():
+    api = _Api()
+    daemon = PowerDaemon(api)
+    getter = threading.Thread(target=daemon.call, args=("get_battery_level",))
+    getter.start()
+    api.reading.wait(5)
+    setter = threading.Thread(target=daemon.call, args=("set_battery_max_charge_level", (2,)))
+    setter.start()
+    api.proceed.set()
+    getter.join(5)
+    setter.join(5)
+
+    assert daemon.call("get_battery_level", max_age=60.0) == 2
+    assert daemon.cache_hits == 0
+
+
+def test_power_control_needs_to_be_allowed():
+    with pytest.raises(daemon_request_failed, match="allow-power-control"):
+        PowerDaemon(_Api()).call("hard_power_off")
+    with pytest.raises(daemon_request_failed, match="Unsupported"):
+        PowerDaemon(_Api()).call("restore_factory_defaults")
+    assert PowerDaemon(_Api(), allow_power_control=True).call("hard_power_off") == 1
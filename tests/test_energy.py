@@ -0,0 +1,92 @@
+import datetime
+
+import pytest
+
+from power_api.energy import EnergyCounter, _trapezoid
+
+
+def _midnight():
+    # a local midnight, the day buckets follow local time
+    date = datetime.date(2026, 3, 10)
+    return datetime.datetime.combine(date, datetime.time()).timestamp()
+
+
+def test_trapezoid_splits_at_zero():
+    assert _trapezoid(2.0, -2.0, 1.0) == pytest.approx((0.5, 0.5))
+    assert _trapezoid(3.0, -1.0, 2.0) == pytest.approx((2.25, 0.25))
+    assert _trapezoid(-1.0, 3.0, 2.0) == pytest.approx((2.25, 0.25))
+    assert _trapezoid(1.0, 3.0, 2.0) == (4.0, 0.0)
+    assert _trapezoid(-1.0, -3.0, 2.0) == (0.0, 4.0)
+
+
+def test_constant_power_integrates_to_watt_hours():
+    counter = EnergyCounter()
+    start = _midnight() + 3600
+    for second in range(0, 101, 10):
+        counter.update(36.0, 18.0, -36.0, start + second)
+    assert counter.total["input"] == pytest.approx(1.0)
+    assert counter.total["system"] == pytest.approx(0.5)
+    assert counter.total["battery_discharge"] == pytest.approx(1.0)
+    assert counter.total["battery_charge"] == 0.0
+    assert counter.samples == 11
+
+
+def test_battery_sign_change_splits_charge_and_discharge():
+    counter = EnergyCounter()
+    start = _midnight() + 3600
+    counter.update(None, None, -36.0, start)
+    counter.update(None, None, 36.0, start + 60)
+    # zero at start + 30, a triangle on either side
+    assert counter.total["battery_discharge"] == pytest.approx(0.5 * 36.0 * 30 / 3600)
+    assert counter.total["battery_charge"] == pytest.approx(0.5 * 36.0 * 30 / 3600)
+
+    counter = EnergyCounter(discharge_negative=False)
+    counter.update(None, None, 36.0, start)
+    counter.update(None, None, 36.0, start + 50)
+    assert counter.total["battery_discharge"] == pytest.approx(0.5)
+
+
+def test_interval_across_midnight_is_split_between_days():
+    midnight = _midnight()
+    counter = EnergyCounter(max_gap=7200)
+    counter.update(0.0, None, None, midnight - 1800)
+    counter.update(72.0, None, None, midnight + 1800)
+    before = counter.day(datetime.date(2026, 3, 9))["input"]
+    after = counter.day(datetime.date(2026, 3, 10))["input"]
+    # the line crosses 36 W at midnight
+    assert before == pytest.approx(0.5 * 36.0 * 0.5)
+    assert after == pytest.approx(0.5 * (36.0 + 72.0) * 0.5)
+    assert counter.total["input"] == pytest.approx(before + after)
+
+
+def test_gaps_and_backward_samples_are_not_integrated():
+    start = _midnight() + 3600
+    counter = EnergyCounter(max_gap=60)
+    counter.update(36.0, None, None, start)
+    counter.update(36.0, None, None, start + 120)
+    assert counter.total["input"] == 0.0
+    assert (counter.gaps, counter.gap_time) == (1, 120.0)
+
+    counter.update(36.0, None, None, start + 100)
+    assert counter.total["input"] == 0.0
+    assert (counter.gaps, counter.gap_time) == (2, 120.0)
+
+    counter.update(36.0, None, None, start + 150)
+    assert counter.total["input"] == pytest.approx(0.5)
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / "energy.json")
+    start = _midnight() + 3600
+    counter = EnergyCounter(path=path, checkpoint_interval=50)
+    for second in range(0, 101, 10):
+        counter.update(36.0, 18.0, -36.0, start + second)
+    counter.save()
+
+    restored = EnergyCounter(path=path)
+    assert restored.total == pytest.approx(counter.total)
+    assert restored.day(datetime.date(2026, 3, 10)) == pytest.approx(counter.day(datetime.date(2026, 3, 10)))
+    assert restored.samples == counter.samples
+
+    (tmp_path / "other.json").write_text("{}")
+    assert not EnergyCounter().load(str(tmp_path / "other.json"))
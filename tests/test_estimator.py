@@ -0,0 +1,81 @@
+import math
+import random
+
+import pytest
+
+from power_api.estimator import BatteryRuntimeEstimator
+
+
+def _constant_discharge(capacity=3000, load=0.8, noise=0.05, period=1.0, seed=1):
+    # (timestamp, current, level) until empty, current negative while discharging
+    rng = random.Random(seed)
+    charge = float(capacity)
+    t = 0.0
+    samples = []
+    while charge > 0:
+        current = load + rng.gauss(0.0, noise)
+        charge -= current * 1000.0 * period / 3600.0
+        samples.append((t, -current, max(0, int(charge * 100 / capacity))))
+        t += period
+    return samples
+
+
+def _pull(period, duration=500.0):
+    # coulomb count at 50 %, reported level 60 %, no current
+    estimator = BatteryRuntimeEstimator(3000, level_tau=500.0)
+    estimator.update(0.0, 50, 0.0)
+    steps = int(round(duration / period))
+    for step in range(1, steps + 1):
+        estimator.update(0.0, 60, step * period)
+    return estimator.charge
+
+
+def test_level_correction_does_not_depend_on_the_sampling_rate():
+    expected = 1800.0 - 300.0 * math.exp(-1.0)
+    assert _pull(1.0) == pytest.approx(expected)
+    assert _pull(0.1) == pytest.approx(expected)
+    assert _pull(5.0) == pytest.approx(expected)
+
+
+def test_gaps_and_backward_samples_are_not_corrected():
+    estimator = BatteryRuntimeEstimator(3000, max_gap=60.0)
+    estimator.update(0.0, 50, 0.0)
+    estimator.update(0.0, 60, 120.0)
+    assert estimator.charge == 1500.0
+    estimator.update(0.0, 60, 100.0)
+    assert estimator.charge == 1500.0
+    estimator.update(0.0, 60, 110.0)
+    assert estimator.charge > 1500.0
+
+
+def test_converges_on_a_known_trace():
+    capacity = 3000
+    samples = _constant_discharge(capacity)
+    end = samples[-1][0]
+    estimator = BatteryRuntimeEstimator(capacity)
+    errors = []
+    inside = 0
+    charge = float(capacity)
+    for timestamp, current, level in samples:
+        estimator.update(current, level, timestamp)
+        charge += current * 1000.0 / 3600.0
+        if timestamp < 600:
+            continue
+        # the coulomb count stays within the resolution of the reported level
+        assert abs(estimator.charge - charge) <= capacity / 100.0
+        estimate, low, high = estimator.runtime_to_empty()
+        actual = (end - timestamp) / 60.0
+        errors.append(abs(estimate - actual))
+        inside += low <= actual <= high
+
+    assert sum(errors) / len(errors) < 2.0
+    assert inside / len(errors) >= 0.9
+
+
+def test_level_and_runtime_before_and_while_charging():
+    estimator = BatteryRuntimeEstimator(3000)
+    assert estimator.runtime_to_empty() is None
+    estimator.update(0.5, 40, 0.0)
+    estimator.update(0.5, 40, 1.0)
+    assert estimator.level == pytest.approx(40.0, abs=0.1)
+    assert estimator.runtime_to_empty() == (math.inf, math.inf, math.inf)
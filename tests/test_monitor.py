@@ -0,0 +1,50 @@
+from power_api.monitor import PowerStateMonitor
+from power_api.definitions import Definition
+
+
+class _Api:
+    def __init__(self, mode, power=0.0):
+        self.mode = mode
+        self.power = power
+
+    def get_working_mode(self):
+        return self.mode
+
+    def get_input_power(self):
+        return self.power
+
+
+def _events(monitor):
+    events = []
+    monitor.add_callback(events.append)
+    return events
+
+
+def test_starting_on_battery_reports_adapter_lost():
+    monitor = PowerStateMonitor(_Api(Definition.BATTERY_POWERED))
+    events = _events(monitor)
+    monitor.poll(0.0)
+    assert events == []
+    monitor.poll(0.5)
+    assert [(e.type, e.previous_mode) for e in events] == [(Definition.EVENT_ADAPTER_LOST, None)]
+
+
+def test_initial_event_can_be_disabled():
+    monitor = PowerStateMonitor(_Api(Definition.BATTERY_POWERED), initial=False)
+    events = _events(monitor)
+    monitor.poll(0.0)
+    monitor.poll(0.5)
+    assert events == [] and monitor.mode == Definition.BATTERY_POWERED
+
+
+def test_starting_on_adapter_is_silent_until_the_adapter_is_lost():
+    api = _Api(Definition.ADAPTER_POWERED_AND_CHARGING)
+    monitor = PowerStateMonitor(api)
+    events = _events(monitor)
+    monitor.poll(0.0)
+    monitor.poll(0.5)
+    assert events == []
+    api.mode = Definition.BATTERY_POWERED
+    assert monitor.poll(1.0) == monitor.fast_interval
+    monitor.poll(1.05)
+    assert [(e.type, e.previous_mode) for e in events] == [(Definition.EVENT_ADAPTER_LOST, Definition.ADAPTER_POWERED_AND_CHARGING)]
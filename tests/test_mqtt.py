@@ -0,0 +1,78 @@
+import time
+
+from power_api.definitions import Definition
+from power_api.mqtt import MqttPublisher, MemoryTransport, DiskSpool, decode_batch, PRIORITY_EVENT
+
+FIELDS = ("battery_voltage", "battery_level", "working_mode")
+
+
+def snapshot(timestamp, voltage=4.0, level=80, mode=Definition.BATTERY_POWERED):
+    return {"timestamp": timestamp, "battery_voltage": voltage, "battery_level": level, "working_mode": mode}
+
+
+def publisher(transport, **kwargs):
+    return MqttPublisher(None, transport, fields=FIELDS, batch_interval=1000.0, **kwargs)
+
+
+def test_deadband_and_max_interval():
+    p = publisher(MemoryTransport(), max_interval=60.0)
+    assert p.sample(snapshot(0.0), now=0.0)
+    # inside the 0.01 V deadband
+    assert not p.sample(snapshot(0.1, voltage=4.005), now=0.1)
+    assert p.sample(snapshot(0.2, voltage=4.05), now=0.2)
+    # nothing changed, but max_interval passed
+    assert p.sample(snapshot(61.0, voltage=4.05), now=61.0)
+    assert p.status()["kept"] == 3
+
+
+def test_batches_round_trip():
+    transport = MemoryTransport()
+    p = publisher(transport, batch_size=3)
+    for i in range(6):
+        p.sample(snapshot(1000.0 + i, level=80 - i), now=float(i))
+
+    assert len(transport.messages) == 2
+    samples = [s for message in transport.messages for s in decode_batch(message[1])]
+    assert [s["battery_level"] for s in samples] == [80, 79, 78, 77, 76, 75]
+    assert [s["timestamp"] for s in samples] == [1000.0 + i for i in range(6)]
+
+
+def test_event_closes_batch():
+    transport = MemoryTransport()
+    p = publisher(transport, batch_size=50)
+    p.sample(snapshot(0.0), now=0.0)
+    p.sample(snapshot(1.0, mode=Definition.ADAPTER_POWERED_AND_CHARGING), now=1.0)
+    assert len(transport.messages) == 1
+    assert len(decode_batch(transport.messages[0][1])) == 2
+
+
+def test_offline_spool_drains_events_first(tmp_path):
+    transport = MemoryTransport()
+    transport.connected = False
+    spool = DiskSpool(str(tmp_path))
+    p = publisher(transport, batch_size=1, spool=spool)
+
+    p.sample(snapshot(0.0, level=80), now=0.0)
+    p.sample(snapshot(1.0, level=79, mode=Definition.ADAPTER_POWERED_AND_CHARGING), now=1.0)
+    assert p.status()["spooled"] == 2 and transport.messages == []
+    assert spool.peek()[0][0] == PRIORITY_EVENT
+
+    transport.connected = True
+    assert p.drain() == 2
+    levels = [decode_batch(message[1])[0]["battery_level"] for message in transport.messages]
+    assert levels == [79, 80]
+    assert len(spool) == 0
+
+
+def test_run_counts_overruns():
+    def slow_source():
+        time.sleep(0.03)
+        return snapshot(time.time())
+
+    p = MqttPublisher(slow_source, MemoryTransport(), fields=FIELDS, interval=0.01)
+    p.start()
+    time.sleep(0.3)
+    p.stop()
+    status = p.status()
+    assert status["samples"] > 0
+    assert status["overruns"] >= status["samples"] - 1
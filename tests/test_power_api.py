@@ -0,0 +1,100 @@
+import time
+import threading
+
+import pytest
+
+from power_api.power_api import SixfabPower, retry_set_command, COMMAND_SIZE_FOR_UINT8, PROTOCOL_HEADER_SIZE
+from power_api.command import Command
+from power_api.definitions import Definition
+from power_api.exceptions import invalid_argument
+from power_api.emulator import EmulatedBus
+
+
+def test_deadline_is_per_thread():
+    api = SixfabPower(bus=EmulatedBus())
+    api.command.deadline = time.monotonic() - 1.0
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append((api.command.deadline, api.get_battery_level())))
+    thread.start()
+    thread.join()
+    assert seen == [(None, 85)]
+    # the expired deadline still applies to this thread
+    assert api.get_battery_level() is None
+    api.command.deadline = None
+
+
+def test_shutdown_sequence_does_not_repeat_steps_without_bus_access():
+    api = SixfabPower(bus=EmulatedBus())
+    start = time.monotonic()
+    report = api.shutdown_sequence(deadline=2.0, steps=[("no_such_method", (), {}), ("set_fan_mode", (99,), {})])
+    assert time.monotonic() - start < 0.5
+    assert not report["ok"]
+    assert [step["attempts"] for step in report["steps"]] == [0, 0]
+    assert api.command.deadline is None
+
+
+def test_execute_batch_restores_the_callers_budget():
+    api = SixfabPower(bus=EmulatedBus())
+    results = api.execute_batch([("get_battery_level",)], retry_budget=3, deadline=1.0)
+    assert results[0]["ok"]
+    assert api.command.retry_budget is None and api.command.deadline is None
+
+
+def test_out_of_range_set_value_follows_strict_mode():
+    api = SixfabPower(bus=EmulatedBus())
+    command_num = Command.PROTOCOL_COMMAND_SET_FAN_MODE
+    raw = retry_set_command(command_num, COMMAND_SIZE_FOR_UINT8, 256, 1, command=api.command)
+    assert raw[PROTOCOL_HEADER_SIZE] == Definition.SET_FAILED
+    assert isinstance(api.command.last_error, invalid_argument)
+
+    api = SixfabPower(bus=EmulatedBus(), strict=True)
+    with pytest.raises(invalid_argument):
+        retry_set_command(command_num, COMMAND_SIZE_FOR_UINT8, -1, 1, command=api.command)
+
+
+def test_generated_operations_document_their_parameters():
+    from power_api.power_api import OPERATIONS
+
+    for name in OPERATIONS:
+        doc = getattr(SixfabPower, name).__doc__
+        assert "Parameters\n        -----------\n" in doc, name
+        assert "timeout : int (optional)" in doc, name
+
+
+def test_attempts_are_counted_per_thread():
+    api = SixfabPower(bus=EmulatedBus())
+    api.command.attempts = 0
+    thread = threading.Thread(target=api.get_battery_level)
+    thread.start()
+    thread.join()
+    assert api.command.attempts == 0
+    api.get_battery_level()
+    assert api.command.attempts == 1
+    api.command.attempts = None
+
+
+def test_shutdown_sequence_leaves_the_shared_hooks_alone():
+    api = SixfabPower(bus=EmulatedBus())
+    seen = []
+    api.add_hook(post=lambda command_num, raw, elapsed, tries: seen.append(api.command.post_hooks))
+    report = api.shutdown_sequence(deadline=2.0, steps=[("get_battery_level", (), {})])
+    assert report["ok"] and report["steps"][0]["attempts"] == 1
+    assert len(seen) == 1 and len(seen[0]) == 1
+    assert api.command.attempts is None
+
+
+def test_execute_batch_counts_only_its_own_attempts():
+    api = SixfabPower(bus=EmulatedBus())
+
+    def other_thread_traffic():
+        thread = threading.Thread(target=api.get_battery_level)
+        thread.start()
+        thread.join()
+        return 1
+
+    api.other_thread_traffic = other_thread_traffic
+    hooks = api.command.post_hooks
+    results = api.execute_batch([("other_thread_traffic",), ("get_battery_level",)])
+    assert [entry["attempts"] for entry in results] == [0, 1]
+    assert api.command.post_hooks is hooks
+    assert api.command.attempts is None
@@ -0,0 +1,212 @@
+import random
+
+import pytest
+
+from power_api.series import SeriesWriter, SeriesReader
+from power_api.exceptions import invalid_argument
+
+FIELDS = ("battery_voltage", "battery_current", "battery_level", "battery_temp", "extra")
+
+
+def _samples(count, seed=1, start=1760000000.0, jumps=0.01):
+    # 10 Hz with jitter, backward clock jumps, unread values and register
+    # values at register resolution as the getters return them
+    rng = random.Random(seed)
+    now = start
+    voltage, current = 4100, -800
+    samples = []
+    for _ in range(count):
+        if rng.random() < jumps:
+            now -= rng.uniform(0.0, 30.0)
+        else:
+            now += 0.1 + rng.uniform(-0.003, 0.003)
+        voltage += rng.choice((-1, 0, 0, 0, 1))
+        current += rng.randint(-20, 20)
+        sample = {
+            "timestamp": now,
+            "battery_voltage": voltage / 1000,
+            "battery_current": current / 1000,
+            "battery_level": rng.randint(0, 100),
+            "battery_temp": rng.randint(2000, 4500) / 100,
+            "extra": rng.uniform(-1e6, 1e6),
+        }
+        for name in FIELDS:
+            if rng.random() < 0.02:
+                sample[name] = None
+        samples.append(sample)
+    return samples
+
+
+def _expected(samples, name):
+    if name == "timestamp":
+        return [round(s["timestamp"] * 1000) / 1000.0 for s in samples]
+    return [s[name] for s in samples]
+
+
+def _write(path, samples, block_size=512):
+    with SeriesWriter(path, FIELDS, block_size) as writer:
+        for sample in samples:
+            writer.write(sample)
+    return writer
+
+
+def test_round_trip_with_backward_clock_jumps(tmp_path):
+    path = str(tmp_path / "trace.series")
+    samples = _samples(5000)
+    writer = _write(path, samples)
+    assert writer.samples == 5000
+
+    with SeriesReader(path) as reader:
+        assert reader.fields == FIELDS
+        assert reader.samples == 5000
+        decoded = reader.read()
+        for name in ("timestamp",) + FIELDS:
+            mismatches = sum(a != b for a, b in zip(decoded[name], _expected(samples, name)))
+            assert (len(decoded[name]), mismatches) == (5000, 0), name
+
+
+def test_blocks_are_ordered_and_time_ranges_decode_only_their_samples(tmp_path):
+    path = str(tmp_path / "trace.series")
+    samples = _samples(3000, seed=2)
+    _write(path, samples)
+    rng = random.Random(5)
+
+    with SeriesReader(path) as reader:
+        for number, first, last, count in reader.index:
+            block = reader.read_block(number, ["battery_level"])
+            assert block["timestamp"] == sorted(block["timestamp"])
+            assert (block["timestamp"][0], block["timestamp"][-1], len(block["battery_level"])) == (first, last, count)
+
+        timestamps = _expected(samples, "timestamp")
+        levels = _expected(samples, "battery_level")
+        for _ in range(20):
+            start, end = sorted(rng.uniform(min(timestamps), max(timestamps)) for _ in range(2))
+            columns = reader.read(["battery_level"], start=start, end=end)
+            expected = [(t, v) for t, v in zip(timestamps, levels) if start <= t < end]
+            # blocks are in write order, a clock jump does not reorder samples
+            assert list(zip(columns["timestamp"], columns["battery_level"])) == expected
+            assert set(columns) == {"timestamp", "battery_level"}
+
+
+def test_reopened_file_is_continued(tmp_path):
+    path = str(tmp_path / "trace.series")
+    samples = _samples(1500, seed=3)
+    _write(path, samples[:700])
+    _write(path, samples[700:])
+
+    with SeriesReader(path) as reader:
+        decoded = reader.read()
+    for name in ("timestamp",) + FIELDS:
+        assert decoded[name] == _expected(samples, name), name
+
+    with pytest.raises(invalid_argument):
+        SeriesWriter(path, FIELDS[:2], 512)
+    with pytest.raises(invalid_argument):
+        SeriesWriter(path, FIELDS, 1024)
+
+
+def test_flushed_samples_are_readable_before_close(tmp_path):
+    path = str(tmp_path / "trace.series")
+    samples = _samples(50, seed=4)
+    writer = SeriesWriter(path, FIELDS, 4096)
+    try:
+        for sample in samples[:30]:
+            writer.write(sample)
+        writer.flush()
+        with SeriesReader(path) as reader:
+            assert reader.read(["extra"])["extra"] == _expected(samples[:30], "extra")
+
+            for sample in samples[30:]:
+                writer.write(sample)
+            writer.flush()
+            reader.refresh()
+            assert reader.samples == 50
+    finally:
+        writer.close()
+
+
+def test_corrupted_block_is_detected(tmp_path):
+    path = str(tmp_path / "trace.series")
+    _write(path, _samples(100, seed=6))
+    with open(path, "r+b") as f:
+        f.seek(512 + 40)
+        byte = f.read(1)
+        f.seek(512 + 40)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    with SeriesReader(path) as reader:
+        with pytest.raises(ValueError):
+            reader.read_block(1)
+
+
+def test_unknown_column_and_small_block_size_are_rejected(tmp_path):
+    path = str(tmp_path / "trace.series")
+    _write(path, _samples(10))
+    with SeriesReader(path) as reader:
+        with pytest.raises(invalid_argument):
+            reader.read(["no_such_field"])
+    with pytest.raises(invalid_argument):
+        SeriesWriter(str(tmp_path / "other.series"), FIELDS, 1000)
+
+
+def _damage(path, block, block_size, length=40):
+    with open(path, "r+b") as f:
+        f.seek(block * block_size + 64)
+        data = f.read(length)
+        f.seek(block * block_size + 64)
+        f.write(bytes(b ^ 0xFF for b in data))
+
+
+def test_read_skips_and_reports_corrupt_blocks(tmp_path):
+    path = str(tmp_path / "trace.series")
+    samples = _samples(2000, seed=7)
+    _write(path, samples)
+
+    with SeriesReader(path) as reader:
+        last = reader.index[-1]
+        _damage(path, last[0], 512)
+        decoded = reader.read()
+        assert reader.corrupt == [last[0]]
+        assert len(decoded["timestamp"]) == 2000 - last[3]
+        assert decoded["extra"] == _expected(samples[: 2000 - last[3]], "extra")
+        with pytest.raises(ValueError):
+            reader.read_block(last[0])
+
+
+def test_flushed_versions_are_not_duplicated(tmp_path):
+    path = str(tmp_path / "trace.series")
+    samples = _samples(60, seed=8, jumps=0)
+    writer = SeriesWriter(path, FIELDS, 4096)
+    for index, sample in enumerate(samples):
+        writer.write(sample)
+        if index % 20 == 19:
+            writer.flush()
+    writer.close()
+
+    with SeriesReader(path) as reader:
+        assert len(reader.index) == 1
+        assert reader.read()["extra"] == _expected(samples, "extra")
+        assert reader.corrupt == []
+
+
+def test_torn_flush_keeps_the_previous_version(tmp_path):
+    path = str(tmp_path / "trace.series")
+    samples = _samples(50, seed=9, jumps=0)
+    writer = SeriesWriter(path, FIELDS, 4096)
+    for sample in samples[:30]:
+        writer.write(sample)
+    writer.flush()
+    for sample in samples[30:]:
+        writer.write(sample)
+    writer.flush()
+    # a power cut while the second version was written
+    _damage(path, 2, 4096)
+
+    with SeriesReader(path) as reader:
+        assert reader.read()["extra"] == _expected(samples[:30], "extra")
+        assert reader.corrupt == []
+
+    # closing writes the complete block over the older version
+    writer.close()
+    with SeriesReader(path) as reader:
+        assert reader.read()["extra"] == _expected(samples, "extra")
@@ -0,0 +1,35 @@
+from power_api.shm import TelemetryPublisher, TelemetryReader, SEQUENCE, SEQUENCE_OFFSET
+
+
+def test_reader_survives_a_publisher_restart(tmp_path):
+    path = str(tmp_path / "segment")
+    publisher = TelemetryPublisher(None, path)
+    publisher.publish({"timestamp": 1.0, "battery_level": 50})
+    publisher.close()
+
+    with TelemetryReader(path) as reader:
+        assert reader.read().battery_level == 50
+
+        publisher = TelemetryPublisher(None, path)
+        publisher.publish({"timestamp": 2.0, "battery_level": 9})
+        snapshot = reader.read()
+        publisher.close()
+    assert (snapshot.battery_level, snapshot.sequence) == (9, 4)
+    assert snapshot.get("input_voltage") is None
+
+
+def test_record_left_half_written_is_dropped(tmp_path):
+    path = str(tmp_path / "segment")
+    publisher = TelemetryPublisher(None, path)
+    publisher.publish({"timestamp": 1.0, "battery_level": 50})
+    # a publisher killed between the two sequence writes
+    publisher._map[SEQUENCE_OFFSET : SEQUENCE_OFFSET + SEQUENCE.size] = SEQUENCE.pack(3)
+    publisher.close()
+
+    publisher = TelemetryPublisher(None, path)
+    with TelemetryReader(path) as reader:
+        snapshot = reader.read()
+        assert snapshot.sequence == 4 and snapshot.valid == 0
+        publisher.publish({"timestamp": 2.0, "battery_level": 9})
+        assert reader.read().sequence == 6
+    publisher.close()
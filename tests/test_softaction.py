@@ -0,0 +1,53 @@
+from power_api.power_api import SixfabPower
+from power_api.command import Command
+from power_api.definitions import Definition
+from power_api.emulator import EmulatedBus
+from power_api.softaction import SoftActionAgent
+
+
+class _Api:
+    # answers is_any_soft_action_exist() from a list
+    def __init__(self, answers):
+        self.answers = list(answers)
+
+    def is_any_soft_action_exist(self):
+        return self.answers.pop(0)
+
+
+def test_executes_after_confirmation():
+    bus = EmulatedBus()
+    bus.registers[Command.PROTOCOL_COMMAND_IS_ANY_SOFT_ACTION_EXIST] = bytes([Definition.ACTION_SOFT_SHUTDOWN])
+    executed = []
+    agent = SoftActionAgent(SixfabPower(bus=bus), executor=executed.append)
+
+    assert agent.poll() is None
+    assert executed == [Definition.ACTION_SOFT_SHUTDOWN]
+    assert agent.acknowledged
+
+
+def test_waits_for_confirmation():
+    executed = []
+    api = _Api([Definition.ACTION_SOFT_REBOOT, None, Definition.ACTION_SOFT_REBOOT, Definition.NO_SOFT_ACTION])
+    agent = SoftActionAgent(api, fast_interval=1.0, executor=executed.append)
+
+    # read failed, then reported again: nothing is executed yet
+    assert agent.poll(0.0) == 1.0
+    assert agent.poll(1.0) == 1.0
+    assert executed == [] and not agent.acknowledged
+
+    assert agent.poll(2.0) is None
+    assert executed == [Definition.ACTION_SOFT_REBOOT]
+
+
+def test_executes_unconfirmed_after_confirm_timeout():
+    executed = []
+    api = _Api([Definition.ACTION_SOFT_SHUTDOWN] + [None] * 10)
+    agent = SoftActionAgent(api, fast_interval=1.0, executor=executed.append, confirm_timeout=5.0)
+
+    now = 100.0
+    while agent.poll(now) is not None:
+        assert executed == []
+        now += 1.0
+    assert now == 105.0
+    assert executed == [Definition.ACTION_SOFT_SHUTDOWN]
+    assert agent.acknowledged is False